@@ -6,12 +6,12 @@ from django.urls import NoReverseMatch, reverse
 from django.utils.translation import gettext as _
 
 from . import moderation
+from .conf.settings import BULK_BATCH_SIZE
 from .constants import (
     MODERATION_STATUS_APPROVED,
     MODERATION_STATUS_PENDING,
     MODERATION_STATUS_REJECTED,
 )
-from .diff import get_changes_between_models
 from .filterspecs import RegisteredContentTypeListFilter
 from .forms import BaseModeratedObjectForm
 from .helpers import automoderate
@@ -21,16 +21,14 @@ available_filters = (('content_type', RegisteredContentTypeListFilter), 'status'
 
 
 def approve_objects(modeladmin, request, queryset):
-    for obj in queryset:
-        obj.approve(by=request.user)
+    queryset.approve(by=request.user, batch_size=modeladmin.bulk_batch_size)
 
 
 approve_objects.short_description = _("Approve selected moderated objects")
 
 
 def reject_objects(modeladmin, request, queryset):
-    for obj in queryset:
-        obj.reject(by=request.user)
+    queryset.reject(by=request.user, batch_size=modeladmin.bulk_batch_size)
 
 
 reject_objects.short_description = _("Reject selected moderated objects")
@@ -129,6 +127,8 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
     change_form_template = 'moderation/moderate_object.html'
     change_list_template = 'moderation/moderated_objects_list.html'
     actions = [reject_objects, approve_objects, set_objects_as_pending]
+    # Moderated objects moderated per transaction by the actions
+    bulk_batch_size = BULK_BATCH_SIZE
     fieldsets = (('Object moderation', {'fields': ('reason',)}),)
 
     def get_actions(self, request):
@@ -166,10 +166,9 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
             new_object = changed_obj
 
         changes = list(
-            get_changes_between_models(
+            moderator.field_plan.get_changes(
                 old_object,
                 new_object,
-                moderator.fields_exclude,
                 resolve_foreignkeys=moderator.resolve_foreignkeys,
             ).values()
         )
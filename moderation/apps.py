@@ -7,6 +7,15 @@ class SimpleModerationConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     default = False
 
+    def ready(self):
+        from django.core import checks
+
+        from .checks import check_visibility_columns
+        from .groups import connect_signals
+
+        connect_signals()
+        checks.register(check_visibility_columns, checks.Tags.models)
+
 
 class ModerationConfig(SimpleModerationConfig):
     default = True
@@ -14,4 +23,6 @@ class ModerationConfig(SimpleModerationConfig):
     def ready(self):
         from django.utils.module_loading import autodiscover_modules
 
+        super().ready()
+
         autodiscover_modules("moderator")
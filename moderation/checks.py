@@ -0,0 +1,47 @@
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from .constants import MODERATION_VISIBILITY_COLUMN
+
+
+def check_visibility_columns(app_configs=None, **kwargs):
+    '''Checks that models registered with auto_visibility_column declare
+    the moderation_visible BooleanField.
+    '''
+    from . import moderation
+
+    errors = []
+    for model_class, moderator in moderation._registered_models.items():
+        if not moderator.auto_visibility_column:
+            continue
+        if app_configs is not None and model_class._meta.app_config not in app_configs:
+            continue
+
+        try:
+            field = model_class._meta.get_field(MODERATION_VISIBILITY_COLUMN)
+        except FieldDoesNotExist:
+            errors.append(
+                checks.Error(
+                    "%s is registered with auto_visibility_column but has no "
+                    "'%s' field."
+                    % (model_class._meta.label, MODERATION_VISIBILITY_COLUMN),
+                    hint="Add %s = models.BooleanField(default=False, "
+                    "db_index=True, editable=False) to the model and run "
+                    "makemigrations." % MODERATION_VISIBILITY_COLUMN,
+                    obj=model_class,
+                    id='moderation.E001',
+                )
+            )
+            continue
+
+        if not isinstance(field, models.BooleanField):
+            errors.append(
+                checks.Error(
+                    "'%s' of %s should be a BooleanField."
+                    % (MODERATION_VISIBILITY_COLUMN, model_class._meta.label),
+                    obj=model_class,
+                    id='moderation.E002',
+                )
+            )
+    return errors
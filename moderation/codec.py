@@ -0,0 +1,152 @@
+import datetime
+import json
+
+from django.apps import apps
+from django.db.models import Model, fields
+
+# Values of these types are stored as they are, everything else goes through
+# Field.value_to_string()
+JSON_TYPES = frozenset([type(None), bool, int, float, str])
+
+# to_python() implementations that return values of the given type unchanged,
+# decoding can skip the call for such values.
+NATIVE_TYPES = {
+    fields.CharField.to_python: str,
+    fields.TextField.to_python: str,
+    fields.IntegerField.to_python: int,
+    fields.BooleanField.to_python: bool,
+    fields.FloatField.to_python: float,
+}
+
+MISSING = object()
+
+_codecs = {}
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _value_encoder(field):
+    '''Returns function converting a value of field into its JSON form, or
+    None when Field.value_to_string() has to be used.
+    '''
+    if isinstance(field, (fields.DateField, fields.TimeField)):
+        # DateTimeField is a subclass of DateField
+        return _isoformat
+    if isinstance(field, (fields.DecimalField, fields.UUIDField)):
+        return str
+    return None
+
+
+def _native_type(field):
+    target_field = getattr(field, 'target_field', None)
+    if target_field is not None and field.is_relation:
+        # Foreign keys are stored as the raw value of the related field
+        field = target_field
+    return NATIVE_TYPES.get(type(field).to_python)
+
+
+class SnapshotCodec:
+    '''Encodes model instances into snapshots and back.
+
+    A codec is compiled once per model class. It keeps an ordered plan of the
+    model's concrete fields (including the fields of multi-table inheritance
+    parents) with their ``to_python`` converters, so encoding and decoding
+    is a single pass over the plan. Foreign keys are stored as raw ids and
+    decoding never queries the database.
+
+    Snapshot format::
+
+        {"model": "app_label.model_name", "pk": 1, "fields": {"name": value}}
+    '''
+
+    def __init__(self, model_class):
+        opts = model_class._meta
+        self.model_class = model_class
+        self.label = opts.label_lower
+        self.pk_field = opts.pk
+        self.fields = tuple(opts.concrete_fields)
+        self.encode_plan = tuple(
+            (field.name, field.attname, field, _value_encoder(field))
+            for field in self.fields
+            if field is not opts.pk
+        )
+        self.decode_plan = tuple(
+            (field.name, field.to_python, _native_type(field), field.get_default)
+            for field in self.fields
+        )
+
+    def encode(self, obj):
+        '''Returns snapshot of obj as a dict of JSON compatible values'''
+        data = {}
+        loaded = obj.__dict__
+        for name, attname, field, encoder in self.encode_plan:
+            value = loaded.get(attname, MISSING)
+            if value is MISSING:
+                # Deferred field
+                value = getattr(obj, attname)
+            if type(value) not in JSON_TYPES:
+                if encoder is None:
+                    value = field.value_to_string(obj)
+                else:
+                    value = encoder(value)
+            data[name] = value
+
+        pk = obj.pk
+        if type(pk) not in JSON_TYPES:
+            pk = self.pk_field.value_to_string(obj)
+
+        return {'model': self.label, 'pk': pk, 'fields': data}
+
+    def decode(self, snapshot):
+        '''Returns model instance built from a snapshot made by encode()'''
+        data = dict(snapshot['fields'])
+        data[self.pk_field.name] = snapshot['pk']
+        values = []
+        append = values.append
+        for name, to_python, native_type, get_default in self.decode_plan:
+            value = data.get(name, MISSING)
+            if value is MISSING:
+                # Field added to the model after the snapshot was taken
+                append(get_default())
+            elif type(value) is native_type:
+                append(value)
+            else:
+                append(to_python(value))
+
+        return self.model_class(*values)
+
+    def dumps(self, obj):
+        return json.dumps(self.encode(obj))
+
+
+def to_json_value(value):
+    '''Returns value in the form it is stored in snapshots'''
+    if type(value) in JSON_TYPES:
+        return value
+    if isinstance(value, Model):
+        return to_json_value(value.pk)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def get_codec(model_class):
+    '''Returns SnapshotCodec for model class, compiling it on first use'''
+    try:
+        return _codecs[model_class]
+    except KeyError:
+        codec = _codecs[model_class] = SnapshotCodec(model_class)
+        return codec
+
+
+def from_snapshot(snapshot):
+    '''Returns model instance from snapshot dict'''
+    model_class = apps.get_model(snapshot['model'])
+    return get_codec(model_class).decode(snapshot)
+
+
+def loads(value):
+    '''Returns model instance from serialized snapshot string'''
+    return from_snapshot(json.loads(value))
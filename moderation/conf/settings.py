@@ -1,3 +1,22 @@
 from django.conf import settings
 
 MODERATORS = getattr(settings, 'MODERATION_MODERATORS', ())
+
+# Where ModeratedObject stores snapshots of changed objects, 'text' or 'json'
+SNAPSHOT_STORAGE = getattr(settings, 'MODERATION_SNAPSHOT_STORAGE', 'text')
+
+# Compressor for snapshots stored by ModeratedObject, ex. 'zlib', None
+# disables compression
+SNAPSHOT_COMPRESSION = getattr(settings, 'MODERATION_SNAPSHOT_COMPRESSION', None)
+
+# Moderated objects moderated per transaction by the bulk approve() and
+# reject() of ModeratedObjectQuerySet, used by the admin actions
+BULK_BATCH_SIZE = getattr(settings, 'MODERATION_BULK_BATCH_SIZE', 500)
+
+# Seconds a moderated object claimed with ModeratedObjectQuerySet.claim()
+# stays reserved for the moderator who claimed it
+CLAIM_LEASE_SECONDS = getattr(settings, 'MODERATION_CLAIM_LEASE_SECONDS', 600)
+
+# Seconds the group ids of users checked by auto moderation, and of group
+# names, stay cached
+GROUP_CACHE_TIMEOUT = getattr(settings, 'MODERATION_GROUP_CACHE_TIMEOUT', 300)
@@ -4,3 +4,6 @@ MODERATION_DRAFT_STATE = 1
 MODERATION_STATUS_REJECTED = 0
 MODERATION_STATUS_APPROVED = 1
 MODERATION_STATUS_PENDING = 2
+
+# Column declared by models registered with auto_visibility_column = True
+MODERATION_VISIBILITY_COLUMN = 'moderation_visible'
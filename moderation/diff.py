@@ -4,6 +4,7 @@ import difflib
 import re
 import sys
 
+from django.core.exceptions import ValidationError
 from django.db.models import fields
 from django.db.models.fields.related import ForeignObject
 from django.utils.html import escape
@@ -74,11 +75,8 @@ def get_changes_between_models(
 ):
     changes = {}
 
-    if excludes is None:
-        excludes = []
-
-    if includes is None:
-        includes = []
+    excludes = frozenset(excludes or ())
+    includes = frozenset(includes or ())
 
     for field in model1._meta.fields:
         if includes and field.name not in includes:
@@ -95,6 +93,82 @@ def get_changes_between_models(
     return changes
 
 
+def _values_differ(field, value1, value2):
+    """Tells if two raw values of field differ. Values that are not equal,
+    ex. '1' assigned to an IntegerField and 1, are compared again after
+    converting them to the python type of field.
+    """
+    if value1 == value2:
+        return False
+
+    try:
+        return field.to_python(value1) != field.to_python(value2)
+    except (TypeError, ValueError, ValidationError):
+        return True
+
+
+class FieldPlan(object):
+    """Fields of a model class compared by moderation, split into moderated
+    and excluded fields.
+
+    A plan is compiled once per moderator, so saves and diffs don't have to
+    look up fields and excludes again.
+    """
+
+    def __init__(self, model_class, excludes=()):
+        self.model_class = model_class
+        self.excludes = frozenset(excludes)
+
+        compared = [
+            field
+            for field in model_class._meta.fields
+            if not isinstance(field, fields.AutoField)
+        ]
+        self.moderated_fields = tuple(
+            field for field in compared if field.name not in self.excludes
+        )
+        self.excluded_fields = tuple(
+            field for field in compared if field.name in self.excludes
+        )
+        self.moderated_names = frozenset(field.name for field in self.moderated_fields)
+        self.excluded_attnames = tuple(field.attname for field in self.excluded_fields)
+
+        # Compared by has_changes() as raw attname values
+        self._moderated_checks = tuple(
+            (field.attname, field) for field in self.moderated_fields
+        )
+        self._excluded_checks = tuple(
+            (field.attname, field) for field in self.excluded_fields
+        )
+
+    def has_changes(self, model1, model2, only_excluded=False):
+        """Returns True if any moderated field, or any excluded field when
+        only_excluded is set, differs between model1 and model2.
+        """
+        if only_excluded:
+            checks = self._excluded_checks
+        else:
+            checks = self._moderated_checks
+
+        for attname, field in checks:
+            if _values_differ(
+                field, getattr(model1, attname), getattr(model2, attname)
+            ):
+                return True
+
+        return False
+
+    def get_changes(self, model1, model2, resolve_foreignkeys=False):
+        """Returns changes of moderated fields, like get_changes_between_models()"""
+        prefix = model1.__class__.__name__.lower()
+        return {
+            "{}__{}".format(prefix, field.name): get_change(
+                model1, model2, field, resolve_foreignkeys
+            )
+            for field in self.moderated_fields
+        }
+
+
 def get_diff_operations(a, b):
     operations = []
     a_words = re.split(r'(\W+)', a)
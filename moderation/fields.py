@@ -1,7 +1,63 @@
+import copy
+import json
+from importlib import import_module
+
 from django.conf import settings
 from django.core import serializers
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.db import models
+from django.utils.module_loading import import_string
+
+from . import codec
+from .codec import MISSING, get_codec
+
+# Compressors that stored snapshots can name, besides the configured one
+COMPRESSORS = ('zlib', 'bz2', 'lzma')
+
+
+def get_compressor(name):
+    '''Returns compressor imported from name, an object with compress() and
+    decompress() functions on bytes, ex. the zlib, bz2 or lzma modules.
+    '''
+    try:
+        return import_module(name)
+    except ImportError:
+        return import_string(name)
+
+
+class SerializedObjectDescriptor:
+    '''Descriptor used by ``SerializedObjectField(lazy=True)``
+
+    Keeps the raw serialized value loaded from the database in the instance
+    ``__dict__`` and deserializes it only on first access. The deserialized
+    object replaces the raw value, so later accesses are served from the
+    instance.
+    '''
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        data = instance.__dict__
+        attname = self.field.attname
+        if attname not in data:
+            # Deferred field, load it the same way Django's DeferredAttribute
+            # would.
+            instance.refresh_from_db(fields=[attname])
+
+        value = data[attname]
+        if isinstance(value, str):
+            value = self.field.load(instance, value)
+            data[attname] = value
+            # Kept to tell if the object changed since, see has_changed()
+            data[self.field.loaded_name] = copy.copy(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
 
 
 class SerializedObjectField(models.TextField):
@@ -27,16 +83,262 @@ class SerializedObjectField(models.TextField):
     >>> a.object.__dict__
     {'field': 'test', 'id': 1}
 
+    With ``lazy=True`` the raw value is kept on the instance and only
+    deserialized when the attribute is first accessed, instead of on every
+    ``post_init``.
+
+    With ``storage='json'`` snapshots are stored in the ``JSONField`` of the
+    same model named by ``json_field`` instead of in this field's text
+    column, so the database can query them. The ``JSONField`` has to be
+    declared after this field.
+
+    With ``compress='zlib'`` (or any importable compressor, see
+    get_compressor()) snapshots are compressed and stored in the
+    ``BinaryField`` named by ``binary_field``, which has to be declared after
+    this field too. ``compress=True`` stands for zlib.
+
+    Snapshots are read from whichever column holds them, so rows written with
+    another storage or compressor stay readable. Compressed rows can only
+    name the configured compressor or one of COMPRESSORS.
+
+    ``base_field`` names a ``ForeignKey`` of the model to itself. When it is
+    set with set_delta_base(), the text and compressed storages keep only the
+    fields that differ from the object stored in the base row, and the full
+    object is rebuilt from the chain of bases on access. Chains are cut after
+    ``max_delta_depth`` deltas by storing a full snapshot.
+
+    ``fallback`` names a method of the model returning the object of rows
+    storing no snapshot at all, which are None otherwise.
     '''
 
-    def __init__(self, serialize_format='json', *args, **kwargs):
+    def __init__(
+        self,
+        serialize_format='json',
+        lazy=False,
+        storage='text',
+        json_field=None,
+        compress=None,
+        binary_field=None,
+        base_field=None,
+        max_delta_depth=10,
+        fallback=None,
+        *args,
+        **kwargs,
+    ):
+        if compress is True:
+            compress = 'zlib'
+        if storage not in ('text', 'json'):
+            raise ImproperlyConfigured(
+                "Unknown snapshot storage '%s', use 'text' or 'json'" % storage
+            )
+        if storage == 'json' and (serialize_format != 'json' or not json_field):
+            raise ImproperlyConfigured(
+                "Snapshot storage 'json' requires serialize_format='json' "
+                "and a json_field"
+            )
+        if compress and (storage != 'text' or not binary_field):
+            raise ImproperlyConfigured(
+                "Snapshot compression requires storage='text' and a binary_field"
+            )
         self.serialize_format = serialize_format
+        self.lazy = lazy
+        self.fallback = fallback
+        self.storage = storage
+        self.json_field = json_field
+        self.compress = compress
+        self.binary_field = binary_field
+        self.base_field = base_field
+        self.max_delta_depth = max_delta_depth
         super().__init__(*args, **kwargs)
 
-    def _serialize(self, value):
+    @property
+    def storage_column(self):
+        '''Returns attname of the column snapshots are written to'''
+        if self.compress:
+            return self.binary_field
+        if self.storage == 'json':
+            return self.json_field
+        return self.attname
+
+    @property
+    def storage_columns(self):
+        '''Returns attnames of all columns snapshots can be read from'''
+        return [
+            column
+            for column in (self.attname, self.json_field, self.binary_field)
+            if column
+        ]
+
+    def _encode(self, value):
+        if not value:
+            return None
+
+        return get_codec(value.__class__).encode(value)
+
+    def _decode(self, snapshot, instance=None):
+        if 'base' in snapshot:
+            # Delta snapshot, the fields it doesn't hold come from the base
+            if instance is not None:
+                instance.__dict__[self.delta_depth_name] = snapshot['depth']
+                # Written by earlier versions without the bases of the chain
+                instance.__dict__[self.delta_bases_name] = snapshot.get(
+                    'bases', [snapshot['base']]
+                )
+            base_snapshot = self._get_base_snapshot(instance)
+            if base_snapshot is not None:
+                fields = dict(base_snapshot['fields'], **snapshot['fields'])
+                snapshot = dict(snapshot, fields=fields)
+
+        return codec.from_snapshot(snapshot)
+
+    @property
+    def loaded_name(self):
+        return '_%s_loaded' % self.attname
+
+    def has_changed(self, instance):
+        '''Returns True if the object held by instance was replaced or changed
+        since it was loaded from the database.
+        '''
+        data = instance.__dict__
+        value = data.get(self.attname)
+        if isinstance(value, str):
+            # Never deserialized
+            return False
+
+        loaded = data.get(self.loaded_name, MISSING)
+        if loaded is MISSING:
+            return True
+        if value is None or loaded is None or value.__class__ is not loaded.__class__:
+            return value is not loaded
+        value_codec = get_codec(value.__class__)
+        return value_codec.encode(value) != value_codec.encode(loaded)
+
+    @property
+    def delta_depth_name(self):
+        return '_%s_delta_depth' % self.attname
+
+    @property
+    def delta_bases_name(self):
+        return '_%s_delta_bases' % self.attname
+
+    def _load_bases(self, instance):
+        '''Reads the chain of base rows of instance with one query, each row
+        caching its base, so rebuilding the snapshot of instance doesn't
+        query the database once per delta.
+        '''
+        bases = instance.__dict__.get(self.delta_bases_name, [])
+        if len(bases) < 2:
+            # A single base is read by the foreign key as cheaply
+            return
+
+        base_field = instance._meta.get_field(self.base_field)
+        rows = base_field.related_model._base_manager.using(instance._state.db).in_bulk(
+            bases
+        )
+        # Rows materialized since the delta was written, or deleted, end the
+        # chain early
+        for row in list(rows.values()) + [instance]:
+            base = rows.get(getattr(row, base_field.attname))
+            if base is not None:
+                base_field.set_cached_value(row, base)
+
+    def _get_base_snapshot(self, instance):
+        '''Returns full snapshot of the object stored in the base row of
+        instance, or None.
+        '''
+        if instance is None or not self.base_field:
+            return None
+
+        base_field = instance._meta.get_field(self.base_field)
+        if not base_field.is_cached(instance):
+            self._load_bases(instance)
+        base = getattr(instance, self.base_field)
+        obj = getattr(base, self.attname) if base is not None else None
+        if not obj:
+            return None
+        return get_codec(obj.__class__).encode(obj)
+
+    def _delta(self, snapshot, instance):
+        '''Returns snapshot reduced to the fields that differ from the base
+        row of instance, or snapshot unchanged when there is no base.
+        '''
+        base_snapshot = self._get_base_snapshot(instance)
+        if base_snapshot is None or base_snapshot['model'] != snapshot['model']:
+            return snapshot
+
+        base_fields = base_snapshot['fields']
+        base = getattr(instance, self.base_field)
+        snapshot['fields'] = {
+            name: value
+            for name, value in snapshot['fields'].items()
+            if base_fields.get(name, MISSING) != value
+        }
+        snapshot['base'] = base.pk
+        snapshot['depth'] = base.__dict__.get(self.delta_depth_name, 0) + 1
+        # Lets readers load the whole chain at once, see _load_bases()
+        snapshot['bases'] = [base.pk] + base.__dict__.get(self.delta_bases_name, [])
+        return snapshot
+
+    def set_delta_base(self, instance, base):
+        '''Makes instance store its snapshot as a delta against the object
+        stored in base, a saved instance of the same model. Does nothing when
+        deltas aren't supported by the configured storage or the chain of
+        deltas would get longer than max_delta_depth.
+        '''
+        if (
+            not self.base_field
+            or self.storage == 'json'
+            or self.serialize_format != 'json'
+        ):
+            # Queries on the 'json' storage need all fields in every row
+            return
+
+        if getattr(base, self.attname) is None:
+            return
+        if base.__dict__.get(self.delta_depth_name, 0) >= self.max_delta_depth:
+            return
+
+        setattr(instance, self.base_field, base)
+
+    def _compress(self, value):
+        if not value:
+            return None
+
+        compressor = get_compressor(self.compress)
+        return b'%s:%s' % (
+            self.compress.encode('ascii'),
+            compressor.compress(value.encode(settings.DEFAULT_CHARSET)),
+        )
+
+    def _decompress(self, data):
+        # The compressor name is stored in front of the compressed data
+        name, _, data = bytes(data).partition(b':')
+        name = name.decode('ascii', 'replace')
+        # Never import a module named by the stored data
+        if name not in COMPRESSORS and name != self.compress:
+            raise ValueError("Unknown snapshot compressor '%s'" % name)
+        compressor = get_compressor(name)
+        return compressor.decompress(data).decode(settings.DEFAULT_CHARSET)
+
+    def _serialize(self, value, instance=None):
         if not value:
             return ''
 
+        if self.serialize_format == 'json':
+            snapshot = get_codec(value.__class__).encode(value)
+            return json.dumps(self._delta(snapshot, instance))
+
+        return self._serialize_with_serializers(value)
+
+    def _deserialize(self, value, instance=None):
+        if self.serialize_format == 'json' and value.startswith('{'):
+            return self._decode(json.loads(value), instance)
+
+        # Snapshots written by django.core.serializers, still used for
+        # formats other than json and for rows stored by earlier versions.
+        return self._deserialize_with_serializers(value)
+
+    def _serialize_with_serializers(self, value):
         value_set = [value]
         if value._meta.parents:
             value_set += [
@@ -47,7 +349,7 @@ class SerializedObjectField(models.TextField):
 
         return serializers.serialize(self.serialize_format, value_set)
 
-    def _deserialize(self, value):
+    def _deserialize_with_serializers(self, value):
         obj_generator = serializers.deserialize(
             self.serialize_format,
             value.encode(settings.DEFAULT_CHARSET),
@@ -71,26 +373,97 @@ class SerializedObjectField(models.TextField):
     def db_type(self, connection=None):
         return 'text'
 
+    def load(self, instance, value):
+        '''Returns object deserialized from the raw value of this field or,
+        when it is empty, from the snapshot in json_field or binary_field, or
+        from fallback.
+        '''
+        if value:
+            return self._deserialize(value, instance)
+
+        if self.json_field:
+            snapshot = getattr(instance, self.json_field)
+            if snapshot:
+                return self._decode(snapshot, instance)
+
+        if self.binary_field:
+            data = getattr(instance, self.binary_field)
+            if data:
+                return self._deserialize(self._decompress(data), instance)
+
+        if self.fallback:
+            return getattr(instance, self.fallback)()
+        return None
+
+    def has_snapshot(self, instance):
+        '''Returns whether the row of instance stores a snapshot or an object
+        was assigned to it. Rows without one count as storing the object read
+        from fallback once the field was accessed.
+        '''
+        value = instance.__dict__.get(self.attname)
+        if not isinstance(value, str):
+            return value is not None
+        return bool(
+            value
+            or (self.json_field and getattr(instance, self.json_field))
+            or (self.binary_field and getattr(instance, self.binary_field))
+        )
+
+    def get_storage_values(self, value, instance=None):
+        '''Returns dict of values storing value with the configured storage,
+        keyed by attnames of storage_columns. Snapshots are stored as deltas
+        when instance has a base row.
+        '''
+        values = dict.fromkeys(self.storage_columns)
+        values[self.attname] = ''
+
+        if self.compress:
+            values[self.binary_field] = self._compress(self._serialize(value, instance))
+        elif self.storage == 'json':
+            values[self.json_field] = self._encode(value)
+        else:
+            values[self.attname] = self._serialize(value, instance)
+
+        return values
+
     def pre_save(self, model_instance, add):
-        value = getattr(model_instance, self.attname, None)
-        return self._serialize(value)
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, str):
+            # Never deserialized, the raw value can be written back as is
+            return value
+
+        values = self.get_storage_values(
+            getattr(model_instance, self.attname, None), model_instance
+        )
+        for column, column_value in values.items():
+            if column != self.attname:
+                setattr(model_instance, column, column_value)
+        return values[self.attname]
 
     def contribute_to_class(self, cls, name):
         self.class_name = cls
         super().contribute_to_class(cls, name)
-        models.signals.post_init.connect(self.post_init)
+        if self.lazy:
+            setattr(cls, self.attname, SerializedObjectDescriptor(self))
+        elif not cls._meta.abstract:
+            models.signals.post_init.connect(self.post_init, sender=cls)
+            models.signals.class_prepared.connect(self.connect_proxy)
+
+    def connect_proxy(self, sender, **kwargs):
+        '''Connects post_init for proxy models of the field's model, they are
+        sent as their own sender.
+        '''
+        if sender._meta.proxy and issubclass(sender, self.class_name):
+            models.signals.post_init.connect(self.post_init, sender=sender)
 
     def post_init(self, **kwargs):
         if 'sender' in kwargs and 'instance' in kwargs:
-            sender = kwargs['sender']
-            if (
-                sender == self.class_name
-                or sender._meta.proxy
-                and issubclass(sender, self.class_name)
-            ) and hasattr(kwargs['instance'], self.attname):
+            if hasattr(kwargs['instance'], self.attname):
                 value = self.value_from_object(kwargs['instance'])
 
-                if value:
-                    setattr(kwargs['instance'], self.attname, self._deserialize(value))
-                else:
-                    setattr(kwargs['instance'], self.attname, None)
+                if isinstance(value, str):
+                    setattr(
+                        kwargs['instance'],
+                        self.attname,
+                        self.load(kwargs['instance'], value),
+                    )
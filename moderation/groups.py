@@ -0,0 +1,125 @@
+'''Cached group membership of users, checked by the auto moderation of
+GenericModerator and by the InGroup condition of moderation.rules.
+
+The ids of group names and the group ids of a user are cached in the Django
+cache, the latter on the user instance too. Only committed state is cached,
+and the caches are invalidated when the groups or the memberships change.
+'''
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .conf.settings import GROUP_CACHE_TIMEOUT
+
+CACHE_KEY = 'moderation.user_groups.%s'
+# Dict of group name -> id
+GROUP_IDS_KEY = 'moderation.group_ids'
+
+
+def get_groups_field():
+    '''Returns the groups field of the user model, or None when it has none,
+    ex. without PermissionsMixin.
+    '''
+    try:
+        return get_user_model()._meta.get_field('groups')
+    except FieldDoesNotExist:
+        return None
+
+
+def get_group_ids(names):
+    '''Returns frozenset of ids of the existing groups named names'''
+    cached = cache.get(GROUP_IDS_KEY, {})
+    group_ids = {name: cached[name] for name in names if name in cached}
+    missing = [name for name in names if name not in group_ids]
+    if missing:
+        # Names without a group aren't cached, it can be created later
+        found = dict(Group.objects.filter(name__in=missing).values_list('name', 'id'))
+        if found:
+            transaction.on_commit(
+                lambda: cache.set(
+                    GROUP_IDS_KEY, dict(cached, **found), GROUP_CACHE_TIMEOUT
+                )
+            )
+            group_ids.update(found)
+
+    return frozenset(group_ids.values())
+
+
+def get_user_group_ids(user):
+    '''Returns frozenset of ids of the groups of user'''
+    if user.is_anonymous or get_groups_field() is None:
+        return frozenset()
+
+    try:
+        return user._moderation_group_ids
+    except AttributeError:
+        pass
+
+    key = CACHE_KEY % user.pk
+    group_ids = cache.get(key)
+    if group_ids is None:
+        group_ids = frozenset(user.groups.values_list('pk', flat=True))
+        transaction.on_commit(lambda: cache.set(key, group_ids, GROUP_CACHE_TIMEOUT))
+    user._moderation_group_ids = group_ids
+    return group_ids
+
+
+def is_user_in_groups(user, names):
+    '''Returns True if user belongs to any of the groups named names'''
+    return not get_group_ids(names).isdisjoint(get_user_group_ids(user))
+
+
+def invalidate_user_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a group
+        if action == 'pre_clear':
+            instance._moderation_cleared_user_pks = list(
+                instance.user_set.values_list('pk', flat=True)
+            )
+            return
+        if action == 'post_clear':
+            user_pks = instance.__dict__.pop('_moderation_cleared_user_pks', [])
+        elif action in ('post_add', 'post_remove'):
+            user_pks = pk_set
+        else:
+            return
+    else:
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        instance.__dict__.pop('_moderation_group_ids', None)
+        user_pks = [instance.pk]
+
+    keys = [CACHE_KEY % pk for pk in user_pks]
+    cache.delete_many(keys)
+    # Cached meanwhile by another process from the state before the change
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_group_ids(sender, **kwargs):
+    cache.delete(GROUP_IDS_KEY)
+    # Cached meanwhile by another process from the state before the change
+    transaction.on_commit(lambda: cache.delete(GROUP_IDS_KEY))
+
+
+def connect_signals():
+    groups_field = get_groups_field()
+    if groups_field is not None:
+        m2m_changed.connect(
+            invalidate_user_groups,
+            sender=groups_field.remote_field.through,
+            dispatch_uid='moderation.groups.invalidate_user_groups',
+        )
+    post_save.connect(
+        invalidate_group_ids,
+        sender=Group,
+        dispatch_uid='moderation.groups.invalidate_group_ids',
+    )
+    post_delete.connect(
+        invalidate_group_ids,
+        sender=Group,
+        dispatch_uid='moderation.groups.invalidate_group_ids_on_delete',
+    )
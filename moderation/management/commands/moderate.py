@@ -0,0 +1,383 @@
+import datetime
+import json
+import multiprocessing
+import os
+from collections import deque
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from moderation.conf.settings import BULK_BATCH_SIZE
+from moderation.constants import (
+    MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_PENDING,
+    MODERATION_STATUS_REJECTED,
+)
+from moderation.models import ModeratedObject
+
+STATUSES = {
+    'pending': MODERATION_STATUS_PENDING,
+    'approved': MODERATION_STATUS_APPROVED,
+    'rejected': MODERATION_STATUS_REJECTED,
+}
+
+
+# Lock serializing the chunks of the worker processes on databases without
+# concurrent writers, see init_worker()
+write_lock = None
+
+
+def init_worker(lock):
+    global write_lock
+    write_lock = lock
+    # Connections inherited from the parent process can't be shared
+    django.setup()
+    connections.close_all()
+
+
+def moderate_chunk(args):
+    '''Moderates the moderated objects with the given pks, runs in the
+    worker processes.
+    '''
+    action, pks, by_pk, reason = args
+    by = get_user_model()._default_manager.get(pk=by_pk)
+    queryset = ModeratedObject.objects.filter(pk__in=pks)
+    if write_lock is not None:
+        write_lock.acquire()
+    try:
+        getattr(queryset, action)(by=by, reason=reason, batch_size=len(pks))
+    finally:
+        if write_lock is not None:
+            write_lock.release()
+    return pks[-1], len(pks)
+
+
+class Command(BaseCommand):
+    help = (
+        "Approves or rejects the moderated objects matching the given "
+        "filters, in chunks processed by a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['approve', 'reject'])
+        parser.add_argument(
+            '--by',
+            required=True,
+            help='Username of the moderator the objects are moderated by.',
+        )
+        parser.add_argument('--reason', default=None)
+        parser.add_argument(
+            '--status',
+            choices=sorted(STATUSES),
+            default='pending',
+            help='Status of the moderated objects, default: pending.',
+        )
+        parser.add_argument(
+            '--content-type',
+            action='append',
+            default=[],
+            dest='content_types',
+            metavar='app_label.ModelName',
+            help='Model of the moderated objects, can be repeated.',
+        )
+        parser.add_argument(
+            '--created-after',
+            help='Only moderated objects created at or after this date or '
+            'datetime, in ISO 8601 format.',
+        )
+        parser.add_argument(
+            '--created-before',
+            help='Only moderated objects created before this date or '
+            'datetime, in ISO 8601 format.',
+        )
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            metavar='DAYS',
+            help='Only moderated objects created more than DAYS days ago.',
+        )
+        parser.add_argument(
+            '--changed-by',
+            action='append',
+            default=[],
+            metavar='USERNAME',
+            help='Only changes made by this user, can be repeated.',
+        )
+        parser.add_argument(
+            '--changed-by-staff',
+            action='store_true',
+            default=False,
+            help='Only changes made by staff users.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help='Number of moderated objects moderated per transaction.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes, 1 moderates in this process.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            metavar='FILE',
+            help='File recording the progress of the run. An interrupted run '
+            'started again with the same options and file resumes where it '
+            'stopped. The file is removed once the run completes.',
+        )
+
+    def get_created_before(self, options):
+        '''Returns the cutoff of --created-before and --older-than, the
+        stricter of both, or None.
+        '''
+        created_before = []
+        if options['created_before']:
+            created_before.append(self.parse_datetime(options['created_before']))
+        if options['older_than'] is not None:
+            created_before.append(
+                timezone.now() - datetime.timedelta(days=options['older_than'])
+            )
+        return min(created_before) if created_before else None
+
+    def get_queryset(self, options, created_before):
+        filters = {'status': STATUSES[options['status']]}
+
+        if options['content_types']:
+            try:
+                model_classes = [
+                    apps.get_model(label) for label in options['content_types']
+                ]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+            filters['content_type__in'] = list(
+                ContentType.objects.get_for_models(*model_classes).values()
+            )
+
+        if options['created_after']:
+            filters['created__gte'] = self.parse_datetime(options['created_after'])
+        if created_before is not None:
+            filters['created__lt'] = created_before
+
+        if options['changed_by']:
+            username_field = get_user_model().USERNAME_FIELD
+            filters['changed_by__%s__in' % username_field] = options['changed_by']
+        if options['changed_by_staff']:
+            filters['changed_by__is_staff'] = True
+
+        return ModeratedObject.objects.filter(**filters)
+
+    def get_phases(self, action, queryset):
+        '''Returns list of the querysets moderated one after the other.
+
+        Approving applies the snapshots of pending moderated objects, and
+        chunks run in parallel. Moderated objects with a newer one of the
+        same object in queryset are approved first, so the newest snapshot
+        is applied last.
+        '''
+        if action != 'approve':
+            return [queryset]
+
+        newer = queryset.filter(
+            Q(updated__gt=OuterRef('updated'))
+            | Q(updated=OuterRef('updated'), pk__gt=OuterRef('pk')),
+            content_type=OuterRef('content_type'),
+            object_pk=OuterRef('object_pk'),
+        )
+        return [queryset.filter(Exists(newer)), queryset.filter(~Exists(newer))]
+
+    def parse_datetime(self, value):
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                date = parse_date(value)
+                if date is not None:
+                    parsed = datetime.datetime.combine(date, datetime.time())
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError("'%s' is not a valid date or datetime" % value)
+        if settings.USE_TZ and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def get_chunks(self, queryset, last_pk, chunk_size):
+        '''Yields lists of pks of queryset greater than last_pk, paginated by
+        pk so every chunk is a single indexed query.
+        '''
+        queryset = queryset.order_by('pk').values_list('pk', flat=True)
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
+
+    def run_in_pool(self, pool, tasks, workers):
+        '''Yields the results of tasks run by pool in the order of tasks,
+        keeping a few tasks queued per worker. Tasks are created in this
+        process, so chunks are read from the database here.
+        '''
+        queued = deque()
+        for task in tasks:
+            queued.append(pool.apply_async(moderate_chunk, (task,)))
+            if len(queued) >= workers * 2:
+                yield queued.popleft().get()
+        while queued:
+            yield queued.popleft().get()
+
+    def create_pool(self, workers, database):
+        '''Returns pool of worker processes moderating chunks of database.
+
+        The workers are forked, so they inherit the settings and the
+        registered models of this process. On SQLite, which doesn't support
+        concurrent writers, they moderate one chunk at a time.
+        '''
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("--workers requires the fork start method")
+        connection = connections[database]
+        lock = None
+        if connection.vendor == 'sqlite':
+            if connection.is_in_memory_db():
+                raise CommandError("--workers can't share an in-memory SQLite database")
+            lock = multiprocessing.get_context('fork').Lock()
+
+        connections.close_all()
+        return multiprocessing.get_context('fork').Pool(
+            workers, initializer=init_worker, initargs=(lock,)
+        )
+
+    def read_checkpoint(self, path, run):
+        '''Returns tuple of the phase, the last moderated pk and the
+        created_before cutoff recorded in the checkpoint at path, or None
+        without checkpoint.
+        '''
+        if not path or not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['run'] != run:
+            raise CommandError(
+                "Checkpoint %s was recorded by a run with other options, "
+                "remove it to start over" % path
+            )
+        created_before = checkpoint.get('created_before')
+        if created_before is not None:
+            created_before = parse_datetime(created_before)
+        return checkpoint.get('phase', 0), checkpoint['last_pk'], created_before
+
+    def write_checkpoint(self, path, run, phase, last_pk, created_before):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {
+                    'run': run,
+                    'phase': phase,
+                    'last_pk': last_pk,
+                    # Resolved, --older-than is relative to the first run
+                    'created_before': (
+                        created_before.isoformat() if created_before else None
+                    ),
+                },
+                f,
+            )
+        os.replace(tmp_path, path)
+
+    def handle(self, *args, **options):
+        action = options['action']
+        chunk_size = options['chunk_size']
+        if chunk_size < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be positive")
+
+        User = get_user_model()
+        try:
+            by = User._default_manager.get(**{User.USERNAME_FIELD: options['by']})
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist" % options['by'])
+
+        # Options selecting the moderated objects, a checkpoint only resumes
+        # the run it was recorded by
+        run = {
+            key: options[key]
+            for key in [
+                'action',
+                'by',
+                'reason',
+                'status',
+                'content_types',
+                'created_after',
+                'created_before',
+                'older_than',
+                'changed_by',
+                'changed_by_staff',
+            ]
+        }
+        checkpoint = options['checkpoint']
+        recorded = self.read_checkpoint(checkpoint, run)
+        if recorded is not None:
+            first_phase, last_pk, created_before = recorded
+        else:
+            first_phase, last_pk = 0, 0
+            created_before = self.get_created_before(options)
+        queryset = self.get_queryset(options, created_before)
+
+        if options['workers'] > 1:
+            pool = self.create_pool(options['workers'], queryset.db)
+        else:
+            pool = None
+
+        moderated = 0
+        try:
+            phases = self.get_phases(action, queryset)
+            for phase, phase_queryset in enumerate(phases):
+                if phase < first_phase:
+                    continue
+                if phase > first_phase:
+                    last_pk = 0
+
+                tasks = (
+                    (action, pks, by.pk, options['reason'])
+                    for pks in self.get_chunks(phase_queryset, last_pk, chunk_size)
+                )
+                if pool is not None:
+                    # Every chunk of a phase is done before the next starts
+                    results = self.run_in_pool(pool, tasks, options['workers'])
+                else:
+                    results = map(moderate_chunk, tasks)
+
+                # Results come in the order of the chunks, so every chunk up
+                # to the recorded pk has been moderated
+                for last_pk, count in results:
+                    moderated += count
+                    if checkpoint:
+                        self.write_checkpoint(
+                            checkpoint, run, phase, last_pk, created_before
+                        )
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(
+                            "Moderated %d objects, up to pk %d" % (moderated, last_pk)
+                        )
+        finally:
+            if pool is not None:
+                # Workers may only be busy if moderation failed
+                pool.terminate()
+                pool.join()
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(
+            "%s %d moderated objects"
+            % ('Approved' if action == 'approve' else 'Rejected', moderated)
+        )
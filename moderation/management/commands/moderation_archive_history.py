@@ -0,0 +1,182 @@
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import DateTimeField, Exists, OuterRef, Value
+from django.utils import timezone
+
+from moderation import moderation
+from moderation.constants import MODERATION_STATUS_PENDING
+from moderation.models import ArchivedModeratedObject, ModeratedObject
+
+
+def get_expired_history(moderator, now):
+    '''Returns queryset of the moderated objects of the moderator's model
+    that its history retention no longer keeps, or None when the moderator
+    has no retention.
+    '''
+    keep_last = moderator.history_keep_last
+    max_age = moderator.history_max_age
+    if keep_last is None and max_age is None:
+        return None
+
+    newer = ModeratedObject.objects.filter(
+        content_type=OuterRef('content_type'),
+        object_pk=OuterRef('object_pk'),
+        updated__gt=OuterRef('updated'),
+    )
+    # The latest moderation is the one used by get_for_instance(), and
+    # pending moderations still wait for a moderator
+    queryset = (
+        ModeratedObject.objects.filter(
+            content_type=ContentType.objects.get_for_model(moderator.model_class)
+        )
+        .exclude(status=MODERATION_STATUS_PENDING)
+        .filter(Exists(newer))
+    )
+    if keep_last is not None:
+        # At least keep_last newer moderations
+        queryset = queryset.filter(Exists(newer[keep_last - 1 :]))
+    if max_age is not None:
+        queryset = queryset.filter(updated__lt=now - max_age)
+    return queryset
+
+
+def archive(queryset, now):
+    '''Moves the moderated objects of queryset to ArchivedModeratedObject
+    with a single INSERT ... SELECT, in one transaction. Returns the number
+    of archived moderated objects.
+    '''
+    with transaction.atomic(using=queryset.db):
+        if connections[queryset.db].features.has_select_for_update_skip_locked:
+            # Rows locked by a moderation in progress are left for the next
+            # run
+            queryset = queryset.select_for_update(skip_locked=True)
+        else:
+            # Waits for the moderations in progress instead
+            queryset = queryset.select_for_update()
+        moderated_objects = list(queryset.order_by('pk'))
+        if not moderated_objects:
+            return 0
+
+        for moderated_object in moderated_objects:
+            if moderated_object.changed_object_base_id is not None:
+                # Archived snapshots can't be deltas against deleted rows
+                moderated_object._materialize()
+
+        pks = [moderated_object.pk for moderated_object in moderated_objects]
+        fields = [
+            field
+            for field in ArchivedModeratedObject._meta.concrete_fields
+            if field.attname != 'archived'
+        ]
+        select = (
+            ModeratedObject.objects.filter(pk__in=pks)
+            .order_by()
+            .values(
+                *[field.attname for field in fields],
+                archived=Value(now, output_field=DateTimeField()),
+            )
+        )
+        connection = connections[queryset.db]
+        sql, params = select.query.get_compiler(using=queryset.db).as_sql()
+        columns = fields + [ArchivedModeratedObject._meta.get_field('archived')]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (%s) %s'
+                % (
+                    connection.ops.quote_name(ArchivedModeratedObject._meta.db_table),
+                    ', '.join(connection.ops.quote_name(f.column) for f in columns),
+                    sql,
+                ),
+                params,
+            )
+
+        # Deltas against the deleted rows are materialized by the on_delete
+        # handler of ModeratedObject.changed_object_base
+        ModeratedObject.objects.filter(pk__in=pks).delete()
+
+    return len(pks)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the moderated objects that the history retention of their "
+        "moderator no longer keeps to the archive, in batches of one "
+        "transaction each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            metavar='app_label.ModelName',
+            help='Models to archive the history of, defaults to all registered '
+            'models with a history retention.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            dest='batch_size',
+            help='Number of moderated objects archived per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            metavar='SECONDS',
+            help='Pause between batches, to leave room for other queries.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        if options['models']:
+            try:
+                model_classes = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+        else:
+            model_classes = list(moderation._registered_models)
+
+        now = timezone.now()
+        for model_class in model_classes:
+            moderator = moderation.get_moderator(model_class)
+            queryset = get_expired_history(moderator, now)
+            if queryset is None:
+                if options['models']:
+                    raise CommandError(
+                        "%s has no history retention" % model_class._meta.label
+                    )
+                continue
+
+            archived = 0
+            last_pk = 0
+            while True:
+                pks = list(
+                    queryset.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not pks:
+                    break
+
+                archived += archive(queryset.filter(pk__in=pks), now)
+                last_pk = pks[-1]
+                if options['verbosity'] >= 2:
+                    self.stdout.write(
+                        "%s: archived %d moderated objects"
+                        % (model_class._meta.label, archived)
+                    )
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+            self.stdout.write(
+                "%s: archived %d moderated objects"
+                % (model_class._meta.label, archived)
+            )
@@ -0,0 +1,162 @@
+import sys
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from moderation import moderation
+from moderation.constants import MODERATION_READY_STATE, MODERATION_STATUS_APPROVED
+from moderation.models import ModeratedObject
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_peak_memory():
+    '''Returns the peak resident memory of this process in bytes, or None
+    when it can't be measured.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates approved moderated objects for the existing objects of "
+        "registered models that have none, ex. after registering a model "
+        "that already has objects."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            metavar='app_label.ModelName',
+            help='Models to backfill, defaults to all registered models.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            dest='batch_size',
+            help='Number of moderated objects created per transaction.',
+        )
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_false',
+            default=True,
+            dest='snapshot',
+            help='Create the moderated objects without a snapshot of the '
+            'object, which is taken on the next save of the object instead.',
+        )
+
+    def get_batches(self, model_class, batch_size, snapshot):
+        '''Yields lists of objects of model_class without a moderated object,
+        or of their pks without snapshot, paginated by pk so memory use
+        doesn't grow with the number of objects.
+        '''
+        moderated_objects = ModeratedObject.objects.filter(
+            content_type=ContentType.objects.get_for_model(model_class),
+            object_pk=OuterRef('pk'),
+        )
+        queryset = model_class._default_unmoderated_manager.filter(
+            ~Exists(moderated_objects)
+        ).order_by('pk')
+        if not snapshot:
+            queryset = queryset.values_list('pk', flat=True)
+
+        last_pk = None
+        while True:
+            batch_queryset = queryset
+            if last_pk is not None:
+                batch_queryset = queryset.filter(pk__gt=last_pk)
+            batch = list(batch_queryset[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+            last_pk = last.pk if snapshot else last
+
+    def backfill(self, model_class, batch_size, snapshot, verbosity):
+        moderator = moderation.get_moderator(model_class)
+        content_type = ContentType.objects.get_for_model(model_class)
+
+        created = 0
+        started = time.monotonic()
+        for batch in self.get_batches(model_class, batch_size, snapshot):
+            now = timezone.now()
+            moderated_objects = []
+            for obj in batch:
+                moderated_object = ModeratedObject(
+                    content_type=content_type,
+                    object_pk=obj.pk if snapshot else obj,
+                    status=MODERATION_STATUS_APPROVED,
+                    state=MODERATION_READY_STATE,
+                    on=now,
+                )
+                if snapshot:
+                    # bulk_create() doesn't call save(), which sets the
+                    # snapshot from the content object
+                    moderated_object.changed_object = obj
+                moderated_objects.append(moderated_object)
+
+            pks = [moderated_object.object_pk for moderated_object in moderated_objects]
+            with transaction.atomic():
+                ModeratedObject.objects.bulk_create(moderated_objects)
+                if moderator.visibility_column:
+                    model_class._default_unmoderated_manager.filter(pk__in=pks).update(
+                        **{moderator.visibility_column: True}
+                    )
+
+            created += len(moderated_objects)
+            # Queries are only recorded with DEBUG, but would grow with the
+            # number of batches
+            reset_queries()
+            if verbosity >= 2:
+                self.stdout.write(
+                    "%s: created %d moderated objects"
+                    % (model_class._meta.label, created)
+                )
+
+        return created, time.monotonic() - started
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        if options['models']:
+            try:
+                model_classes = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+            for model_class in model_classes:
+                if model_class not in moderation._registered_models:
+                    raise CommandError(
+                        "%s is not registered with moderation" % model_class._meta.label
+                    )
+        else:
+            model_classes = list(moderation._registered_models)
+
+        for model_class in model_classes:
+            created, elapsed = self.backfill(
+                model_class, batch_size, options['snapshot'], options['verbosity']
+            )
+            rate = created / elapsed if elapsed else 0
+            self.stdout.write(
+                "%s: created %d moderated objects in %.1fs (%d objects/s)"
+                % (model_class._meta.label, created, elapsed, rate)
+            )
+
+        peak_memory = get_peak_memory()
+        if peak_memory is not None:
+            self.stdout.write("Peak memory: %.1f MB" % (peak_memory / 1024 / 1024))
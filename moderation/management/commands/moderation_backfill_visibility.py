@@ -0,0 +1,85 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from moderation import moderation
+from moderation.constants import (
+    MODERATION_READY_STATE,
+    MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_PENDING,
+)
+from moderation.models import ModeratedObject
+
+
+def get_visible_condition(moderator):
+    '''Returns Q matching objects of the moderator's model that should be
+    visible, judging by their most recent ModeratedObject.
+    '''
+    model_class = moderator.model_class
+    moderated_objects = ModeratedObject.objects.filter(
+        content_type=ContentType.objects.get_for_model(model_class),
+        object_pk=OuterRef('pk'),
+    )
+    newer = ModeratedObject.objects.filter(
+        content_type=OuterRef('content_type'),
+        object_pk=OuterRef('object_pk'),
+        updated__gt=OuterRef('updated'),
+    )
+
+    visible_status = Q(status=MODERATION_STATUS_APPROVED) | Q(
+        # Changes pending on a previously approved object
+        status=MODERATION_STATUS_PENDING,
+        state=MODERATION_READY_STATE,
+    )
+    if moderator.visible_until_rejected:
+        visible_status |= Q(status=MODERATION_STATUS_PENDING)
+
+    latest_visible = moderated_objects.filter(visible_status).exclude(Exists(newer))
+    return ~Exists(moderated_objects) | Exists(latest_visible)
+
+
+class Command(BaseCommand):
+    help = (
+        "Sets the visibility column of registered models from the state of "
+        "their moderated objects, ex. after enabling auto_visibility_column."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            metavar='app_label.ModelName',
+            help='Models to backfill, defaults to all registered models with '
+            'a visibility column.',
+        )
+
+    def handle(self, *args, **options):
+        if options['models']:
+            try:
+                model_classes = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+        else:
+            model_classes = list(moderation._registered_models)
+
+        for model_class in model_classes:
+            moderator = moderation.get_moderator(model_class)
+            column = moderator.visibility_column
+            if not column:
+                if options['models']:
+                    raise CommandError(
+                        "%s has no visibility column" % model_class._meta.label
+                    )
+                continue
+
+            queryset = model_class._default_unmoderated_manager.all()
+            visible = get_visible_condition(moderator)
+            with transaction.atomic():
+                shown = queryset.filter(visible).update(**{column: True})
+                hidden = queryset.exclude(visible).update(**{column: False})
+
+            self.stdout.write(
+                "%s: %d visible, %d hidden" % (model_class._meta.label, shown, hidden)
+            )
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from moderation.models import ModeratedObject
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites the stored snapshots of moderated objects with the "
+        "storage set in MODERATION_SNAPSHOT_STORAGE and "
+        "MODERATION_SNAPSHOT_COMPRESSION."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            dest='batch_size',
+            help='Number of moderated objects converted per transaction.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            default=False,
+            dest='all',
+            help=(
+                'Rewrite all moderated objects, not only those stored with '
+                'another storage, ex. to recompress them after the '
+                'compressor was changed.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        field = ModeratedObject._meta.get_field('changed_object')
+
+        if options['all']:
+            queryset = ModeratedObject.objects.all()
+        else:
+            # Rows that have a snapshot in a column other than the one used
+            # by the configured storage.
+            stored_elsewhere = Q()
+            for column in field.storage_columns:
+                if column == field.storage_column:
+                    continue
+                if column == field.attname:
+                    stored_elsewhere |= ~Q(**{column: ''})
+                else:
+                    stored_elsewhere |= Q(**{'%s__isnull' % column: False})
+            queryset = ModeratedObject.objects.filter(stored_elsewhere)
+        queryset = queryset.order_by('pk')
+
+        converted = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for moderated_object in batch:
+                    values = field.get_storage_values(
+                        moderated_object.changed_object, moderated_object
+                    )
+                    ModeratedObject.objects.filter(pk=moderated_object.pk).update(
+                        **values
+                    )
+
+            converted += len(batch)
+            last_pk = batch[-1].pk
+            if options['verbosity'] >= 2:
+                self.stdout.write("Converted %d moderated objects" % converted)
+
+        self.stdout.write(
+            "Converted %d moderated objects to '%s' storage"
+            % (converted, field.compress or field.storage)
+        )
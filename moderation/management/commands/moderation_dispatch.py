@@ -0,0 +1,144 @@
+import time
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from moderation.models import NotificationOutbox
+
+
+def get_due_notifications(now, max_attempts):
+    '''Returns queryset of the unsent notifications due to be sent at now'''
+    return NotificationOutbox.objects.filter(
+        sent=None, failed=None, next_attempt__lte=now, attempts__lt=max_attempts
+    )
+
+
+def dispatch(batch_size, connection, max_attempts, retry_delay):
+    '''Sends a batch of due notifications over the email connection, in one
+    transaction. Failed notifications are retried after retry_delay seconds,
+    doubled on each attempt, until max_attempts failed. Returns the numbers of
+    sent and failed notifications.
+    '''
+    sent = failed = 0
+    with transaction.atomic():
+        now = timezone.now()
+        notifications = get_due_notifications(now, max_attempts)
+        if connections[notifications.db].features.has_select_for_update_skip_locked:
+            # Notifications locked by another worker are left to it
+            notifications = notifications.select_for_update(skip_locked=True)
+        else:
+            # Waits for the other workers instead
+            notifications = notifications.select_for_update()
+        notifications = list(notifications.order_by('next_attempt', 'pk')[:batch_size])
+        for notification in notifications:
+            notification.attempts += 1
+            try:
+                # Reconnects after a failure closed the connection
+                connection.open()
+                mail.EmailMessage(
+                    subject=notification.subject,
+                    body=notification.message,
+                    from_email=notification.from_email,
+                    to=notification.recipient_list,
+                    connection=connection,
+                ).send()
+            except Exception as e:
+                connection.close()
+                notification.last_error = '%s: %s' % (type(e).__name__, e)
+                notification.next_attempt = now + timedelta(
+                    seconds=retry_delay * 2 ** (notification.attempts - 1)
+                )
+                if notification.attempts >= max_attempts:
+                    # Frees the dedup_key for new notifications
+                    notification.failed = now
+                failed += 1
+            else:
+                notification.sent = timezone.now()
+                notification.last_error = ''
+                sent += 1
+
+        NotificationOutbox.objects.bulk_update(
+            notifications,
+            ['attempts', 'next_attempt', 'sent', 'failed', 'last_error'],
+        )
+    return sent, failed
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the notifications written to the outbox by "
+        "OutboxMessageBackend, in batches over one email connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            dest='batch_size',
+            help='Number of notifications sent per transaction.',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=5,
+            dest='max_attempts',
+            help='Number of attempts after which a notification is given up.',
+        )
+        parser.add_argument(
+            '--retry-delay',
+            type=float,
+            default=60,
+            dest='retry_delay',
+            metavar='SECONDS',
+            help='Delay before the first retry of a failed notification, '
+            'doubled on each further attempt.',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is drained.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            metavar='SECONDS',
+            help='Pause between polls of a drained outbox with --loop.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        if options['max_attempts'] < 1:
+            raise CommandError("--max-attempts must be positive")
+
+        connection = mail.get_connection()
+        try:
+            while True:
+                sent = failed = 0
+                while True:
+                    batch_sent, batch_failed = dispatch(
+                        batch_size,
+                        connection,
+                        options['max_attempts'],
+                        options['retry_delay'],
+                    )
+                    sent += batch_sent
+                    failed += batch_failed
+                    if batch_sent + batch_failed < batch_size:
+                        break
+
+                if sent or failed or not options['loop']:
+                    self.stdout.write(
+                        "Sent %d notifications, %d failed" % (sent, failed)
+                    )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            connection.close()
@@ -1,5 +1,10 @@
+import hashlib
+import json
+
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, Q
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, QuerySet, Subquery
 from django.db.models.manager import Manager
 
 from . import moderation
@@ -7,6 +12,84 @@ from .constants import MODERATION_READY_STATE
 from .queryset import ModeratedObjectQuerySet
 
 
+class ModerationQuerySetMixin(object):
+    """Methods added to the querysets of the managers of registered models"""
+
+    def prefetch_moderation(self):
+        '''Loads the latest ModeratedObject of every object with one query,
+        so their moderated_object and moderated_status properties don't
+        query the database.
+        '''
+        return self.prefetch_related('moderated_object')
+
+    def with_moderation_status(self):
+        '''Annotates objects with the moderation_status, moderation_state and
+        moderation_updated of their latest ModeratedObject, without loading
+        the ModeratedObject rows. The annotations are None for objects
+        without moderation.
+        '''
+        from .models import ModeratedObject
+
+        latest = ModeratedObject.objects.filter(
+            content_type=ContentType.objects.get_for_model(self.model),
+            object_pk=OuterRef('pk'),
+        ).order_by('-updated')
+        return self.annotate(
+            moderation_status=Subquery(latest.values('status')[:1]),
+            moderation_state=Subquery(latest.values('state')[:1]),
+            moderation_updated=Subquery(latest.values('updated')[:1]),
+        )
+
+
+class ModerationQuerySet(ModerationQuerySetMixin, QuerySet):
+    """Queryset of the managers of registered models using QuerySet"""
+
+
+_moderation_queryset_classes = {QuerySet: ModerationQuerySet}
+
+
+def get_moderation_queryset_class(queryset_class):
+    """Returns subclass of queryset_class with the methods of
+    ModerationQuerySetMixin, built once per queryset class when a model is
+    registered. Built classes are attributes of this module, so their
+    querysets can be pickled.
+    """
+    if issubclass(queryset_class, ModerationQuerySetMixin):
+        return queryset_class
+
+    try:
+        return _moderation_queryset_classes[queryset_class]
+    except KeyError:
+        pass
+
+    name = 'Moderation%s' % queryset_class.__name__
+    while name in globals():
+        # Queryset classes of the same name from other modules
+        name += '_'
+    moderation_class = type(
+        name, (ModerationQuerySetMixin, queryset_class), {'__module__': __name__}
+    )
+    globals()[name] = moderation_class
+    _moderation_queryset_classes[queryset_class] = moderation_class
+    return moderation_class
+
+
+class UnmoderatedManagerMixin(object):
+    """Mixed into the unmoderated_* managers of registered models"""
+
+    def get_queryset(self):
+        if isinstance(self, ModerationObjectsManager):
+            # Built from a moderation manager declared by the model
+            return super(ModerationObjectsManager, self).get_queryset()
+        return super().get_queryset()
+
+    def prefetch_moderation(self):
+        return self.get_queryset().prefetch_moderation()
+
+    def with_moderation_status(self):
+        return self.get_queryset().with_moderation_status()
+
+
 class MetaClass(type(Manager)):
     def __new__(cls, name, bases, attrs):
         return super(MetaClass, cls).__new__(cls, name, bases, attrs)
@@ -28,7 +111,26 @@ class ModerationObjectsManager(Manager):
         )
 
     def filter_moderated_objects(self, queryset):
-        # Find any objects that have more than one related ModeratedObject
+        from .models import ModeratedObject
+
+        if self.moderator.check_multiple_moderations:
+            self.check_multiple_moderations(queryset)
+
+        # Objects without moderation, or with a moderation ready to be shown
+        moderated_objects = ModeratedObject.objects.filter(
+            content_type=ContentType.objects.get_for_model(self.model),
+            object_pk=OuterRef('pk'),
+        )
+        return queryset.filter(
+            ~Exists(moderated_objects)
+            | Exists(moderated_objects.filter(state=MODERATION_READY_STATE))
+        )
+
+    def check_multiple_moderations(self, queryset):
+        """Raises MultipleModerations if any object in queryset has more than
+        one related ModeratedObject. Costs an extra query, so it only runs
+        when the moderator sets check_multiple_moderations.
+        """
         annotated_queryset = queryset.annotate(
             num_moderation_objects=Count('_relation_object')
         ).filter(num_moderation_objects__gt=1)
@@ -38,14 +140,6 @@ class ModerationObjectsManager(Manager):
             # filter_moderated_objects() to handle this as you see fit.
             raise self.MultipleModerations(annotated_queryset)
 
-        only_no_relation_objects = {
-            '_relation_object': None,
-        }
-        only_ready = {
-            '_relation_object__state': MODERATION_READY_STATE,
-        }
-        return queryset.filter(Q(**only_no_relation_objects) | Q(**only_ready))
-
     def exclude_objs_by_visibility_col(self, query_set):
         return query_set.exclude(**{self.moderator.visibility_column: False})
 
@@ -57,6 +151,12 @@ class ModerationObjectsManager(Manager):
 
         return self.filter_moderated_objects(query_set)
 
+    def prefetch_moderation(self):
+        return self.get_queryset().prefetch_moderation()
+
+    def with_moderation_status(self):
+        return self.get_queryset().with_moderation_status()
+
     @property
     def moderator(self):
         return moderation.get_moderator(self.model)
@@ -66,17 +166,81 @@ class ModeratedObjectManager(Manager):
     def get_queryset(self):
         return ModeratedObjectQuerySet(self.model, using=self._db)
 
+    def pending_field_equals(self, field_name, value):
+        return self.get_queryset().pending_field_equals(field_name, value)
+
+    def filter_pending_fields(self, **lookups):
+        return self.get_queryset().filter_pending_fields(**lookups)
+
+    def claim(self, n, moderator, **kwargs):
+        return self.get_queryset().claim(n, moderator, **kwargs)
+
+    def release(self, moderator):
+        '''Gives up the leases of moderator, the leases of any queryset are
+        given up by ModeratedObjectQuerySet.release().
+        '''
+        return self.get_queryset().filter(claimed_by=moderator).release()
+
     def get_for_instance(self, instance):
-        '''Returns ModeratedObject for given model instance'''
-        try:
-            moderated_object = self.get(
+        '''Returns the most recent ModeratedObject for given model instance'''
+        moderated_object = (
+            self.filter(
                 object_pk=instance.pk,
                 content_type=ContentType.objects.get_for_model(instance.__class__),
             )
-        except self.model.MultipleObjectsReturned:
-            # Get the most recent one
-            moderated_object = self.filter(
-                object_pk=instance.pk,
-                content_type=ContentType.objects.get_for_model(instance.__class__),
-            ).order_by('-updated')[0]
+            .order_by('-updated')
+            .first()
+        )
+        if moderated_object is None:
+            raise self.model.DoesNotExist(
+                "%s matching query does not exist." % self.model._meta.object_name
+            )
         return moderated_object
+
+
+class NotificationOutboxManager(Manager):
+    def enqueue(self, messages):
+        '''Writes messages, dicts of subject, message, recipient_list and an
+        optional dedup_key, to the outbox. Messages with the dedup_key of an
+        unsent message are skipped, the key defaults to a hash of the message.
+
+        Databases ignoring the conditional unique constraint on dedup_key, ex.
+        MySQL, skip duplicates with a query instead, which doesn't see the
+        messages of concurrent transactions.
+        '''
+        notifications = []
+        for message in messages:
+            subject = message.get('subject', None)
+            body = message.get('message', None)
+            recipient_list = list(message.get('recipient_list', None) or [])
+            dedup_key = message.get('dedup_key', None)
+            if dedup_key is None:
+                dedup_key = hashlib.sha256(
+                    json.dumps([subject, body, recipient_list]).encode('utf-8')
+                ).hexdigest()
+            notifications.append(
+                self.model(
+                    subject=subject,
+                    message=body,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=recipient_list,
+                    dedup_key=dedup_key,
+                )
+            )
+
+        if not connections[self.db].features.supports_partial_indexes:
+            keys = {notification.dedup_key for notification in notifications}
+            # Keys of unsent messages, and of the messages already kept
+            skipped = set(
+                self.filter(sent=None, failed=None, dedup_key__in=keys).values_list(
+                    'dedup_key', flat=True
+                )
+            )
+            unique = []
+            for notification in notifications:
+                if notification.dedup_key not in skipped:
+                    skipped.add(notification.dedup_key)
+                    unique.append(notification)
+            notifications = unique
+
+        self.bulk_create(notifications, ignore_conflicts=True)
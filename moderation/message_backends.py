@@ -1,5 +1,13 @@
+import atexit
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
-from django.core.mail import send_mail, send_mass_mail
+from django.core.mail import EmailMessage, get_connection, send_mail, send_mass_mail
+
+logger = logging.getLogger(__name__)
 
 
 class BaseMessageBackend(object):
@@ -16,7 +24,84 @@ class SyncMessageBackend(BaseMessageBackend):
 
 
 class AsyncMessageBackend(BaseMessageBackend):
-    """Asynchronous backend"""
+    """
+    Asynchronous backend, send() hands the message to deliver() on a pool of
+    max_workers threads shared by all instances of the class. When
+    max_pending messages wait or are being delivered, send() blocks until one
+    is delivered. Pending messages are delivered before the process exits,
+    or when shutdown() is called.
+    """
+
+    max_workers = 4
+    max_pending = 1000
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def send(self, **kwargs):
+        self.submit(self.deliver, **kwargs)
+
+    def deliver(self, **kwargs):
+        raise NotImplementedError
+
+    @classmethod
+    def get_pool(cls):
+        """Returns tuple of the executor of the class and the semaphore
+        counting its pending messages, created on first use
+        """
+        with cls._pools_lock:
+            pool = cls._pools.get(cls)
+            if pool is None:
+                pool = (
+                    ThreadPoolExecutor(
+                        cls.max_workers, thread_name_prefix='moderation-messages'
+                    ),
+                    threading.BoundedSemaphore(cls.max_pending),
+                )
+                cls._pools[cls] = pool
+            return pool
+
+    def submit(self, fn, *args, **kwargs):
+        executor, pending = self.get_pool()
+        # Back-pressure, wait for a delivery when the queue is full
+        pending.acquire()
+        try:
+            future = executor.submit(self._run, fn, *args, **kwargs)
+        except BaseException:
+            pending.release()
+            raise
+        future.add_done_callback(lambda future: pending.release())
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            # Like the synchronous backends, which fail silently
+            logger.exception("Failed to deliver moderation message")
+
+    @classmethod
+    def shutdown(cls):
+        """Delivers the pending messages and stops the threads of the class,
+        they are started again by the next send()
+        """
+        with cls._pools_lock:
+            pool = cls._pools.pop(cls, None)
+        if pool is not None:
+            pool[0].shutdown(wait=True)
+        cls.close_connections()
+
+    @classmethod
+    def close_connections(cls):
+        """Closes resources held by the threads, called by shutdown()"""
+
+    @staticmethod
+    def shutdown_all():
+        for backend_class in list(AsyncMessageBackend._pools):
+            backend_class.shutdown()
+
+
+atexit.register(AsyncMessageBackend.shutdown_all)
 
 
 class EmailMessageBackend(SyncMessageBackend):
@@ -38,7 +123,7 @@ class EmailMessageBackend(SyncMessageBackend):
         )
 
 
-class EmailMultipleMessageBackend(SyncMessageBackend):
+class EmailMultipleMessageBackend(SyncMessageBackend, BaseMultipleMessageBackend):
     """
     Send messages through emails on the main thread
     """
@@ -46,7 +131,7 @@ class EmailMultipleMessageBackend(SyncMessageBackend):
     def send(self, datatuples, **kwargs):
         send_mass_mail(
             tuple(
-                tuple(
+                (
                     d.get('subject', None),
                     d.get('message', None),
                     settings.DEFAULT_FROM_EMAIL,
@@ -56,3 +141,102 @@ class EmailMultipleMessageBackend(SyncMessageBackend):
             ),
             fail_silently=True,
         )
+
+
+class AsyncEmailMessageBackend(AsyncMessageBackend):
+    """
+    Send the message through an email on a pool of threads, each thread
+    reusing its own connection to the email backend
+    """
+
+    _local = threading.local()
+    # Connections opened by the threads of each class
+    _connections = {}
+    _connections_lock = threading.Lock()
+
+    def deliver(self, **kwargs):
+        self.send_messages(
+            [
+                EmailMessage(
+                    subject=kwargs.get('subject', None),
+                    body=kwargs.get('message', None),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=kwargs.get('recipient_list', None),
+                )
+            ]
+        )
+
+    def get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.setdefault(type(self), []).append(connection)
+        return connection
+
+    def send_messages(self, messages):
+        connection = self.get_connection()
+        try:
+            connection.send_messages(messages)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed the idle connection, reconnect once
+            connection.close()
+            connection.open()
+            connection.send_messages(messages)
+
+    @classmethod
+    def close_connections(cls):
+        with cls._connections_lock:
+            connections = cls._connections.pop(cls, [])
+        for connection in connections:
+            connection.close()
+
+
+class AsyncEmailMultipleMessageBackend(
+    AsyncEmailMessageBackend, BaseMultipleMessageBackend
+):
+    """
+    Send messages through emails on a pool of threads, over one connection
+    """
+
+    def send(self, datatuples, **kwargs):
+        self.submit(self.deliver_many, datatuples)
+
+    def deliver_many(self, datatuples):
+        self.send_messages(
+            [
+                EmailMessage(
+                    subject=d.get('subject', None),
+                    body=d.get('message', None),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=d.get('recipient_list', None),
+                )
+                for d in datatuples
+            ]
+        )
+
+
+class OutboxMessageBackend(BaseMessageBackend):
+    """
+    Write the message to NotificationOutbox, in the current transaction.
+    Messages are sent by the moderation_dispatch management command once
+    the transaction commits, and discarded when it rolls back.
+    """
+
+    def send(self, **kwargs):
+        from .models import NotificationOutbox
+
+        NotificationOutbox.objects.enqueue([kwargs])
+
+
+class OutboxMultipleMessageBackend(OutboxMessageBackend, BaseMultipleMessageBackend):
+    """
+    Write messages to NotificationOutbox, see OutboxMessageBackend
+    """
+
+    def send(self, datatuples, **kwargs):
+        from .models import NotificationOutbox
+
+        NotificationOutbox.objects.enqueue(datatuples)
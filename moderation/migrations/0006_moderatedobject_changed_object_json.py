@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0005_auto_20190412_0442'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderatedobject',
+            name='changed_object_json',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
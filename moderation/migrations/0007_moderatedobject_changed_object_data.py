@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0006_moderatedobject_changed_object_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderatedobject',
+            name='changed_object_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
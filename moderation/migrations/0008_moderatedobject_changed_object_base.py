@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0007_moderatedobject_changed_object_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderatedobject',
+            name='changed_object_base',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+',
+                to='moderation.moderatedobject',
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0008_moderatedobject_changed_object_base'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='moderatedobject',
+            index=models.Index(
+                fields=['content_type', 'object_pk', '-updated'],
+                name='moderation_ct_pk_updated_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='moderatedobject',
+            index=models.Index(
+                fields=['status', 'created'], name='moderation_status_created_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='moderatedobject',
+            index=models.Index(
+                fields=['content_type', 'status', 'created'],
+                name='moderation_ct_status_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,105 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import moderation.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('moderation', '0009_moderatedobject_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedModeratedObject',
+            fields=[
+                (
+                    'id',
+                    models.PositiveIntegerField(
+                        editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    'object_pk',
+                    models.PositiveIntegerField(blank=True, editable=False, null=True),
+                ),
+                ('created', models.DateTimeField(editable=False)),
+                ('updated', models.DateTimeField(editable=False)),
+                (
+                    'state',
+                    models.SmallIntegerField(
+                        choices=[(0, 'Ready for moderation'), (1, 'Draft')],
+                        editable=False,
+                    ),
+                ),
+                (
+                    'status',
+                    models.SmallIntegerField(
+                        choices=[(0, 'Rejected'), (1, 'Approved'), (2, 'Pending')],
+                        editable=False,
+                    ),
+                ),
+                ('on', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('reason', models.TextField(blank=True, editable=False, null=True)),
+                (
+                    'changed_object',
+                    moderation.fields.SerializedObjectField(editable=False),
+                ),
+                (
+                    'changed_object_json',
+                    models.JSONField(blank=True, editable=False, null=True),
+                ),
+                ('changed_object_data', models.BinaryField(blank=True, null=True)),
+                ('archived', models.DateTimeField(db_index=True, editable=False)),
+                (
+                    'by',
+                    models.ForeignKey(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='+',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    'changed_by',
+                    models.ForeignKey(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='+',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    'content_type',
+                    models.ForeignKey(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='+',
+                        to='contenttypes.contenttype',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Archived Moderated Object',
+                'verbose_name_plural': 'Archived Moderated Objects',
+                'ordering': ['-updated'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedmoderatedobject',
+            index=models.Index(
+                fields=['content_type', 'object_pk'],
+                name='moderation_archived_ct_pk_idx',
+            ),
+        ),
+    ]
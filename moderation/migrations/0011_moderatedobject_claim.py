@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('moderation', '0010_archivedmoderatedobject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderatedobject',
+            name='claimed_by',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='claimed_by_set',
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name='moderatedobject',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='moderatedobject',
+            index=models.Index(
+                fields=['status', 'lease_until'], name='moderation_status_lease_idx'
+            ),
+        ),
+    ]
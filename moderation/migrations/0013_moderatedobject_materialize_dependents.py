@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+import moderation.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0012_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='moderatedobject',
+            name='changed_object_base',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=moderation.models.MATERIALIZE_DEPENDENTS,
+                related_name='+',
+                to='moderation.moderatedobject',
+            ),
+        ),
+    ]
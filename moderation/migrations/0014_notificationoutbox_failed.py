@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0013_moderatedobject_materialize_dependents'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='notificationoutbox',
+            name='moderation_outbox_unsent_dedup_key',
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='failed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='notificationoutbox',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('failed__isnull', True), ('sent__isnull', True)),
+                fields=('dedup_key',),
+                name='moderation_outbox_unsent_dedup_key',
+            ),
+        ),
+    ]
@@ -3,10 +3,13 @@ import datetime
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from . import moderation
+from .conf.settings import SNAPSHOT_COMPRESSION, SNAPSHOT_STORAGE
 from .constants import (
     MODERATION_DRAFT_STATE,
     MODERATION_READY_STATE,
@@ -14,9 +17,8 @@ from .constants import (
     MODERATION_STATUS_PENDING,
     MODERATION_STATUS_REJECTED,
 )
-from .diff import get_changes_between_models
 from .fields import SerializedObjectField
-from .managers import ModeratedObjectManager
+from .managers import ModeratedObjectManager, NotificationOutboxManager
 from .signals import post_moderation, pre_moderation
 
 MODERATION_STATES = [
@@ -31,6 +33,14 @@ STATUS_CHOICES = [
 ]
 
 
+def MATERIALIZE_DEPENDENTS(collector, field, sub_objs, using):
+    '''on_delete handler of changed_object_base, keeps delta snapshots
+    readable when their base is deleted. Runs once per deleted batch.
+    '''
+    for dependent in sub_objs.defer(None).select_related('changed_object_base'):
+        dependent._materialize()
+
+
 class ModeratedObject(models.Model):
     content_type = models.ForeignKey(
         ContentType, null=True, blank=True, on_delete=models.SET_NULL, editable=False
@@ -57,7 +67,31 @@ class ModeratedObject(models.Model):
     )
     on = models.DateTimeField(editable=False, blank=True, null=True)
     reason = models.TextField(blank=True, null=True)
-    changed_object = SerializedObjectField(serialize_format='json', editable=False)
+    changed_object = SerializedObjectField(
+        serialize_format='json',
+        lazy=True,
+        storage=SNAPSHOT_STORAGE,
+        json_field='changed_object_json',
+        compress=SNAPSHOT_COMPRESSION,
+        binary_field='changed_object_data',
+        base_field='changed_object_base',
+        fallback='_get_object_without_snapshot',
+        editable=False,
+    )
+    # Hold the snapshot instead of changed_object with the 'json' storage or
+    # with compression, must stay declared after changed_object.
+    changed_object_json = models.JSONField(blank=True, null=True, editable=False)
+    changed_object_data = models.BinaryField(blank=True, null=True, editable=False)
+    # Moderated object the changed_object snapshot is a delta against, see
+    # GenericModerator.delta_snapshots
+    changed_object_base = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=MATERIALIZE_DEPENDENTS,
+        related_name='+',
+    )
     changed_by = models.ForeignKey(
         getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
         blank=True,
@@ -66,6 +100,17 @@ class ModeratedObject(models.Model):
         on_delete=models.SET_NULL,
         related_name='changed_by_set',
     )
+    # Moderator reviewing this object until lease_until, see
+    # ModeratedObjectQuerySet.claim()
+    claimed_by = models.ForeignKey(
+        getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='claimed_by_set',
+    )
+    lease_until = models.DateTimeField(editable=False, blank=True, null=True)
 
     objects = ModeratedObjectManager()
 
@@ -79,15 +124,71 @@ class ModeratedObject(models.Model):
         return "%s" % self.changed_object
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
         if self.instance:
             self.changed_object = self.instance
+        elif (
+            self.pk is not None
+            and (update_fields is None or 'changed_object' in update_fields)
+            and self._meta.get_field('changed_object').has_changed(self)
+            and self._has_delta_snapshots()
+        ):
+            # The snapshot of this object changes
+            self._materialize_dependents()
 
         super().save(*args, **kwargs)
 
+    def _has_delta_snapshots(self):
+        if self.content_type_id is None:
+            return False
+        model_class = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        moderator = moderation._registered_models.get(model_class)
+        return moderator is not None and moderator.delta_snapshots
+
+    def _materialize_dependents(self):
+        '''Rewrites snapshots stored as deltas against this moderated object
+        as full snapshots.
+        '''
+        dependents = ModeratedObject.objects.filter(changed_object_base=self.pk)
+        for dependent in dependents:
+            dependent._materialize()
+
+    def _materialize(self):
+        '''Rewrites the snapshot of this moderated object, stored as a delta,
+        as a full snapshot.
+        '''
+        field = self._meta.get_field('changed_object')
+        changed_object = self.changed_object
+        self.changed_object_base = None
+        ModeratedObject.objects.filter(pk=self.pk).update(
+            changed_object_base=None,
+            **field.get_storage_values(changed_object, self),
+        )
+
     class Meta:
         verbose_name = _('Moderated Object')
         verbose_name_plural = _('Moderated Objects')
         ordering = ['status', 'created']
+        indexes = [
+            # get_for_instance() and the moderated_object property
+            models.Index(
+                fields=['content_type', 'object_pk', '-updated'],
+                name='moderation_ct_pk_updated_idx',
+            ),
+            # Moderation queue in the admin
+            models.Index(
+                fields=['status', 'created'], name='moderation_status_created_idx'
+            ),
+            # Moderation queue filtered by content type
+            models.Index(
+                fields=['content_type', 'status', 'created'],
+                name='moderation_ct_status_idx',
+            ),
+            # Claimable moderated objects of the work queue
+            models.Index(
+                fields=['status', 'lease_until'], name='moderation_status_lease_idx'
+            ),
+        ]
 
     def automoderate(self, user=None):
         '''Auto moderate object for given user.
@@ -134,6 +235,18 @@ class ModeratedObject(models.Model):
         obj = self.content_type.model_class()._default_unmoderated_manager.get(pk=pk)
         return obj
 
+    def _get_object_without_snapshot(self):
+        '''Returns the object itself in place of the snapshot of moderated
+        objects created without one by moderation_backfill --no-snapshot,
+        which are the approved version of the object until its next save.
+        '''
+        if self.content_type_id is None or self.object_pk is None:
+            return None
+        try:
+            return self.get_object_for_this_type()
+        except ObjectDoesNotExist:
+            return None
+
     def get_absolute_url(self):
         if hasattr(self.changed_object, 'get_absolute_url'):
             return self.changed_object.get_absolute_url()
@@ -195,6 +308,8 @@ class ModeratedObject(models.Model):
         self.on = datetime.datetime.now()
         self.by = by
         self.reason = reason
+        self.claimed_by = None
+        self.lease_until = None
         self.save()
 
         if self.moderator.visibility_column:
@@ -223,25 +338,125 @@ class ModeratedObject(models.Model):
             self.moderator.inform_user(self.content_object, self.changed_by)
 
     def has_object_been_changed(self, original_obj, only_excluded=False):
-        excludes = includes = []
-        if only_excluded:
-            includes = self.moderator.fields_exclude
-        else:
-            excludes = self.moderator.fields_exclude
-
-        changes = get_changes_between_models(
-            original_obj, self.changed_object, excludes, includes
+        return self.moderator.field_plan.has_changes(
+            original_obj, self.changed_object, only_excluded
         )
 
-        for change in changes:
-            left_change, right_change = changes[change].change
-            if left_change != right_change:
-                return True
-
-        return False
-
     def approve(self, by=None, reason=None):
         self._send_signals_and_moderate(MODERATION_STATUS_APPROVED, by, reason)
 
     def reject(self, by=None, reason=None):
         self._send_signals_and_moderate(MODERATION_STATUS_REJECTED, by, reason)
+
+
+class ArchivedModeratedObject(models.Model):
+    '''Moderated object moved out of ModeratedObject by the history retention
+    of its moderator, see GenericModerator.history_keep_last and
+    history_max_age. Snapshots are always stored in full.
+    '''
+
+    # Primary key of the archived moderated object
+    id = models.PositiveIntegerField(primary_key=True, editable=False)
+    content_type = models.ForeignKey(
+        ContentType,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        editable=False,
+        related_name='+',
+    )
+    object_pk = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    content_object = GenericForeignKey(ct_field='content_type', fk_field='object_pk')
+    created = models.DateTimeField(editable=False)
+    updated = models.DateTimeField(editable=False)
+    state = models.SmallIntegerField(choices=MODERATION_STATES, editable=False)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, editable=False)
+    by = models.ForeignKey(
+        getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    on = models.DateTimeField(editable=False, blank=True, null=True)
+    reason = models.TextField(blank=True, null=True, editable=False)
+    changed_object = SerializedObjectField(
+        serialize_format='json',
+        lazy=True,
+        storage=SNAPSHOT_STORAGE,
+        json_field='changed_object_json',
+        compress=SNAPSHOT_COMPRESSION,
+        binary_field='changed_object_data',
+        editable=False,
+    )
+    changed_object_json = models.JSONField(blank=True, null=True, editable=False)
+    changed_object_data = models.BinaryField(blank=True, null=True, editable=False)
+    changed_by = models.ForeignKey(
+        getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    archived = models.DateTimeField(editable=False, db_index=True)
+
+    class Meta:
+        verbose_name = _('Archived Moderated Object')
+        verbose_name_plural = _('Archived Moderated Objects')
+        ordering = ['-updated']
+        indexes = [
+            models.Index(
+                fields=['content_type', 'object_pk'],
+                name='moderation_archived_ct_pk_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return "%s" % self.changed_object
+
+
+class NotificationOutbox(models.Model):
+    '''Notification waiting to be sent by the moderation_dispatch command,
+    written by OutboxMessageBackend in the transaction of the change it
+    notifies of, so it is only sent once that transaction commits.
+    '''
+
+    subject = models.TextField()
+    message = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipient_list = models.JSONField(default=list)
+    # Identifies the notification among the unsent ones, see
+    # NotificationOutboxManager.enqueue()
+    dedup_key = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    sent = models.DateTimeField(blank=True, null=True)
+    # Set when the last attempt failed, the notification is given up
+    failed = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    objects = NotificationOutboxManager()
+
+    class Meta:
+        verbose_name = _('Notification Outbox')
+        verbose_name_plural = _('Notification Outbox')
+        ordering = ['next_attempt', 'pk']
+        indexes = [
+            # Notifications due to be sent
+            models.Index(
+                fields=['sent', 'next_attempt'], name='moderation_outbox_due_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(sent__isnull=True, failed__isnull=True),
+                name='moderation_outbox_unsent_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return self.subject
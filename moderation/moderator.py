@@ -1,9 +1,10 @@
-from django.contrib.auth.models import Group
-from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.fields import BooleanField
 from django.db.models.manager import Manager
 from django.template.loader import render_to_string
 
+from .constants import MODERATION_STATUS_APPROVED, MODERATION_STATUS_REJECTED
+from .diff import FieldPlan
+from .groups import is_user_in_groups
 from .managers import ModerationObjectsManager
 from .message_backends import (
     BaseMessageBackend,
@@ -11,6 +12,7 @@ from .message_backends import (
     EmailMessageBackend,
     EmailMultipleMessageBackend,
 )
+from .rules import RulePlan
 from .utils import is_sites_framework_enabled
 
 
@@ -24,11 +26,17 @@ class GenericModerator:
     bypass_moderation_after_approval = False
     visible_until_rejected = False
     keep_history = False
+    delta_snapshots = False
+    check_multiple_moderations = False
+    track_changes = False
+    history_keep_last = None
+    history_max_age = None
 
     fields_exclude = []
     resolve_foreignkeys = True
 
     visibility_column = None
+    auto_visibility_column = False
 
     auto_approve_for_superusers = True
     auto_approve_for_staff = True
@@ -37,6 +45,8 @@ class GenericModerator:
     auto_reject_for_anonymous = True
     auto_reject_for_groups = None
 
+    auto_moderation_rules = []
+
     notify_moderator = True
     notify_user = True
 
@@ -52,12 +62,17 @@ class GenericModerator:
         self._validate_options()
         self.base_managers = self._get_base_managers()
 
+        # Copy the class attribute, moderators of other models share it
+        self.fields_exclude = list(self.fields_exclude)
         moderated_fields = getattr(model_class, 'moderated_fields', None)
         if moderated_fields:
             for field in model_class._meta.fields:
                 if field.name not in moderated_fields:
                     self.fields_exclude.append(field.name)
 
+        self.field_plan = FieldPlan(model_class, self.fields_exclude)
+        self.rule_plan = RulePlan(model_class, self.auto_moderation_rules)
+
     def is_auto_approve(self, obj, user):
         '''
         Checks if change on obj by user need to be auto approved
@@ -75,6 +90,10 @@ class GenericModerator:
         if self.auto_approve_for_staff and user.is_staff:
             return self.reason('Auto-approved: Staff')
 
+        rule = self.rule_plan.match(MODERATION_STATUS_APPROVED, obj, user)
+        if rule is not None:
+            return self.reason(rule.reason, user, obj)
+
         return False
 
     def is_auto_reject(self, obj, user):
@@ -95,6 +114,10 @@ class GenericModerator:
         ):
             return self.reason('Auto-rejected: User in disallowed group')
 
+        rule = self.rule_plan.match(MODERATION_STATUS_REJECTED, obj, user)
+        if rule is not None:
+            return self.reason(rule.reason, user, obj)
+
         return False
 
     def reason(self, reason, user=None, obj=None):
@@ -104,16 +127,7 @@ class GenericModerator:
         return reason
 
     def _check_user_in_groups(self, user, groups):
-        for group in groups:
-            try:
-                group = Group.objects.get(name=group)
-            except ObjectDoesNotExist:
-                return False
-
-            if group in user.groups.all():
-                return True
-
-        return False
+        return is_user_in_groups(user, groups)
 
     def get_message_backend(self):
         if not issubclass(self.message_backend_class, BaseMessageBackend):
@@ -131,7 +145,7 @@ class GenericModerator:
             raise TypeError(
                 "The message backend used '{}' needs to "
                 "inherit from the BaseMultipleMessageBackend "
-                "class".format(self.message_backend_class)
+                "class".format(self.multiple_message_backend_class)
             )
         return self.multiple_message_backend_class()
 
@@ -171,43 +185,29 @@ class GenericModerator:
 
         if is_sites_framework_enabled():
             from django.contrib.sites.models import Site
-            site = Site.objects.get_current()
-            ctx.update({
-                'site': site,
-            })
 
-        datatuples = tuple(
-            {
-                'subject': render_to_string(
-                    subject_template,
-                    ctx.update(
-                        {
-                            'moderated_object': mobj,
-                            'content_object': mobj.content_object,
-                            'content_type': mobj.content_type,
-                            'user': mobj.changed_by,
-                        }
-                    ),
-                ),
-                'message': render_to_string(
-                    message_template,
-                    ctx.update(
-                        {
-                            'moderated_object': mobj,
-                            'content_object': mobj.content_object,
-                            'content_type': mobj.content_type,
-                            'user': mobj.changed_by,
-                        }
-                    ),
-                ),
-                # from_email will need to be added
-                'recipient_list': [mobj.changed_by.email],
-            }
-            for mobj in queryset
-        )
+            ctx = dict(ctx, site=Site.objects.get_current())
+
+        datatuples = []
+        for mobj in queryset:
+            context = dict(
+                ctx,
+                moderated_object=mobj,
+                content_object=mobj.content_object,
+                content_type=mobj.content_type,
+                user=mobj.changed_by,
+            )
+            datatuples.append(
+                {
+                    'subject': render_to_string(subject_template, context),
+                    'message': render_to_string(message_template, context),
+                    # from_email will need to be added
+                    'recipient_list': [mobj.changed_by.email],
+                }
+            )
 
         multiple_backend = self.get_multiple_message_backend()
-        multiple_backend.send(datatuples)
+        multiple_backend.send(tuple(datatuples))
 
     def inform_moderator(self, content_object, extra_context=None):
         '''Send notification to moderator'''
@@ -245,9 +245,9 @@ class GenericModerator:
         '''
         if self.notify_user:
             self.send_many(
-                queryset=queryset.exclude(changed_by=None).select_related(
-                    'changed_by__email'
-                ),
+                queryset=queryset.exclude(changed_by=None)
+                .select_related('changed_by', 'content_type')
+                .prefetch_related('content_object'),
                 subject_template=self.subject_template_user,
                 message_template=self.message_template_user,
                 extra_context=extra_context,
@@ -272,6 +272,27 @@ class GenericModerator:
         return base_manager
 
     def _validate_options(self):
+        if (
+            self.history_keep_last is not None or self.history_max_age is not None
+        ) and not self.keep_history:
+            msg = (
+                "history_keep_last and history_max_age require keep_history "
+                "on model %s"
+            )
+            raise AttributeError(msg % self.model_class)
+
+        if self.history_keep_last is not None and self.history_keep_last < 1:
+            msg = "history_keep_last should be at least 1 on model %s"
+            raise AttributeError(msg % self.model_class)
+
+        if self.auto_visibility_column and self.visibility_column:
+            msg = (
+                "auto_visibility_column can't be used together with "
+                "visibility_column: %s on model %s"
+            )
+            msg %= (self.visibility_column, self.model_class)
+            raise AttributeError(msg)
+
         if self.visibility_column:
             try:  # Django 1.10+
                 field_type = type(
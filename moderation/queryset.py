@@ -1,52 +1,258 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import Q
 from django.db.models.query import QuerySet
+from django.utils import timezone
 
 from . import moderation
+from .codec import to_json_value
+from .conf.settings import BULK_BATCH_SIZE, CLAIM_LEASE_SECONDS
 from .constants import (
     MODERATION_READY_STATE,
     MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_PENDING,
     MODERATION_STATUS_REJECTED,
 )
 from .signals import post_many_moderation, pre_many_moderation
 
 
 class ModeratedObjectQuerySet(QuerySet):
-    def approve(self, cls, by, reason=None):
-        self._send_signals_and_moderate(cls, MODERATION_STATUS_APPROVED, by, reason)
+    def approve(self, cls=None, by=None, reason=None, batch_size=BULK_BATCH_SIZE):
+        '''Approves the moderated objects, applying pending changes to the
+        moderated model instances.
 
-    def reject(self, cls, by, reason=None):
-        self._send_signals_and_moderate(cls, MODERATION_STATUS_REJECTED, by, reason)
+        Only moderated objects of cls are approved when it is given, otherwise
+        the moderated objects of every model class in the queryset.
+        '''
+        self._send_signals_and_moderate(
+            cls, MODERATION_STATUS_APPROVED, by, reason, batch_size
+        )
+
+    def reject(self, cls=None, by=None, reason=None, batch_size=BULK_BATCH_SIZE):
+        '''Rejects the moderated objects, see approve()'''
+        self._send_signals_and_moderate(
+            cls, MODERATION_STATUS_REJECTED, by, reason, batch_size
+        )
 
     def moderator(self, cls):
         return moderation.get_moderator(cls)
 
-    def _send_signals_and_moderate(self, cls, new_status, by, reason):
-        pre_many_moderation.send(
-            sender=cls, queryset=self, status=new_status, by=by, reason=reason
+    def pending_field_equals(self, field_name, value):
+        '''Returns pending moderations whose changed object has field_name
+        equal to value, see filter_pending_fields()
+        '''
+        return self.filter_pending_fields(**{field_name: value})
+
+    def filter_pending_fields(self, **lookups):
+        '''Filters pending moderations by fields of their changed objects,
+        ex. filter_pending_fields(title__icontains='django').
+
+        The lookups run in the database against the stored snapshots, which
+        requires MODERATION_SNAPSHOT_STORAGE = 'json'. Foreign keys are
+        compared by their raw ids.
+        '''
+        field = self.model._meta.get_field('changed_object')
+        if field.storage != 'json':
+            raise ImproperlyConfigured(
+                "Filtering by pending fields requires "
+                "MODERATION_SNAPSHOT_STORAGE = 'json'"
+            )
+
+        filters = {}
+        for lookup, value in lookups.items():
+            if isinstance(value, (list, tuple, set)):
+                value = [to_json_value(item) for item in value]
+            else:
+                value = to_json_value(value)
+            filters['%s__fields__%s' % (field.json_field, lookup)] = value
+
+        return self.filter(status=MODERATION_STATUS_PENDING, **filters)
+
+    def claim(self, n, moderator, lease_seconds=CLAIM_LEASE_SECONDS):
+        '''Reserves up to n pending moderated objects of this queryset that
+        nobody else holds a lease on for moderator, a user, for lease_seconds,
+        oldest first. Returns list of the claimed moderated objects.
+
+        Concurrent claims never return the same moderated objects. Rows are
+        locked with SELECT ... FOR UPDATE SKIP LOCKED where the database
+        supports it, otherwise the claim is a single UPDATE that checks the
+        leases again.
+        '''
+        now = timezone.now()
+        lease_until = now + timedelta(seconds=lease_seconds)
+        claimable = self.filter(status=MODERATION_STATUS_PENDING).filter(
+            Q(lease_until__isnull=True) | Q(lease_until__lte=now)
         )
+        candidates = claimable.order_by('created', 'pk').values_list('pk', flat=True)
 
-        self._moderate(cls, new_status, by, reason)
+        with transaction.atomic(using=self.db):
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            pks = list(candidates[:n])
+            claimable.filter(pk__in=pks).update(
+                claimed_by=moderator, lease_until=lease_until
+            )
 
-        post_many_moderation.send(
-            sender=cls, queryset=self, status=new_status, by=by, reason=reason
+        # Rows claimed by someone else between the two queries weren't updated
+        return list(
+            self.model._default_manager.db_manager(self.db)
+            .filter(pk__in=pks, claimed_by=moderator, lease_until=lease_until)
+            .order_by('created', 'pk')
         )
 
-    def _moderate(self, cls, new_status, by, reason):
+    def release(self):
+        '''Gives up the leases on the moderated objects of this queryset, ex.
+        ModeratedObject.objects.filter(claimed_by=user).release(). Returns
+        the number of released moderated objects.
+        '''
+        return self.exclude(claimed_by=None, lease_until=None).update(
+            claimed_by=None, lease_until=None
+        )
+
+    def apply_rules(self, cls=None, by=None, batch_size=BULK_BATCH_SIZE):
+        '''Moderates the pending moderated objects of this queryset that meet
+        the auto_moderation_rules of their moderators, see
+        GenericModerator.auto_moderation_rules. Returns tuple of the numbers
+        of approved and rejected moderated objects.
+
+        Each rule is evaluated in one query where its conditions can be
+        evaluated in the database, otherwise on the loaded moderated objects
+        in batches of batch_size. The matches are moderated like approve()
+        and reject() do.
+        '''
+        counts = {MODERATION_STATUS_APPROVED: 0, MODERATION_STATUS_REJECTED: 0}
+        field = self.model._meta.get_field('changed_object')
+
+        for model_class, queryset in self._group_by_model_class(cls):
+            mod = self.moderator(model_class)
+            for rule in mod.rule_plan.rules:
+                pending = queryset.filter(status=MODERATION_STATUS_PENDING)
+                pks = queryset._match_rule(mod, rule, pending, field, batch_size)
+                if not pks:
+                    continue
+
+                matched = self.model._default_manager.db_manager(self.db).filter(
+                    pk__in=pks
+                )
+                matched._moderate(model_class, rule.status, by, rule.reason, batch_size)
+                counts[rule.status] += len(pks)
+
+        return counts[MODERATION_STATUS_APPROVED], counts[MODERATION_STATUS_REJECTED]
+
+    def _match_rule(self, mod, rule, pending, field, batch_size):
+        '''Returns list of pks of the moderated objects of pending meeting the
+        condition of rule
+        '''
+        condition = rule.condition
+        q = condition.as_q(mod, field)
+        if q is None:
+            evaluated = pending
+            pks = []
+        else:
+            matched = pending.filter(q)
+            evaluated = pending.none()
+            if condition.uses_object:
+                # Snapshots stored before the 'json' storage was enabled
+                matched = matched.filter(**{'%s__isnull' % field.json_field: False})
+                evaluated = pending.filter(**{'%s__isnull' % field.json_field: True})
+            pks = list(matched.order_by('pk').values_list('pk', flat=True))
+
+        evaluated = evaluated.select_related('changed_by').order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(evaluated.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for moderated_object in batch:
+                obj = None
+                if condition.uses_object:
+                    if mod.visible_until_rejected:
+                        obj = moderated_object.get_object_for_this_type()
+                    else:
+                        obj = moderated_object.changed_object
+                if condition.matches(obj, moderated_object.changed_by):
+                    pks.append(moderated_object.pk)
+            last_pk = batch[-1].pk
+
+        return pks
+
+    def _send_signals_and_moderate(self, cls, new_status, by, reason, batch_size):
+        for model_class, queryset in self._group_by_model_class(cls):
+            queryset._moderate(model_class, new_status, by, reason, batch_size)
+
+    def _group_by_model_class(self, cls=None):
+        '''Returns list of model classes with the moderated objects of this
+        queryset that belong to them
+        '''
+        if cls is not None:
+            content_types = [(cls, ContentType.objects.get_for_model(cls))]
+        else:
+            content_type_ids = (
+                self.order_by().values_list('content_type', flat=True).distinct()
+            )
+            content_types = []
+            for content_type_id in content_type_ids:
+                content_type = ContentType.objects.get_for_id(content_type_id)
+                content_types.append((content_type.model_class(), content_type))
+
+        return [
+            (model_class, self.filter(content_type=content_type))
+            for model_class, content_type in content_types
+        ]
+
+    def _moderate(self, cls, new_status, by, reason, batch_size=BULK_BATCH_SIZE):
+        '''Moderates the moderated objects of cls in batches of batch_size,
+        the many moderation signals and the user notifications are sent once
+        per batch
+        '''
         mod = self.moderator(cls)
-        ct = ContentType.objects.get_for_model(cls)
+        manager = self.model._default_manager.db_manager(self.db)
+
+        # Read before the updates, they may change what self matches
+        pks = list(self.order_by('pk').values_list('pk', flat=True))
+
+        for start in range(0, len(pks), batch_size):
+            batch = manager.filter(pk__in=pks[start : start + batch_size])
+
+            pre_many_moderation.send(
+                sender=cls, queryset=batch, status=new_status, by=by, reason=reason
+            )
+
+            with transaction.atomic(using=self.db):
+                self._moderate_batch(cls, mod, batch, new_status, by, reason)
+
+            post_many_moderation.send(
+                sender=cls, queryset=batch, status=new_status, by=by, reason=reason
+            )
+
+            mod.inform_users(batch)
+
+    def _moderate_batch(self, cls, mod, queryset, new_status, by, reason):
+        if new_status == MODERATION_STATUS_APPROVED and not mod.visible_until_rejected:
+            # Pending changes are held in the snapshots until approved, see
+            # ModeratedObject._moderate()
+            self._apply_changed_objects(
+                cls, mod, queryset.filter(status=MODERATION_STATUS_PENDING)
+            )
+
+        if mod.visibility_column:
+            object_pks = list(queryset.values_list('object_pk', flat=True))
 
         update_kwargs = {
             'status': new_status,
             'on': datetime.now(),
             'by': by,
             'reason': reason,
+            'claimed_by': None,
+            'lease_until': None,
         }
         if new_status == MODERATION_STATUS_APPROVED:
             update_kwargs['state'] = MODERATION_READY_STATE
 
-        self.update(update_kwargs)
+        queryset.update(**update_kwargs)
 
         if mod.visibility_column:
             if new_status == MODERATION_STATUS_APPROVED:
@@ -54,12 +260,31 @@ class ModeratedObjectQuerySet(QuerySet):
             elif new_status == MODERATION_STATUS_REJECTED:
                 new_visible = False
             else:  # MODERATION_STATUS_PENDING
-                new_visible = mod.visibile_until_rejected
+                new_visible = mod.visible_until_rejected
 
-            cls.objects.filter(
-                id__in=self.filter(content_type=ct).values_list('object_id', flat=True)
+            cls._base_manager.filter(pk__in=object_pks).exclude(
+                **{mod.visibility_column: new_visible}
             ).update(**{mod.visibility_column: new_visible})
 
-        mod.inform_users(
-            self.exclude(changed_by=None).select_related('changed_by__email')
-        )
+    def _apply_changed_objects(self, cls, mod, queryset):
+        '''Writes the moderated fields of the changed objects of queryset to
+        the moderated model instances, the latest one of each instance when
+        its history holds several
+        '''
+        fields = [
+            field.name
+            for field in mod.field_plan.moderated_fields
+            if field.concrete and not field.primary_key
+        ]
+        if not fields:
+            return
+
+        latest = {}
+        for moderated_object in queryset.select_for_update().order_by(
+            '-updated', '-pk'
+        ):
+            latest.setdefault(moderated_object.object_pk, moderated_object)
+        changed_objects = [
+            moderated_object.changed_object for moderated_object in latest.values()
+        ]
+        cls._base_manager.bulk_update(changed_objects, fields)
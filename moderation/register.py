@@ -1,18 +1,115 @@
+import copy
+import datetime
+import decimal
+import uuid
+from operator import attrgetter
+
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery
+from django.utils.encoding import force_str
 
 from .constants import (
     MODERATION_DRAFT_STATE,
     MODERATION_STATUS_APPROVED,
     MODERATION_STATUS_PENDING,
+    MODERATION_VISIBILITY_COLUMN,
 )
+from .diff import FieldPlan
+from .managers import UnmoderatedManagerMixin, get_moderation_queryset_class
 from .models import ModeratedObject
 from .moderator import GenericModerator
 
+# Field values of these types are recorded without copying them
+IMMUTABLE_TYPES = frozenset(
+    [
+        type(None),
+        bool,
+        int,
+        float,
+        str,
+        bytes,
+        decimal.Decimal,
+        datetime.date,
+        datetime.datetime,
+        datetime.time,
+        datetime.timedelta,
+        uuid.UUID,
+    ]
+)
+
 
 class RegistrationError(Exception):
     """Exception thrown when registration with Moderation goes wrong."""
 
 
+class ModeratedObjectDescriptor(object):
+    """
+    The moderated_object property of registered models, returns the latest
+    ModeratedObject of the instance. Supports prefetch_related(), see
+    prefetch_moderation()
+    """
+
+    cache_name = '_moderated_object'
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        if not self.is_cached(instance):
+            prefetched = getattr(instance, '_prefetched_objects_cache', {})
+            if '_relation_object' in prefetched:
+                moderated_object = max(
+                    prefetched['_relation_object'],
+                    key=attrgetter('updated'),
+                    default=None,
+                )
+            else:
+                moderated_object = (
+                    getattr(instance, '_relation_object').order_by('-updated').first()
+                )
+            # Cached when missing too, so it isn't looked up again
+            setattr(instance, self.cache_name, moderated_object)
+
+        moderated_object = getattr(instance, self.cache_name)
+        if moderated_object is None:
+            raise ModeratedObject.DoesNotExist(
+                "ModeratedObject matching query does not exist."
+            )
+        return moderated_object
+
+    def is_cached(self, instance):
+        return self.cache_name in instance.__dict__
+
+    def get_prefetch_queryset(self, instances, queryset=None):
+        if queryset is None:
+            queryset = ModeratedObject.objects.all()
+
+        content_type = ContentType.objects.get_for_model(instances[0].__class__)
+        queryset = queryset.filter(
+            content_type=content_type,
+            object_pk__in={instance.pk for instance in instances},
+        )
+        if connections[queryset.db].features.can_distinct_on_fields:
+            queryset = queryset.order_by('object_pk', '-updated').distinct('object_pk')
+        else:
+            latest = ModeratedObject.objects.filter(
+                content_type=content_type, object_pk=OuterRef('object_pk')
+            ).order_by('-updated')
+            queryset = queryset.filter(pk=Subquery(latest.values('pk')[:1]))
+
+        return (
+            queryset,
+            attrgetter('object_pk'),
+            attrgetter('pk'),
+            True,
+            self.cache_name,
+            True,
+        )
+
+
 class ModerationManagerSingleton(type):
     def __init__(cls, name, bases, dict):
         super().__init__(name, bases, dict)
@@ -55,6 +152,8 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
             # try/except/else block
             self._add_fields_to_model_class(moderator_class_instance)
             self._connect_signals(model_class)
+            if moderator_class_instance.track_changes:
+                self._connect_tracking_signals(model_class)
         except Exception:
             raise
         else:
@@ -66,6 +165,25 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         signals.pre_save.connect(self.pre_save_handler, sender=model_class)
         signals.post_save.connect(self.post_save_handler, sender=model_class)
 
+    def _connect_tracking_signals(self, model_class):
+        from django.db.models import signals
+
+        signals.post_init.connect(self.post_init_handler, sender=model_class)
+
+        # refresh_from_db() copies the values of another instance, the state
+        # recorded by post_init_handler() has to follow them
+        refresh_from_db = model_class.refresh_from_db
+        manager = self
+
+        def refresh_from_db_and_record_state(instance, using=None, fields=None):
+            refresh_from_db(instance, using=using, fields=fields)
+            manager._record_refreshed_state(instance, fields)
+
+        refresh_from_db_and_record_state.replaced = model_class.__dict__.get(
+            'refresh_from_db'
+        )
+        model_class.refresh_from_db = refresh_from_db_and_record_state
+
     def _add_moderated_object_to_class(self, model_class):
         if hasattr(model_class, '_relation_object'):
             relation_object = getattr(model_class, '_relation_object')
@@ -76,19 +194,7 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
 
         model_class.add_to_class('_relation_object', relation_object)
 
-        def get_moderated_object(self):
-            if not hasattr(self, '_moderated_object'):
-                if self._relation_object.count() > 0:
-                    self._moderated_object = (
-                        getattr(self, '_relation_object')
-                        .filter()
-                        .order_by('-updated')[0]
-                    )
-                else:
-                    self._moderated_object = getattr(self, '_relation_object').get()
-            return self._moderated_object
-
-        model_class.add_to_class('moderated_object', property(get_moderated_object))
+        model_class.add_to_class('moderated_object', ModeratedObjectDescriptor())
 
     def _add_moderated_status_to_class(self, model_class):
         # Add the moderation_object to the class if it hasn't been yet
@@ -96,6 +202,22 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
             self._add_moderated_object_to_class(model_class)
 
         def get_moderated_status(self):
+            if (
+                'moderation_status' in self.__dict__
+                and ModeratedObjectDescriptor.cache_name not in self.__dict__
+            ):
+                # Annotated by with_moderation_status()
+                if self.moderation_status is None:
+                    raise ModeratedObject.DoesNotExist(
+                        "ModeratedObject matching query does not exist."
+                    )
+                field = ModeratedObject._meta.get_field('status')
+                return force_str(
+                    dict(field.flatchoices).get(
+                        self.moderation_status, self.moderation_status
+                    ),
+                    strings_only=True,
+                )
             return self.moderated_object.get_status_display()
 
         model_class.add_to_class('moderated_status', property(get_moderated_status))
@@ -111,37 +233,53 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         moderation_manager_class = moderator_class_instance.moderation_manager_class
 
         for manager_name, mgr_class in base_managers:
-            if moderation_manager_class not in mgr_class.__bases__:
-                ModeratedManager = type(
-                    str('Moderated{}'.format(mgr_class.__name__)),
-                    (moderation_manager_class, mgr_class),
-                    {},
-                )
-
-                manager = ModeratedManager()
-
-                # We need to do this manually, because Django 1.10 doesn't
-                # easily let us remove or replace a manager, which is what
-                # we want to do. So instead of using the existing
-                # add_to_class/contribute_to_class functions, we just find
-                # the manager with the same name and swap it out for the
-                # new manager we created, then expire the class's cached
-                # properties.
-                manager_names = [m.name for m in model_class._meta.local_managers]
-                manager.name = manager_name
-                manager.model = model_class
-                try:
-                    manager_index = manager_names.index(manager_name)
-                except Exception:
-                    model_class._meta.local_managers = [manager]
-                else:
-                    model_class._meta.local_managers[manager_index] = manager
-                finally:
-                    model_class._meta._expire_cache()
+            # Like Manager.from_queryset(), with the moderation methods added
+            # to the queryset class of the manager
+            queryset_class = get_moderation_queryset_class(mgr_class._queryset_class)
+            if moderation_manager_class in mgr_class.__bases__:
+                if hasattr(model_class, 'unmoderated_{}'.format(manager_name)):
+                    # Inherited from a registered parent model, which built
+                    # its moderated and unmoderated managers already
+                    continue
+                # Declared by the model, it only needs the moderation
+                # methods of its querysets and an unmoderated manager
+                moderated_bases = (mgr_class,)
+            else:
+                moderated_bases = (moderation_manager_class, mgr_class)
+            ModeratedManager = type(
+                str('Moderated{}'.format(mgr_class.__name__)),
+                moderated_bases,
+                {'_queryset_class': queryset_class},
+            )
 
-                model_class.add_to_class(
-                    'unmoderated_{}'.format(manager_name), mgr_class()
+            manager = ModeratedManager()
+
+            # We need to do this manually, because Django 1.10 doesn't
+            # easily let us remove or replace a manager, which is what
+            # we want to do. So instead of using the existing
+            # add_to_class/contribute_to_class functions, we just find
+            # the manager with the same name and swap it out for the
+            # new manager we created, then expire the class's cached
+            # properties.
+            manager_names = [m.name for m in model_class._meta.local_managers]
+            manager.name = manager_name
+            manager.model = model_class
+            try:
+                manager_index = manager_names.index(manager_name)
+            except Exception:
+                model_class._meta.local_managers = [manager]
+            else:
+                model_class._meta.local_managers[manager_index] = manager
+            finally:
+                model_class._meta._expire_cache()
+
+            if not issubclass(mgr_class, UnmoderatedManagerMixin):
+                mgr_class = type(
+                    str('Unmoderated{}'.format(mgr_class.__name__)),
+                    (UnmoderatedManagerMixin, mgr_class),
+                    {'_queryset_class': queryset_class},
                 )
+            model_class.add_to_class('unmoderated_{}'.format(manager_name), mgr_class())
         unmoderated_manager = getattr(
             model_class, 'unmoderated_{}'.format(model_class._default_manager.name)
         )
@@ -150,6 +288,32 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         self._add_moderated_object_to_class(model_class)
         self._add_moderated_status_to_class(model_class)
 
+        if moderator_class_instance.auto_visibility_column:
+            self._use_visibility_column(moderator_class_instance)
+
+    def _use_visibility_column(self, moderator_class_instance):
+        """Makes the moderator use the moderation_visible column declared on
+        the model, kept in sync by moderation and used by the moderated
+        managers instead of querying ModeratedObject.
+
+        Models without the column keep querying ModeratedObject, the
+        moderation.E001 system check reports them.
+        """
+        model_class = moderator_class_instance.model_class
+        try:
+            field = model_class._meta.get_field(MODERATION_VISIBILITY_COLUMN)
+        except FieldDoesNotExist:
+            return
+        if not isinstance(field, models.BooleanField):
+            return
+
+        # The column is moderation state, not a moderated field
+        moderator_class_instance.visibility_column = MODERATION_VISIBILITY_COLUMN
+        moderator_class_instance.fields_exclude.append(MODERATION_VISIBILITY_COLUMN)
+        moderator_class_instance.field_plan = FieldPlan(
+            model_class, moderator_class_instance.fields_exclude
+        )
+
     def unregister(self, model_class):
         """Unregister model class from moderation"""
         moderator_instance = self._registered_models[model_class]
@@ -188,6 +352,9 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
 
         for m in managers:
             m.name = m.name.replace('unmoderated_', '')
+            if isinstance(m, UnmoderatedManagerMixin):
+                # Restore the class of the manager before registration
+                m.__class__ = m.__class__.__bases__[1]
 
         model_class._meta.local_managers = managers
 
@@ -200,6 +367,86 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
 
         signals.pre_save.disconnect(self.pre_save_handler, model_class)
         signals.post_save.disconnect(self.post_save_handler, model_class)
+        signals.post_init.disconnect(self.post_init_handler, model_class)
+
+        refresh_from_db = model_class.__dict__.get('refresh_from_db')
+        if hasattr(refresh_from_db, 'replaced'):
+            if refresh_from_db.replaced is None:
+                del model_class.refresh_from_db
+            else:
+                model_class.refresh_from_db = refresh_from_db.replaced
+
+    def post_init_handler(self, sender, instance, **kwargs):
+        """
+        Records the field values of instance, used as its unchanged state
+        on the next save by moderators with track_changes
+        """
+        self._record_state(instance)
+
+    def _record_state(self, instance, obj=None):
+        """
+        Records the field values of obj, by default of instance itself, as the
+        values of instance stored in the database
+        """
+        if obj is None:
+            obj = instance
+        data = obj.__dict__
+        instance._moderation_state = {
+            field.attname: (
+                value if type(value) in IMMUTABLE_TYPES else copy.deepcopy(value)
+            )
+            for field, value in (
+                (field, data[field.attname])
+                for field in instance._meta.concrete_fields
+                if field.attname in data
+            )
+        }
+
+    def _record_refreshed_state(self, instance, fields):
+        """
+        Records the field values of instance reloaded by refresh_from_db(),
+        all of its loaded fields when fields is None
+        """
+        if fields is None:
+            self._record_state(instance)
+            return
+
+        state = instance.__dict__.get('_moderation_state')
+        if state is None:
+            return
+
+        data = instance.__dict__
+        for field in instance._meta.concrete_fields:
+            if (field.name in fields or field.attname in fields) and (
+                field.attname in data
+            ):
+                value = data[field.attname]
+                state[field.attname] = (
+                    value if type(value) in IMMUTABLE_TYPES else copy.deepcopy(value)
+                )
+
+    def _get_tracked_object(self, instance):
+        """
+        Returns instance of the model built from the recorded state of
+        instance, or None when the state isn't complete or doesn't belong
+        to the row of instance
+        """
+        state = instance.__dict__.get('_moderation_state')
+        opts = instance._meta
+        if (
+            state is None
+            or instance._state.db is None
+            or len(state) != len(opts.concrete_fields)
+            or state[opts.pk.attname] != instance.pk
+        ):
+            return None
+
+        obj = instance.__class__(
+            *[state[field.attname] for field in opts.concrete_fields]
+        )
+        obj._state.adding = False
+        obj._state.db = instance._state.db
+        return obj
 
     def pre_save_handler(self, sender, instance, **kwargs):
         """
@@ -210,6 +457,9 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         if kwargs['raw']:
             return
 
+        # Forget a lookup left by a save that didn't reach post_save
+        instance.__dict__.pop('_moderated_object_lookup', None)
+
         unchanged_obj = self._get_unchanged_object(instance)
         moderator = self.get_moderator(sender)
         if unchanged_obj:
@@ -221,10 +471,17 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
                 or moderator.bypass_moderation_after_approval
             ):
                 moderated_obj.save()
+                # The saved object is what post_save_handler would look up,
+                # unlike a fetched one it would save content_object again
+                moderated_obj.instance = None
+                instance._moderated_object_lookup = moderated_obj
 
     def _get_unchanged_object(self, instance):
         if instance.pk is None:
             return None
+        tracked_obj = self._get_tracked_object(instance)
+        if tracked_obj is not None:
+            return tracked_obj
         pk = instance.pk
         try:
             unchanged_obj = instance.__class__._default_unmoderated_manager.get(pk=pk)
@@ -237,11 +494,8 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         Returns the unchanged object with the excluded fields updated to
         those from the instance.
         """
-        excludes = moderator.fields_exclude
-        for field in instance._meta.fields:
-            if field.name in excludes:
-                value = getattr(instance, field.name)
-                setattr(unchanged_obj, field.name, value)
+        for attname in moderator.field_plan.excluded_attnames:
+            setattr(unchanged_obj, attname, getattr(instance, attname))
 
         return unchanged_obj
 
@@ -265,6 +519,15 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
             #         get_for_instance(instance)
 
             moderated_object = ModeratedObject.objects.get_for_instance(instance)
+            field = ModeratedObject._meta.get_field('changed_object')
+            if not field.has_snapshot(moderated_object):
+                # Created by moderation_backfill --no-snapshot, the row is
+                # still the approved version until this save
+                moderated_object.changed_object = copy.copy(unchanged_obj)
+                moderated_object.save()
+            # Passed to post_save_handler unless pre_save_handler saves a
+            # newer state, copied before the changed_object is replaced below
+            instance._moderated_object_lookup = copy.copy(moderated_object)
             if moderated_object is None:
                 moderated_object = get_new_instance(unchanged_obj)
             elif moderator.keep_history and moderated_object.has_object_been_changed(
@@ -272,7 +535,12 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
             ):
                 # We're keeping history and this isn't an update of an existing
                 # moderation
+                base = moderated_object
                 moderated_object = get_new_instance(unchanged_obj)
+                if moderator.delta_snapshots:
+                    ModeratedObject._meta.get_field('changed_object').set_delta_base(
+                        moderated_object, base
+                    )
 
         except ModeratedObject.DoesNotExist:
             moderated_object = get_new_instance(unchanged_obj)
@@ -315,17 +583,32 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
         pk = instance.pk
         moderator = self.get_moderator(sender)
 
+        if moderator.track_changes:
+            # The database holds the values of instance, unless they are
+            # reverted below
+            self._record_state(instance)
+
         if kwargs['created']:
-            old_object = sender._default_unmoderated_manager.get(pk=pk)
+            old_object = None
+            if moderator.track_changes:
+                old_object = self._get_tracked_object(instance)
+            if old_object is None:
+                old_object = sender._default_unmoderated_manager.get(pk=pk)
             moderated_obj = ModeratedObject(content_object=old_object)
             if not moderator.visible_until_rejected:
                 # Hide it by placing in draft state
                 moderated_obj.state = MODERATION_DRAFT_STATE
             moderated_obj.save()
+            moderated_obj.instance = None
+            instance._moderated_object = moderated_obj
             moderator.inform_moderator(instance)
             return
 
-        moderated_obj = ModeratedObject.objects.get_for_instance(instance)
+        # Looked up by pre_save_handler during this save
+        moderated_obj = instance.__dict__.pop('_moderated_object_lookup', None)
+        if moderated_obj is None:
+            moderated_obj = ModeratedObject.objects.get_for_instance(instance)
+        instance._moderated_object = moderated_obj
 
         if (
             moderated_obj.status == MODERATION_STATUS_APPROVED
@@ -343,6 +626,8 @@ class ModerationManager(metaclass=ModerationManagerSingleton):
                 # Save instance with old data from changed_object, undoing
                 # the changes that save() just saved to the database.
                 moderated_obj.changed_object.save_base(raw=True)
+                if moderator.track_changes:
+                    self._record_state(instance, moderated_obj.changed_object)
 
                 # Save the new data in moderated_object, so it will be applied
                 # to the real record when the moderator approves the change.
@@ -0,0 +1,281 @@
+"""Declarative auto moderation rules, see GenericModerator.auto_moderation_rules.
+
+Rules are evaluated for single objects by is_auto_reject() and
+is_auto_approve() of the moderator, and for whole querysets of pending
+moderated objects by ModeratedObjectQuerySet.apply_rules(), which evaluates
+the conditions it can in the database.
+"""
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Exists, OuterRef, Q
+
+from .codec import to_json_value
+from .constants import MODERATION_STATUS_APPROVED, MODERATION_STATUS_REJECTED
+from .groups import get_groups_field, is_user_in_groups
+
+
+def is_known_user(user):
+    return user is not None and not user.is_anonymous
+
+
+class Condition(object):
+    """Condition of a rule, combined with ``&``, ``|`` and ``~``"""
+
+    # Whether the condition looks at the fields of the changed object
+    uses_object = False
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def check(self, model_class):
+        """Raises FieldDoesNotExist if the condition doesn't apply to
+        model_class
+        """
+
+    def matches(self, obj, user):
+        """Returns True if the change of obj by user meets the condition"""
+        raise NotImplementedError
+
+    def as_q(self, moderator, snapshot_field):
+        """Returns Q matching the pending ModeratedObjects that meet the
+        condition, or None if it can't be evaluated in the database.
+        snapshot_field is the changed_object field of ModeratedObject.
+        """
+        return None
+
+
+class UserFlag(Condition):
+    """Boolean attribute of the user who made the change, ex.
+    UserFlag('is_staff'). Never met by anonymous users.
+    """
+
+    def __init__(self, name, value=True):
+        self.name = name
+        self.value = value
+
+    def matches(self, obj, user):
+        return is_known_user(user) and getattr(user, self.name, None) == self.value
+
+    def as_q(self, moderator, snapshot_field):
+        try:
+            get_user_model()._meta.get_field(self.name)
+        except FieldDoesNotExist:
+            # A property of the user model
+            return None
+        return Q(**{'changed_by__%s' % self.name: self.value})
+
+
+class InGroup(Condition):
+    """The user who made the change belongs to one of the groups"""
+
+    def __init__(self, *names):
+        self.names = frozenset(names)
+
+    def matches(self, obj, user):
+        return is_known_user(user) and is_user_in_groups(user, self.names)
+
+    def as_q(self, moderator, snapshot_field):
+        groups_field = get_groups_field()
+        if groups_field is None:
+            # Users without groups are in none
+            return Q(pk__in=[])
+        memberships = groups_field.remote_field.through.objects.filter(
+            user=OuterRef('changed_by'), group__name__in=self.names
+        )
+        return Q(Exists(memberships))
+
+
+class FieldCondition(Condition):
+    uses_object = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def check(self, model_class):
+        model_class._meta.get_field(self.name)
+
+    def get_value(self, obj):
+        """Returns value of the field of obj in the form it is stored in
+        snapshots, foreign keys are compared by their raw ids
+        """
+        value = obj._meta.get_field(self.name).value_from_object(obj)
+        return None if value is None else to_json_value(value)
+
+    def as_q(self, moderator, snapshot_field):
+        if moderator.visible_until_rejected or snapshot_field.storage != 'json':
+            # The pending version isn't in the snapshot, or the snapshot
+            # can't be queried
+            return None
+        return Q(**{self.lookup(snapshot_field): self.lookup_value()})
+
+    def lookup(self, snapshot_field):
+        raise NotImplementedError
+
+    def lookup_value(self):
+        raise NotImplementedError
+
+
+class FieldEquals(FieldCondition):
+    """Field of the changed object equals value"""
+
+    def __init__(self, name, value):
+        super().__init__(name)
+        self.value = None if value is None else to_json_value(value)
+
+    def matches(self, obj, user):
+        return self.get_value(obj) == self.value
+
+    def lookup(self, snapshot_field):
+        return '%s__fields__%s' % (snapshot_field.json_field, self.name)
+
+    def lookup_value(self):
+        return self.value
+
+
+class FieldMatches(FieldCondition):
+    """Text of a field of the changed object matches the regular expression
+    pattern, searched anywhere in the text. In the database the pattern is
+    evaluated by the regular expression support of the backend, so only use
+    syntax common to Python and the database.
+    """
+
+    def __init__(self, name, pattern, ignore_case=False):
+        super().__init__(name)
+        self.pattern = pattern
+        self.ignore_case = ignore_case
+        self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+
+    def matches(self, obj, user):
+        value = self.get_value(obj)
+        return value is not None and self.regex.search(str(value)) is not None
+
+    def lookup(self, snapshot_field):
+        return '%s__fields__%s__%s' % (
+            snapshot_field.json_field,
+            self.name,
+            'iregex' if self.ignore_case else 'regex',
+        )
+
+    def lookup_value(self):
+        return self.pattern
+
+
+class All(Condition):
+    """All of the conditions are met"""
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+        self.uses_object = any(condition.uses_object for condition in conditions)
+
+    def check(self, model_class):
+        for condition in self.conditions:
+            condition.check(model_class)
+
+    def matches(self, obj, user):
+        return all(condition.matches(obj, user) for condition in self.conditions)
+
+    def combine(self, q1, q2):
+        return q1 & q2
+
+    def as_q(self, moderator, snapshot_field):
+        combined = None
+        for condition in self.conditions:
+            q = condition.as_q(moderator, snapshot_field)
+            if q is None:
+                return None
+            combined = q if combined is None else self.combine(combined, q)
+        return combined
+
+
+class Any(All):
+    """Any of the conditions is met"""
+
+    def matches(self, obj, user):
+        return any(condition.matches(obj, user) for condition in self.conditions)
+
+    def combine(self, q1, q2):
+        return q1 | q2
+
+
+class Not(Condition):
+    """The condition isn't met"""
+
+    def __init__(self, condition):
+        self.condition = condition
+        self.uses_object = condition.uses_object
+
+    def check(self, model_class):
+        self.condition.check(model_class)
+
+    def matches(self, obj, user):
+        return not self.condition.matches(obj, user)
+
+    def as_q(self, moderator, snapshot_field):
+        q = self.condition.as_q(moderator, snapshot_field)
+        return None if q is None else ~q
+
+
+class Rule(object):
+    """Moderates changes meeting condition with status, for reason"""
+
+    status = None
+    default_reason = None
+
+    def __init__(self, condition, reason=None):
+        self.condition = condition
+        self.reason = reason or self.default_reason
+
+
+class Approve(Rule):
+    status = MODERATION_STATUS_APPROVED
+    default_reason = 'Auto-approved: Rule'
+
+
+class Reject(Rule):
+    status = MODERATION_STATUS_REJECTED
+    default_reason = 'Auto-rejected: Rule'
+
+
+class RulePlan(object):
+    """Auto moderation rules of a moderator, checked against its model and
+    split by status once, when the moderator is created. Reject rules are
+    evaluated before approve rules, each in the order they are declared.
+    """
+
+    def __init__(self, model_class, rules=()):
+        for rule in rules:
+            rule.condition.check(model_class)
+
+        self.reject_rules = tuple(
+            rule for rule in rules if rule.status == MODERATION_STATUS_REJECTED
+        )
+        self.approve_rules = tuple(
+            rule for rule in rules if rule.status == MODERATION_STATUS_APPROVED
+        )
+        self.rules = self.reject_rules + self.approve_rules
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, status, obj, user):
+        """Returns the first rule moderating with status the change of obj
+        by user, or None
+        """
+        rules = (
+            self.reject_rules
+            if status == MODERATION_STATUS_REJECTED
+            else self.approve_rules
+        )
+        for rule in rules:
+            if rule.condition.matches(obj, user):
+                return rule
+        return None
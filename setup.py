@@ -5,13 +5,13 @@ import os
 version = __import__('moderation').__version__
 
 tests_require = [
-    'django>=2.2',
+    'django>=3.1',
     'django-webtest',
     'webtest',
     'pillow',
 ]
 
-install_requires = ['django>=2.2']
+install_requires = ['django>=3.1']
 
 setup(
     name='django-moderation',
@@ -33,7 +33,6 @@ setup(
         'Programming Language :: Python :: 3.9',
         'Programming Language :: Python :: 3 :: Only',
         'Framework :: Django',
-        'Framework :: Django :: 2.2',
         'Framework :: Django :: 3.1',
         'Framework :: Django :: 3.2',
     ],
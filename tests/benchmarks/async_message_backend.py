@@ -0,0 +1,109 @@
+"""
+Throughput of the synchronous and asynchronous email message backends.
+
+Sends --messages messages through EmailMessageBackend and
+AsyncEmailMessageBackend with a locmem email backend that sleeps --latency
+milliseconds per connection and per message, standing in for an SMTP server.
+Prints the time the callers were blocked and the time until every message
+was delivered.
+
+usage:
+
+    python -m tests.benchmarks.async_message_backend [--messages 200] [--latency 20]
+
+"""
+
+import sys
+import time
+from optparse import OptionParser
+from os.path import abspath, dirname
+
+from django.core.mail.backends.locmem import EmailBackend
+
+LATENCY = 0.02
+
+
+class SlowEmailBackend(EmailBackend):
+    """Connects like the SMTP backend, once per connection until closed"""
+
+    connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        time.sleep(LATENCY)
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        time.sleep(LATENCY * len(messages))
+        sent = super().send_messages(messages)
+        if new_connection:
+            self.close()
+        return sent
+
+
+def main(messages, latency):
+    global LATENCY
+    LATENCY = latency / 1000.0
+
+    from django.conf import settings
+    from django.core import mail
+
+    from moderation.message_backends import (
+        AsyncEmailMessageBackend,
+        EmailMessageBackend,
+    )
+
+    kwargs = {
+        'subject': 'Subject',
+        'message': 'Message',
+        'recipient_list': ['moderator@example.com'],
+    }
+
+    results = {}
+    settings.EMAIL_BACKEND = '%s.SlowEmailBackend' % __name__
+    for name, backend_class in [
+        ('EmailMessageBackend', EmailMessageBackend),
+        ('AsyncEmailMessageBackend', AsyncEmailMessageBackend),
+    ]:
+        mail.outbox = []
+        backend = backend_class()
+
+        start = time.perf_counter()
+        for i in range(messages):
+            backend.send(**kwargs)
+        blocked = time.perf_counter() - start
+        if hasattr(backend_class, 'shutdown'):
+            backend_class.shutdown()
+        delivered = time.perf_counter() - start
+
+        assert len(mail.outbox) == messages
+        results[name] = delivered
+        print(
+            '%-25s blocked %6.2fs, delivered in %6.2fs (%d messages/s)'
+            % (name, blocked, delivered, messages / delivered)
+        )
+
+    speedup = results['EmailMessageBackend'] / results['AsyncEmailMessageBackend']
+    print(
+        'speedup: %.1fx (%d workers)' % (speedup, AsyncEmailMessageBackend.max_workers)
+    )
+    return speedup
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--messages', type='int', default=200, dest='messages')
+    parser.add_option('--latency', type='float', default=20, dest='latency')
+    options, args = parser.parse_args()
+
+    sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+    import runtests  # noqa: configures settings
+
+    runtests.prepare_test_runner()
+    main(options.messages, options.latency)
@@ -0,0 +1,149 @@
+"""
+Query plans of the ModeratedObject hot queries on a large table.
+
+Fills the moderation_moderatedobject table of a test database with --rows
+rows, then prints the plan and the best time of each query, first with the
+composite indexes of ModeratedObject.Meta.indexes and then without them.
+
+usage:
+
+    python -m tests.benchmarks.moderated_object_indexes [--rows 1000000]
+
+"""
+
+import datetime
+import sys
+import timeit
+from optparse import OptionParser
+from os.path import abspath, dirname
+
+CONTENT_TYPES = 5
+
+
+def fill_table(rows, batch_size=10000):
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connection, transaction
+
+    from moderation.constants import (
+        MODERATION_STATUS_APPROVED,
+        MODERATION_STATUS_PENDING,
+        MODERATION_STATUS_REJECTED,
+    )
+    from moderation.models import ModeratedObject
+
+    content_type_ids = list(
+        ContentType.objects.order_by('pk').values_list('pk', flat=True)
+    )[:CONTENT_TYPES]
+    statuses = [
+        MODERATION_STATUS_APPROVED,
+        MODERATION_STATUS_APPROVED,
+        MODERATION_STATUS_REJECTED,
+        MODERATION_STATUS_PENDING,
+    ]
+    start = datetime.datetime(2020, 1, 1)
+
+    opts = ModeratedObject._meta
+    columns = [
+        'content_type_id',
+        'object_pk',
+        'created',
+        'updated',
+        'state',
+        'status',
+        'changed_object',
+    ]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, rows, batch_size):
+            params = []
+            for i in range(offset, min(offset + batch_size, rows)):
+                created = start + datetime.timedelta(seconds=i)
+                params.append(
+                    (
+                        content_type_ids[i % len(content_type_ids)],
+                        # A few moderations per object
+                        i // (len(content_type_ids) * 3),
+                        created,
+                        created,
+                        1,
+                        statuses[i % len(statuses)],
+                        '',
+                    )
+                )
+            cursor.executemany(sql, params)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return content_type_ids
+
+
+def get_queries(content_type_id, object_pk):
+    from moderation.constants import MODERATION_STATUS_PENDING
+    from moderation.models import ModeratedObject
+
+    return [
+        (
+            'get_for_instance',
+            ModeratedObject.objects.filter(
+                object_pk=object_pk, content_type=content_type_id
+            ).order_by('-updated')[:1],
+        ),
+        ('admin queue', ModeratedObject.objects.order_by('status', 'created')[:100]),
+        (
+            'admin queue by content type',
+            ModeratedObject.objects.filter(
+                content_type=content_type_id, status=MODERATION_STATUS_PENDING
+            ).order_by('created')[:100],
+        ),
+    ]
+
+
+def run_queries(content_type_id, object_pk, number):
+    for name, queryset in get_queries(content_type_id, object_pk):
+        best = min(timeit.repeat(lambda: list(queryset.all()), number=number, repeat=3))
+        print('%s: %.3f ms' % (name, best / number * 1000))
+        for line in queryset.explain().splitlines():
+            print('    %s' % line)
+
+
+def main(rows, number):
+    from django.db import connection
+
+    from moderation.models import ModeratedObject
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        content_type_ids = fill_table(rows)
+        print('%d rows\n' % rows)
+        content_type_id, object_pk = content_type_ids[0], rows // 30
+
+        print('with composite indexes:')
+        run_queries(content_type_id, object_pk, number)
+
+        with connection.schema_editor() as schema_editor:
+            for index in ModeratedObject._meta.indexes:
+                schema_editor.remove_index(ModeratedObject, index)
+
+        print('\nwithout composite indexes:')
+        run_queries(content_type_id, object_pk, number)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--rows', type='int', default=1000000, dest='rows')
+    parser.add_option('--number', type='int', default=20, dest='number')
+    options, args = parser.parse_args()
+
+    sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+    import runtests  # noqa: configures settings
+
+    runtests.prepare_test_runner()
+    main(options.rows, options.number)
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of snapshot round-trips through SerializedObjectField.
+
+Compares the precompiled SnapshotCodec with the django.core.serializers
+based implementation it replaced, on a wide model.
+
+usage:
+
+    python -m tests.benchmarks.snapshot_codec [--fields 40] [--number 2000]
+
+"""
+
+import datetime
+import decimal
+import sys
+import timeit
+from optparse import OptionParser
+from os.path import abspath, dirname
+
+
+def build_wide_model(width):
+    from django.conf import settings
+    from django.db import models
+
+    field_types = [
+        lambda: models.CharField(max_length=100, default='value'),
+        lambda: models.IntegerField(default=1),
+        lambda: models.DateTimeField(default=datetime.datetime(2020, 1, 1, 12)),
+        lambda: models.DecimalField(
+            max_digits=10, decimal_places=2, default=decimal.Decimal('9.99')
+        ),
+        lambda: models.BooleanField(default=True),
+        lambda: models.TextField(default='lorem ipsum ' * 20),
+    ]
+    attrs = {
+        '__module__': 'tests.models',
+        'Meta': type('Meta', (), {'app_label': 'tests'}),
+        'owner': models.ForeignKey(
+            settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+'
+        ),
+    }
+    for i in range(width):
+        attrs['field_%d' % i] = field_types[i % len(field_types)]()
+
+    return type('BenchmarkWideModel', (models.Model,), attrs)
+
+
+def main(width, number):
+    from moderation.fields import SerializedObjectField
+
+    model_class = build_wide_model(width)
+    instance = model_class(pk=1, owner_id=1)
+    field = SerializedObjectField()
+
+    def codec_round_trip():
+        field._deserialize(field._serialize(instance))
+
+    def serializers_round_trip():
+        field._deserialize_with_serializers(field._serialize_with_serializers(instance))
+
+    results = {}
+    for name, func in [
+        ('django.core.serializers', serializers_round_trip),
+        ('SnapshotCodec', codec_round_trip),
+    ]:
+        func()  # warm up caches
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        results[name] = best
+        print('%-25s %8.1f us per round-trip' % (name, best / number * 1000000))
+
+    speedup = results['django.core.serializers'] / results['SnapshotCodec']
+    print('speedup: %.1fx (%d fields)' % (speedup, width + 2))
+    return speedup
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--fields', type='int', default=40, dest='fields')
+    parser.add_option('--number', type='int', default=2000, dest='number')
+    options, args = parser.parse_args()
+
+    sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+    import runtests  # noqa: configures settings
+
+    runtests.prepare_test_runner()
+    main(options.fields, options.number)
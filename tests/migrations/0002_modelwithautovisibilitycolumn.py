@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelWithAutoVisibilityColumn',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('test', models.CharField(max_length=20)),
+                (
+                    'moderation_visible',
+                    models.BooleanField(db_index=True, default=False, editable=False),
+                ),
+            ],
+        ),
+    ]
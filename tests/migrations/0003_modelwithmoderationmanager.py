@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0002_modelwithautovisibilitycolumn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelWithModerationManager',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('slug', models.SlugField(unique=True)),
+            ],
+        ),
+    ]
@@ -1,11 +1,14 @@
 """
 Test models used in django-moderation tests
 """
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models.manager import Manager
 
+from moderation.managers import ModerationObjectsManager
+
 
 class UserProfile(models.Model):
     user = models.ForeignKey(
@@ -52,6 +55,16 @@ class ModelWithMultipleManagers(models.Model):
     women = WomenManager()
 
 
+class SlugModerationManager(ModerationObjectsManager):
+    pass
+
+
+class ModelWithModerationManager(models.Model):
+    slug = models.SlugField(unique=True)
+    # Already a moderation manager before the model is registered
+    objects = SlugModerationManager()
+
+
 class ModelWithDateField(models.Model):
     date = models.DateField(auto_now=True)
 
@@ -64,6 +77,17 @@ class ModelWithVisibilityField(models.Model):
         return '%s - is public %s' % (self.test, self.is_public)
 
 
+class ModelWithAutoVisibilityColumn(models.Model):
+    test = models.CharField(max_length=20)
+    # Used by moderators with auto_visibility_column = True
+    moderation_visible = models.BooleanField(
+        default=False, db_index=True, editable=False
+    )
+
+    def __str__(self):
+        return self.test
+
+
 class ModelWithWrongVisibilityField(models.Model):
     test = models.CharField(max_length=20)
     is_public = models.IntegerField()
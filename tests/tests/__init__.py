@@ -5,6 +5,7 @@ from .unit.testadmin import *
 from .unit.testdiff import *
 from .unit.testforms import *
 from .unit.testmoderator import *
+from .unit.testcommands import *
 from .regression import *
 from .acceptance.testexclude import *
 from .acceptance.testauto_discover import *
@@ -2,6 +2,7 @@ from unittest import mock
 
 from django.contrib.admin.sites import site
 from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
 from django.test.testcases import TestCase
 from django.urls import reverse
 
@@ -19,6 +20,7 @@ from moderation.constants import (
 )
 from moderation.models import ModeratedObject
 from moderation.moderator import GenericModerator
+from moderation.signals import pre_many_moderation
 from tests.models import (
     Book,
     ModelWithSlugField,
@@ -128,6 +130,50 @@ class AdminActionsTestCase(TestCase):
         for obj in ModeratedObject.objects.all():
             self.assertEqual(obj.status, MODERATION_STATUS_REJECTED)
 
+    def test_actions_moderate_in_batches(self):
+        batches = []
+
+        def handler(sender, queryset, **kwargs):
+            batches.append(queryset.count())
+
+        self.admin.bulk_batch_size = 2
+        pre_many_moderation.connect(handler)
+        try:
+            approve_objects(self.admin, self.request, self.moderated_objects)
+        finally:
+            pre_many_moderation.disconnect(handler)
+
+        count = ModeratedObject.objects.count()
+        self.assertEqual(sum(batches), count)
+        self.assertEqual(len(batches), (count + 1) // 2)
+        self.assertEqual(
+            set(ModeratedObject.objects.values_list('status', flat=True)),
+            {MODERATION_STATUS_APPROVED},
+        )
+
+    def test_approve_objects_applies_latest_change(self):
+        class HistoryModerator(GenericModerator):
+            notify_moderator = False
+            keep_history = True
+
+        self.moderation.register(ModelWithSlugField, HistoryModerator)
+        obj = ModelWithSlugField.unmoderated_objects.create(slug='created')
+        ModeratedObject.objects.get_for_instance(obj).approve(by=self.request.user)
+        for slug in ['first', 'second', 'third']:
+            obj.slug = slug
+            obj.save()
+
+        approve_objects(
+            self.admin,
+            self.request,
+            ModeratedObject.objects.filter(
+                content_type=ContentType.objects.get_for_model(ModelWithSlugField),
+                status=MODERATION_STATUS_PENDING,
+            ),
+        )
+
+        self.assertEqual(ModelWithSlugField.objects.get(pk=obj.pk).slug, 'third')
+
     def test_set_objects_as_pending(self):
         for obj in self.moderated_objects:
             obj.approve(by=self.request.user)
@@ -0,0 +1,730 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail, management
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test.testcases import TestCase
+from django.utils import timezone
+
+from moderation.constants import (
+    MODERATION_READY_STATE,
+    MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_PENDING,
+    MODERATION_STATUS_REJECTED,
+)
+from moderation.management.commands import moderate
+from moderation.message_backends import OutboxMessageBackend
+from moderation.models import (
+    ArchivedModeratedObject,
+    ModeratedObject,
+    NotificationOutbox,
+)
+from moderation.moderator import GenericModerator
+from tests.models import (
+    ModelWithAutoVisibilityColumn,
+    ModelWithSlugField,
+    ModelWithSlugField2,
+    UserProfile,
+)
+from tests.utils import moderate_workers, setup_moderation, teardown_moderation
+
+
+class ConvertSnapshotsCommandTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        for description in ['First', 'Second', 'Third']:
+            self.profile.description = description
+            ModeratedObject(content_object=self.profile).save()
+
+    def call_command(self, storage='text', compress=None, **options):
+        with mock.patch.object(self.field, 'storage', storage):
+            with mock.patch.object(self.field, 'compress', compress):
+                management.call_command(
+                    'moderation_convert_snapshots',
+                    batch_size=2,
+                    stdout=StringIO(),
+                    **options,
+                )
+
+    def get_descriptions(self):
+        return [
+            moderated_object.changed_object.description
+            for moderated_object in ModeratedObject.objects.order_by('pk')
+        ]
+
+    def test_convert_to_json_storage(self):
+        self.call_command('json')
+
+        rows = ModeratedObject.objects.order_by('pk').values_list(
+            'changed_object', 'changed_object_json'
+        )
+        self.assertEqual(
+            [(value, snapshot['fields']['description']) for value, snapshot in rows],
+            [('', 'First'), ('', 'Second'), ('', 'Third')],
+        )
+
+    def test_convert_back_to_text_storage(self):
+        self.call_command('json')
+        self.call_command('text')
+
+        self.assertFalse(
+            ModeratedObject.objects.filter(changed_object_json__isnull=False)
+        )
+        self.assertEqual(self.get_descriptions(), ['First', 'Second', 'Third'])
+
+    def test_compress(self):
+        self.call_command(compress='zlib')
+
+        self.assertFalse(ModeratedObject.objects.exclude(changed_object=''))
+        self.assertEqual(
+            ModeratedObject.objects.filter(changed_object_data__isnull=False).count(),
+            3,
+        )
+        self.assertEqual(self.get_descriptions(), ['First', 'Second', 'Third'])
+
+    def test_recompress_all(self):
+        self.call_command(compress='zlib')
+        self.call_command(compress='bz2', all=True)
+
+        for data in ModeratedObject.objects.values_list(
+            'changed_object_data', flat=True
+        ):
+            self.assertTrue(bytes(data).startswith(b'bz2:'))
+        self.assertEqual(self.get_descriptions(), ['First', 'Second', 'Third'])
+
+
+class BackfillVisibilityCommandTestCase(TestCase):
+    def setUp(self):
+        # Created before the model was moderated
+        self.unmoderated = ModelWithAutoVisibilityColumn.objects.create(test='Old')
+
+        class AutoVisibilityModerator(GenericModerator):
+            auto_visibility_column = True
+            notify_moderator = False
+
+        setup_moderation([(ModelWithAutoVisibilityColumn, AutoVisibilityModerator)])
+        self.draft = ModelWithAutoVisibilityColumn.objects.create(test='Draft')
+        self.ready = ModelWithAutoVisibilityColumn.objects.create(test='Ready')
+        self.rejected = ModelWithAutoVisibilityColumn.objects.create(test='Rejected')
+        ModeratedObject.objects.filter(object_pk=self.ready.pk).update(
+            state=MODERATION_READY_STATE
+        )
+        ModeratedObject.objects.filter(object_pk=self.rejected.pk).update(
+            state=MODERATION_READY_STATE, status=MODERATION_STATUS_REJECTED
+        )
+        ModelWithAutoVisibilityColumn.unmoderated_objects.update(
+            moderation_visible=False
+        )
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def test_backfill(self):
+        management.call_command(
+            'moderation_backfill_visibility',
+            'tests.ModelWithAutoVisibilityColumn',
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            set(ModelWithAutoVisibilityColumn.objects.values_list('test', flat=True)),
+            {'Old', 'Ready'},
+        )
+
+
+class BackfillCommandTestCase(TestCase):
+    def setUp(self):
+        class Moderator(GenericModerator):
+            notify_moderator = False
+
+        # Created before the model was moderated
+        self.objects = [
+            ModelWithSlugField.objects.create(slug='slug%d' % i) for i in range(5)
+        ]
+        setup_moderation([(ModelWithSlugField, Moderator)])
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def call_command(self, *args, **options):
+        stdout = StringIO()
+        management.call_command(
+            'moderation_backfill', *args, batch_size=2, stdout=stdout, **options
+        )
+        return stdout.getvalue()
+
+    def test_backfill(self):
+        pending = ModelWithSlugField.objects.create(slug='pending')
+
+        output = self.call_command('tests.ModelWithSlugField')
+
+        self.assertIn('tests.ModelWithSlugField: created 5 moderated objects', output)
+        self.assertEqual(ModelWithSlugField.objects.count(), 5)
+        moderated_object = ModeratedObject.objects.get_for_instance(self.objects[0])
+        self.assertEqual(moderated_object.status, MODERATION_STATUS_APPROVED)
+        self.assertEqual(moderated_object.changed_object.slug, 'slug0')
+        self.assertEqual(
+            ModeratedObject.objects.get_for_instance(pending).status,
+            MODERATION_STATUS_PENDING,
+        )
+
+        # Objects with a moderated object are skipped
+        self.assertIn('created 0 moderated objects', self.call_command())
+        self.assertEqual(ModeratedObject.objects.count(), 6)
+
+    def test_backfill_without_snapshot(self):
+        self.call_command('tests.ModelWithSlugField', snapshot=False)
+
+        self.assertEqual(ModelWithSlugField.objects.count(), 5)
+        moderated_object = ModeratedObject.objects.get_for_instance(self.objects[0])
+        field = ModeratedObject._meta.get_field('changed_object')
+        self.assertFalse(field.has_snapshot(moderated_object))
+        # Read from the object until the snapshot is taken
+        self.assertEqual(moderated_object.changed_object.slug, 'slug0')
+
+        # The snapshot is taken on the next save, which is moderated
+        obj = ModelWithSlugField.unmoderated_objects.get(pk=self.objects[0].pk)
+        obj.slug = 'changed'
+        obj.save()
+
+        moderated_object = ModeratedObject.objects.get_for_instance(obj)
+        self.assertEqual(moderated_object.status, MODERATION_STATUS_PENDING)
+        self.assertEqual(moderated_object.changed_object.slug, 'changed')
+        self.assertEqual(
+            ModelWithSlugField.unmoderated_objects.get(pk=obj.pk).slug, 'slug0'
+        )
+
+    def test_moderate_backfilled_object_without_snapshot(self):
+        self.call_command('tests.ModelWithSlugField', snapshot=False)
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'aaaa')
+        pk = ModeratedObject.objects.get_for_instance(self.objects[0]).pk
+
+        label = str(self.objects[0])
+        self.assertEqual(str(ModeratedObject.objects.get(pk=pk)), label)
+        self.client.force_login(user)
+        response = self.client.get('/admin/moderation/moderatedobject/')
+        self.assertContains(response, label)
+        response = self.client.get(
+            ModeratedObject.objects.get(pk=pk).get_admin_moderate_url()
+        )
+        self.assertEqual(response.status_code, 200)
+
+        ModeratedObject.objects.get(pk=pk).reject(by=user)
+        moderated_object = ModeratedObject.objects.get(pk=pk)
+        self.assertEqual(moderated_object.status, MODERATION_STATUS_REJECTED)
+        self.assertEqual(moderated_object.changed_object.slug, 'slug0')
+
+        moderated_object.approve(by=user)
+        moderated_object = ModeratedObject.objects.get(pk=pk)
+        self.assertEqual(moderated_object.status, MODERATION_STATUS_APPROVED)
+        field = ModeratedObject._meta.get_field('changed_object')
+        self.assertTrue(field.has_snapshot(moderated_object))
+        self.assertEqual(
+            ModelWithSlugField.unmoderated_objects.get(pk=self.objects[0].pk).slug,
+            'slug0',
+        )
+
+    def test_unregistered_model(self):
+        with self.assertRaises(CommandError):
+            self.call_command('tests.ModelWithSlugField2')
+
+
+class ArchiveHistoryCommandTestCase(TestCase):
+    def setUp(self):
+        self.obj = None
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def register(self, **options):
+        options.setdefault('history_keep_last', None)
+        Moderator = type(
+            'Moderator',
+            (GenericModerator,),
+            dict(options, keep_history=True, notify_moderator=False, notify_user=False),
+        )
+        setup_moderation([(ModelWithSlugField, Moderator)])
+
+    def edit(self, *slugs):
+        for slug in slugs:
+            if self.obj is None:
+                self.obj = ModelWithSlugField.objects.create(slug=slug)
+            else:
+                self.obj.slug = slug
+                self.obj.save()
+            ModeratedObject.objects.get_for_instance(self.obj).approve()
+            self.obj = ModelWithSlugField.unmoderated_objects.get(pk=self.obj.pk)
+
+    def call_command(self, *args):
+        management.call_command(
+            'moderation_archive_history', *args, batch_size=1, stdout=StringIO()
+        )
+
+    def get_slugs(self, model):
+        return [
+            moderated_object.changed_object.slug
+            for moderated_object in model.objects.order_by('updated')
+        ]
+
+    def test_keep_last(self):
+        self.register(history_keep_last=2)
+        self.edit('first', 'second', 'third', 'fourth')
+
+        self.call_command('tests.ModelWithSlugField')
+
+        self.assertEqual(self.get_slugs(ModeratedObject), ['third', 'fourth'])
+        self.assertEqual(self.get_slugs(ArchivedModeratedObject), ['first', 'second'])
+        self.assertEqual(
+            ModeratedObject.objects.get_for_instance(self.obj).changed_object.slug,
+            'fourth',
+        )
+
+    def test_max_age(self):
+        self.register(history_max_age=datetime.timedelta(days=30))
+        self.edit('first', 'second', 'third')
+        old = timezone.now() - datetime.timedelta(days=40)
+        pks = ModeratedObject.objects.order_by('pk').values_list('pk', flat=True)
+        for i, pk in enumerate(pks):
+            ModeratedObject.objects.filter(pk=pk).update(
+                updated=old + datetime.timedelta(seconds=i)
+            )
+        # Pending moderations are kept
+        ModeratedObject.objects.filter(pk=pks[1]).update(
+            status=MODERATION_STATUS_PENDING
+        )
+
+        self.call_command()
+
+        self.assertEqual(self.get_slugs(ModeratedObject), ['second', 'third'])
+        self.assertEqual(self.get_slugs(ArchivedModeratedObject), ['first'])
+
+    def test_deltas_are_materialized(self):
+        self.register(history_keep_last=1, delta_snapshots=True)
+        self.edit('first', 'second', 'third')
+        self.assertTrue(
+            ModeratedObject.objects.filter(changed_object_base__isnull=False).exists()
+        )
+
+        self.call_command()
+
+        self.assertEqual(self.get_slugs(ModeratedObject), ['third'])
+        self.assertEqual(self.get_slugs(ArchivedModeratedObject), ['first', 'second'])
+
+    def test_locks_without_skip_locked(self):
+        self.register(history_keep_last=1)
+        self.edit('first', 'second')
+        features = connection.features
+        calls = []
+
+        def record(queryset, **kwargs):
+            calls.append(kwargs)
+            # Locking isn't supported by SQLite
+            return queryset
+
+        with mock.patch.object(
+            features, 'has_select_for_update_skip_locked', False
+        ), mock.patch.object(QuerySet, 'select_for_update', record):
+            self.call_command()
+
+        # Rows are locked, without skip_locked
+        self.assertTrue(calls)
+        self.assertFalse(any(calls))
+        self.assertEqual(self.get_slugs(ModeratedObject), ['second'])
+        self.assertEqual(self.get_slugs(ArchivedModeratedObject), ['first'])
+
+    def test_model_without_retention(self):
+        self.register()
+        with self.assertRaises(CommandError):
+            self.call_command('tests.ModelWithSlugField')
+
+
+class ModerateCommandTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        class Moderator(GenericModerator):
+            notify_moderator = False
+            notify_user = False
+
+        setup_moderation(
+            [(ModelWithSlugField, Moderator), (ModelWithSlugField2, Moderator)]
+        )
+        self.objects = [
+            ModelWithSlugField.objects.create(slug='slug%d' % i) for i in range(5)
+        ]
+        self.staff = User.objects.get(username='admin')
+        self.user = User.objects.get(username='user1')
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        ModeratedObject.objects.update(changed_by=self.user)
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def call_command(self, *args, **options):
+        management.call_command('moderate', *args, stdout=StringIO(), **options)
+
+    def get_statuses(self):
+        return [
+            ModeratedObject.objects.get_for_instance(obj).status for obj in self.objects
+        ]
+
+    def test_approve(self):
+        ModelWithSlugField2.objects.create(slug='slug')
+
+        self.call_command(
+            'approve',
+            by='admin',
+            content_types=['tests.ModelWithSlugField'],
+            chunk_size=2,
+        )
+
+        self.assertEqual(self.get_statuses(), [MODERATION_STATUS_APPROVED] * 5)
+        self.assertEqual(ModelWithSlugField.objects.count(), 5)
+        self.assertEqual(ModelWithSlugField2.objects.count(), 0)
+
+    def test_reject_changes_of_staff(self):
+        ModeratedObject.objects.filter(object_pk=self.objects[1].pk).update(
+            changed_by=self.staff
+        )
+
+        self.call_command('reject', by='admin', changed_by_staff=True)
+
+        self.assertEqual(
+            self.get_statuses(),
+            [MODERATION_STATUS_PENDING, MODERATION_STATUS_REJECTED]
+            + [MODERATION_STATUS_PENDING] * 3,
+        )
+
+    def test_older_than(self):
+        old = timezone.now() - datetime.timedelta(days=31)
+        ModeratedObject.objects.filter(object_pk=self.objects[0].pk).update(created=old)
+
+        self.call_command('approve', by='admin', older_than=30)
+
+        self.assertEqual(
+            self.get_statuses(),
+            [MODERATION_STATUS_APPROVED] + [MODERATION_STATUS_PENDING] * 4,
+        )
+
+    def test_older_than_and_created_before(self):
+        now = timezone.now()
+        ModeratedObject.objects.filter(object_pk=self.objects[0].pk).update(
+            created=now - datetime.timedelta(days=31)
+        )
+        ModeratedObject.objects.filter(object_pk=self.objects[1].pk).update(
+            created=now - datetime.timedelta(days=11)
+        )
+
+        # The stricter cutoff applies, whichever option gives it
+        self.call_command(
+            'approve',
+            by='admin',
+            older_than=30,
+            created_before=(now - datetime.timedelta(days=10)).isoformat(),
+        )
+        self.assertEqual(
+            self.get_statuses(),
+            [MODERATION_STATUS_APPROVED] + [MODERATION_STATUS_PENDING] * 4,
+        )
+
+        self.call_command(
+            'approve',
+            by='admin',
+            older_than=10,
+            created_before=(now - datetime.timedelta(days=30)).isoformat(),
+        )
+        self.assertEqual(
+            self.get_statuses(),
+            [MODERATION_STATUS_APPROVED] + [MODERATION_STATUS_PENDING] * 4,
+        )
+
+    def test_approve_applies_latest_of_several_changes(self):
+        class HistoryModerator(GenericModerator):
+            notify_moderator = False
+            notify_user = False
+            keep_history = True
+
+        teardown_moderation()
+        setup_moderation([(ModelWithSlugField, HistoryModerator)])
+        obj = self.objects[0]
+        ModeratedObject.objects.get_for_instance(obj).approve(self.staff)
+        for slug in ['first', 'second', 'third']:
+            obj.slug = slug
+            obj.save()
+        # The latest change isn't the one with the highest pk
+        first = (
+            ModeratedObject.objects.filter(
+                object_pk=obj.pk, status=MODERATION_STATUS_PENDING
+            )
+            .order_by('pk')
+            .first()
+        )
+        self.assertEqual(first.changed_object.slug, 'first')
+        ModeratedObject.objects.filter(pk=first.pk).update(
+            updated=timezone.now() + datetime.timedelta(hours=1)
+        )
+
+        self.call_command(
+            'approve',
+            by='admin',
+            content_types=['tests.ModelWithSlugField'],
+            chunk_size=1,
+        )
+
+        self.assertEqual(ModelWithSlugField.objects.get(pk=obj.pk).slug, 'first')
+        self.assertFalse(
+            ModeratedObject.objects.filter(status=MODERATION_STATUS_PENDING).exists()
+        )
+
+    def test_resume_from_checkpoint(self):
+        original = moderate.moderate_chunk
+        calls = []
+
+        def interrupted(args):
+            # Stop the run after its first chunk
+            if calls:
+                raise KeyboardInterrupt
+            calls.append(args)
+            return original(args)
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+
+            with mock.patch.object(moderate, 'moderate_chunk', interrupted):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.call_command(
+                        'approve', by='admin', chunk_size=2, checkpoint=checkpoint
+                    )
+
+            self.assertEqual(
+                self.get_statuses(),
+                [MODERATION_STATUS_APPROVED] * 2 + [MODERATION_STATUS_PENDING] * 3,
+            )
+            with open(checkpoint) as f:
+                self.assertEqual(json.load(f)['last_pk'], calls[0][1][-1])
+
+            with self.assertRaises(CommandError):
+                self.call_command(
+                    'reject', by='admin', chunk_size=2, checkpoint=checkpoint
+                )
+
+            self.call_command(
+                'approve', by='admin', chunk_size=2, checkpoint=checkpoint
+            )
+
+            self.assertEqual(self.get_statuses(), [MODERATION_STATUS_APPROVED] * 5)
+            self.assertFalse(os.path.exists(checkpoint))
+
+    def test_resume_keeps_older_than_cutoff(self):
+        now = timezone.now()
+        ModeratedObject.objects.update(created=now - datetime.timedelta(days=10))
+        original = moderate.moderate_chunk
+        calls = []
+
+        def interrupted(args):
+            # Stop the run after its first chunk
+            if calls:
+                raise KeyboardInterrupt
+            calls.append(args)
+            return original(args)
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+            with mock.patch.object(moderate, 'moderate_chunk', interrupted):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.call_command(
+                        'approve',
+                        by='admin',
+                        chunk_size=2,
+                        older_than=5,
+                        checkpoint=checkpoint,
+                    )
+            ModeratedObject.objects.filter(status=MODERATION_STATUS_PENDING).update(
+                created=now - datetime.timedelta(days=4)
+            )
+
+            # Resumed two days later, the cutoff of the first run still applies
+            with mock.patch.object(
+                moderate.timezone,
+                'now',
+                return_value=now + datetime.timedelta(days=2),
+            ):
+                self.call_command(
+                    'approve',
+                    by='admin',
+                    chunk_size=2,
+                    older_than=5,
+                    checkpoint=checkpoint,
+                )
+
+        self.assertEqual(
+            self.get_statuses(),
+            [MODERATION_STATUS_APPROVED] * 2 + [MODERATION_STATUS_PENDING] * 3,
+        )
+
+    def test_workers_require_shared_database(self):
+        # The test database is in memory
+        with self.assertRaises(CommandError):
+            self.call_command('approve', by='admin', workers=2)
+
+    def test_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.check_output(
+                [
+                    sys.executable,
+                    moderate_workers.__file__,
+                    os.path.join(directory, 'db.sqlite3'),
+                    '--objects=20',
+                    '--workers=2',
+                ],
+                stderr=subprocess.STDOUT,
+                timeout=120,
+            )
+
+        self.assertIn(b'Approved 20 moderated objects', output)
+        self.assertIn(b'Pending: 0', output)
+
+
+class DispatchCommandTestCase(TestCase):
+    def setUp(self):
+        class Moderator(GenericModerator):
+            message_backend_class = OutboxMessageBackend
+
+        setup_moderation([(ModelWithSlugField, Moderator)])
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def call_command(self, **options):
+        stdout = StringIO()
+        management.call_command(
+            'moderation_dispatch', batch_size=2, stdout=stdout, **options
+        )
+        return stdout.getvalue()
+
+    def test_notifications_are_written_to_outbox(self):
+        ModelWithSlugField.objects.create(slug='slug')
+
+        self.assertEqual(mail.outbox, [])
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual(notification.recipient_list, ['test@example.com'])
+        self.assertIsNone(notification.sent)
+
+    def test_rolled_back_notifications_are_discarded(self):
+        try:
+            with transaction.atomic():
+                ModelWithSlugField.objects.create(slug='slug')
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_duplicates_are_skipped(self):
+        message = {'subject': 'Subject', 'message': 'Message', 'recipient_list': []}
+        NotificationOutbox.objects.enqueue([message, message])
+        NotificationOutbox.objects.enqueue(
+            [dict(message, dedup_key='key'), dict(message, dedup_key='key')]
+        )
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+        # Unless the duplicate was sent already
+        self.call_command()
+        NotificationOutbox.objects.enqueue([message])
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+    def test_dispatch(self):
+        for i in range(5):
+            ModelWithSlugField.objects.create(slug='slug%d' % i)
+
+        self.assertIn('Sent 5 notifications, 0 failed', self.call_command())
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertFalse(NotificationOutbox.objects.filter(sent=None).exists())
+        self.assertIn('Sent 0 notifications', self.call_command())
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_notifications_are_retried(self):
+        ModelWithSlugField.objects.create(slug='slug')
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=ConnectionError('refused'),
+        ):
+            output = self.call_command(retry_delay=0, max_attempts=2)
+            self.assertIn('Sent 0 notifications, 1 failed', output)
+            self.call_command(retry_delay=0, max_attempts=2)
+
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual(notification.attempts, 2)
+        self.assertEqual(notification.last_error, 'ConnectionError: refused')
+
+        # Given up after max_attempts
+        self.assertIsNotNone(notification.failed)
+        self.call_command(max_attempts=3)
+        self.assertEqual(mail.outbox, [])
+
+    def test_given_up_notifications_dont_skip_duplicates(self):
+        message = {
+            'subject': 'Subject',
+            'message': 'Message',
+            'recipient_list': ['test@example.com'],
+        }
+        NotificationOutbox.objects.enqueue([message])
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=ConnectionError('refused'),
+        ):
+            self.call_command(retry_delay=0, max_attempts=1)
+
+        NotificationOutbox.objects.enqueue([message])
+
+        self.assertIn('Sent 1 notifications', self.call_command())
+        self.assertEqual(len(mail.outbox), 1)
+        notification = NotificationOutbox.objects.get(sent__isnull=False)
+        self.assertIsNone(notification.failed)
+        self.assertEqual(notification.last_error, '')
+
+    def test_duplicates_are_skipped_without_partial_indexes(self):
+        features = connection.features
+        message = {'subject': 'Subject', 'message': 'Message', 'recipient_list': []}
+        with mock.patch.object(features, 'supports_partial_indexes', False):
+            NotificationOutbox.objects.enqueue([message, message])
+            NotificationOutbox.objects.enqueue([message])
+            self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+            self.call_command()
+            NotificationOutbox.objects.enqueue([message, message])
+            self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+    def test_locks_without_skip_locked(self):
+        ModelWithSlugField.objects.create(slug='slug')
+        features = connection.features
+        calls = []
+
+        def record(queryset, **kwargs):
+            calls.append(kwargs)
+            # Locking isn't supported by SQLite
+            return queryset
+
+        with mock.patch.object(
+            features, 'has_select_for_update_skip_locked', False
+        ), mock.patch.object(QuerySet, 'select_for_update', record):
+            self.assertIn('Sent 1 notifications', self.call_command())
+
+        # Rows are locked, without skip_locked
+        self.assertTrue(calls)
+        self.assertFalse(any(calls))
@@ -7,6 +7,7 @@ from django.db.models import fields
 from django.test.testcases import TestCase
 
 from moderation.diff import (
+    FieldPlan,
     ImageChange,
     TextChange,
     get_changes_between_models,
@@ -209,6 +210,66 @@ class DiffModeratedObjectTestCase(TestCase):
         )
 
 
+class FieldPlanTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.plan = FieldPlan(UserProfile, excludes=['url'])
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.changed = UserProfile.objects.get(user__username='moderator')
+
+    def test_fields(self):
+        self.assertEqual(
+            [field.name for field in self.plan.moderated_fields],
+            ['user', 'description'],
+        )
+        self.assertEqual(self.plan.excluded_attnames, ('url',))
+        self.assertEqual(self.plan.excludes, frozenset(['url']))
+
+    def test_has_changes(self):
+        self.changed.description = 'New description'
+
+        self.assertTrue(self.plan.has_changes(self.profile, self.changed))
+        self.assertFalse(
+            self.plan.has_changes(self.profile, self.changed, only_excluded=True)
+        )
+
+    def test_has_changes_of_excluded_fields(self):
+        self.changed.url = 'http://www.example.com'
+
+        self.assertFalse(self.plan.has_changes(self.profile, self.changed))
+        self.assertTrue(
+            self.plan.has_changes(self.profile, self.changed, only_excluded=True)
+        )
+
+    def test_has_changes_of_foreign_key(self):
+        self.changed.user = User.objects.get(username='admin')
+
+        self.assertTrue(self.plan.has_changes(self.profile, self.changed))
+
+    def test_has_changes_converts_unequal_raw_values(self):
+        self.changed.user_id = str(self.profile.user_id)
+
+        self.assertFalse(self.plan.has_changes(self.profile, self.changed))
+
+        self.changed.user_id = 'not a pk'
+
+        self.assertTrue(self.plan.has_changes(self.profile, self.changed))
+
+    def test_get_changes(self):
+        self.changed.description = 'New description'
+
+        changes = self.plan.get_changes(self.profile, self.changed)
+
+        self.assertEqual(
+            sorted(changes), ['userprofile__description', 'userprofile__user']
+        )
+        self.assertEqual(
+            changes['userprofile__description'].change,
+            ('Old description', 'New description'),
+        )
+
+
 class DiffTestCase(unittest.TestCase):
     def test_html_to_list(self):
         html = (
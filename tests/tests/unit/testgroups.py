@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test.testcases import TestCase
+
+from moderation import groups
+from moderation.groups import is_user_in_groups
+from moderation.models import ModeratedObject
+from moderation.rules import InGroup
+from tests.models import ModelWithSlugField
+
+
+class GroupMembershipTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        self.editors = Group.objects.create(name='editors')
+        self.banned = Group.objects.create(name='banned')
+        self.user = User.objects.get(username='user1')
+        self.user.groups.add(self.editors)
+
+    def tearDown(self):
+        cache.clear()
+
+    def check(self, names):
+        # A new instance, like the user of the next request
+        with self.captureOnCommitCallbacks(execute=True):
+            return is_user_in_groups(User.objects.get(pk=self.user.pk), names)
+
+    def test_membership_is_cached(self):
+        self.assertTrue(self.check(['banned', 'editors']))
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_user_in_groups(user, ['editors', 'banned']))
+            self.assertFalse(is_user_in_groups(user, ['banned']))
+
+    def test_group_ids_are_cached(self):
+        self.check(['editors', 'moderators'])
+
+        # Shared by processes, without the names of missing groups
+        self.assertEqual(cache.get(groups.GROUP_IDS_KEY), {'editors': self.editors.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.create(name='moderators')
+        self.assertIsNone(cache.get(groups.GROUP_IDS_KEY))
+
+    def test_user_instance_cache(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(is_user_in_groups(user, ['editors']))
+
+        with self.assertNumQueries(1):
+            # Group names are only cached once the transaction commits
+            self.assertTrue(is_user_in_groups(user, ['editors']))
+
+    def test_invalidated_when_groups_of_user_change(self):
+        self.assertFalse(self.check(['banned']))
+
+        self.user.groups.add(self.banned)
+        self.assertTrue(self.check(['banned']))
+
+        self.user.groups.clear()
+        self.assertFalse(self.check(['editors']))
+
+    def test_invalidated_when_users_of_group_change(self):
+        self.assertTrue(self.check(['editors']))
+
+        self.editors.user_set.clear()
+        self.assertFalse(self.check(['editors']))
+
+        self.banned.user_set.add(self.user)
+        self.assertTrue(self.check(['banned']))
+
+    def test_invalidated_when_group_changes(self):
+        self.assertFalse(self.check(['moderators']))
+
+        self.editors.name = 'moderators'
+        self.editors.save()
+        self.assertTrue(self.check(['moderators']))
+
+    def test_user_model_without_groups(self):
+        ModelWithSlugField.objects.create(slug='slug')
+        ModeratedObject(content_object=ModelWithSlugField.objects.get()).save()
+
+        # A user model without PermissionsMixin
+        with mock.patch(
+            'moderation.groups.get_user_model', return_value=ModelWithSlugField
+        ):
+            groups.connect_signals()
+            self.assertFalse(self.check(['editors']))
+            self.assertFalse(
+                ModeratedObject.objects.filter(
+                    InGroup('editors').as_q(None, None)
+                ).exists()
+            )
@@ -1,15 +1,34 @@
+import pickle
+from datetime import timedelta
 from unittest import skipUnless, skipIf
 
 from django import VERSION
 from django.contrib.auth.models import User
 from django.core.exceptions import MultipleObjectsReturned
+from django.db.models import Q, QuerySet
 from django.db.models.manager import Manager
 from django.test.testcases import TestCase
-
-from moderation.managers import ModerationObjectsManager
+from django.utils import timezone
+
+from moderation.constants import (
+    MODERATION_DRAFT_STATE,
+    MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_PENDING,
+)
+from moderation.managers import (
+    ModerationObjectsManager,
+    ModerationQuerySet,
+    get_moderation_queryset_class,
+)
 from moderation.models import ModeratedObject
 from moderation.moderator import GenericModerator
-from tests.models import ModelWithSlugField2, ModelWithVisibilityField, UserProfile
+from tests.models import (
+    ModelWithModerationManager,
+    ModelWithSlugField2,
+    ModelWithVisibilityField,
+    SlugModerationManager,
+    UserProfile,
+)
 from tests.utils import setup_moderation, teardown_moderation
 
 
@@ -166,3 +185,260 @@ class ModeratedObjectManagerTestCase(TestCase):
         self.assertEqual(
             'http://www.yahoo.com', moderated_object_pk1.changed_object.url
         )
+
+
+class ProfileQuerySet(QuerySet):
+    def with_url(self):
+        return self.exclude(url='')
+
+
+class PrefetchModerationTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.moderation = setup_moderation([UserProfile])
+        self.user = User.objects.get(username='moderator')
+        ModeratedObject(content_object=UserProfile.unmoderated_objects.get(pk=1)).save()
+        for username in ['user1', 'admin']:
+            UserProfile.unmoderated_objects.create(
+                description='Profile of %s' % username,
+                url='http://www.example.com',
+                user=User.objects.get(username=username),
+            )
+        for moderated_object in ModeratedObject.objects.all():
+            moderated_object.approve(by=self.user)
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def test_prefetch_moderation(self):
+        profiles = list(UserProfile.objects.prefetch_moderation())
+
+        with self.assertNumQueries(0):
+            statuses = [profile.moderated_status for profile in profiles]
+
+        self.assertEqual(statuses, ['Approved', 'Approved', 'Approved'])
+
+    def test_prefetch_moderation_is_single_query(self):
+        with self.assertNumQueries(2):
+            profiles = list(UserProfile.unmoderated_objects.prefetch_moderation())
+
+        self.assertEqual(len(profiles), 3)
+
+    def test_prefetch_moderation_loads_latest_moderation(self):
+        profile = UserProfile.unmoderated_objects.get(user__username='user1')
+        profile.description = 'New description'
+        profile.save()
+
+        profile = (
+            UserProfile.unmoderated_objects.filter(pk=profile.pk)
+            .prefetch_moderation()
+            .get()
+        )
+
+        self.assertEqual(
+            profile.moderated_object, ModeratedObject.objects.get_for_instance(profile)
+        )
+        self.assertEqual(profile.moderated_status, 'Pending')
+
+    def test_prefetch_moderation_caches_missing_moderation(self):
+        ModeratedObject.objects.filter(object_pk=1).delete()
+
+        profile = UserProfile.unmoderated_objects.prefetch_moderation().get(pk=1)
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(ModeratedObject.DoesNotExist):
+                profile.moderated_object
+
+    def test_queryset_is_picklable(self):
+        queryset = UserProfile.objects.prefetch_moderation()
+
+        unpickled = pickle.loads(pickle.dumps(queryset))
+
+        self.assertEqual(list(unpickled), list(queryset))
+        self.assertEqual(list(unpickled.prefetch_moderation()), list(queryset))
+
+    def test_queryset_class_is_built_on_registration(self):
+        self.assertIs(UserProfile.objects.all().__class__, ModerationQuerySet)
+        self.assertIs(
+            UserProfile.unmoderated_objects.all().__class__, ModerationQuerySet
+        )
+
+    def test_model_with_moderation_manager(self):
+        self.moderation.register(ModelWithModerationManager)
+        obj = ModelWithModerationManager.unmoderated_objects.create(slug='slug')
+
+        self.assertIs(
+            ModelWithModerationManager.objects.all().__class__, ModerationQuerySet
+        )
+        self.assertEqual(
+            list(ModelWithModerationManager.objects.prefetch_moderation()), []
+        )
+        obj = (
+            ModelWithModerationManager.unmoderated_objects.with_moderation_status().get(
+                pk=obj.pk
+            )
+        )
+        self.assertEqual(obj.moderation_status, MODERATION_STATUS_PENDING)
+
+        self.moderation.unregister(ModelWithModerationManager)
+        self.assertIs(
+            ModelWithModerationManager.objects.__class__, SlugModerationManager
+        )
+
+    def test_custom_queryset_class(self):
+        queryset_class = get_moderation_queryset_class(ProfileQuerySet)
+        queryset = queryset_class(UserProfile).with_url().prefetch_moderation()
+
+        unpickled = pickle.loads(pickle.dumps(queryset))
+
+        self.assertIs(get_moderation_queryset_class(ProfileQuerySet), queryset_class)
+        self.assertIs(unpickled.__class__, queryset_class)
+        self.assertEqual(list(unpickled), list(UserProfile.unmoderated_objects.all()))
+
+    def test_unmoderated_manager_is_restored_on_unregister(self):
+        self.moderation.unregister(UserProfile)
+
+        self.assertIs(UserProfile.objects.__class__, Manager)
+
+
+class WithModerationStatusTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.moderation = setup_moderation([UserProfile])
+        self.user = User.objects.get(username='moderator')
+        self.profile = UserProfile.unmoderated_objects.create(
+            description='Profile of user1',
+            url='http://www.example.com',
+            user=User.objects.get(username='user1'),
+        )
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def test_with_moderation_status(self):
+        moderated_object = ModeratedObject.objects.get_for_instance(self.profile)
+
+        profile = UserProfile.unmoderated_objects.with_moderation_status().get(
+            pk=self.profile.pk
+        )
+
+        self.assertEqual(profile.moderation_status, MODERATION_STATUS_PENDING)
+        self.assertEqual(profile.moderation_state, MODERATION_DRAFT_STATE)
+        self.assertEqual(profile.moderation_updated, moderated_object.updated)
+
+    def test_with_moderation_status_does_not_load_snapshots(self):
+        queryset = UserProfile.unmoderated_objects.with_moderation_status()
+
+        self.assertNotIn('changed_object', str(queryset.query))
+
+    def test_moderated_status_uses_annotation(self):
+        ModeratedObject.objects.get_for_instance(self.profile).approve(by=self.user)
+        profiles = list(UserProfile.objects.with_moderation_status())
+
+        with self.assertNumQueries(0):
+            statuses = [
+                profile.moderated_status
+                for profile in profiles
+                if profile.moderation_status is not None
+            ]
+
+        self.assertEqual(statuses, ['Approved'])
+
+    def test_object_without_moderation(self):
+        profile = UserProfile.unmoderated_objects.with_moderation_status().get(pk=1)
+
+        self.assertIsNone(profile.moderation_status)
+        with self.assertNumQueries(0):
+            with self.assertRaises(ModeratedObject.DoesNotExist):
+                profile.moderated_status
+
+
+class ClaimTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        class Moderator(GenericModerator):
+            notify_moderator = False
+            notify_user = False
+
+        setup_moderation([(ModelWithSlugField2, Moderator)])
+        for i in range(5):
+            ModelWithSlugField2.objects.create(slug='slug%d' % i)
+        self.pks = list(
+            ModeratedObject.objects.order_by('created', 'pk').values_list(
+                'pk', flat=True
+            )
+        )
+        self.user = User.objects.get(username='moderator')
+        self.other_user = User.objects.get(username='user1')
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def get_pks(self, moderated_objects):
+        return [moderated_object.pk for moderated_object in moderated_objects]
+
+    def test_claims_are_disjoint(self):
+        claimed = ModeratedObject.objects.claim(2, self.user)
+        other_claimed = ModeratedObject.objects.claim(2, self.other_user)
+
+        self.assertEqual(self.get_pks(claimed), self.pks[:2])
+        self.assertEqual(self.get_pks(other_claimed), self.pks[2:4])
+        self.assertEqual(claimed[0].claimed_by, self.user)
+        self.assertGreater(claimed[0].lease_until, timezone.now())
+        self.assertEqual(
+            self.get_pks(ModeratedObject.objects.claim(5, self.user)), self.pks[4:]
+        )
+        self.assertEqual(ModeratedObject.objects.claim(5, self.user), [])
+
+    def test_expired_lease_can_be_claimed(self):
+        ModeratedObject.objects.claim(5, self.user, lease_seconds=60)
+        ModeratedObject.objects.filter(pk=self.pks[0]).update(
+            lease_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        claimed = ModeratedObject.objects.claim(5, self.other_user)
+
+        self.assertEqual(self.get_pks(claimed), self.pks[:1])
+
+    def test_release(self):
+        ModeratedObject.objects.claim(2, self.user)
+
+        released = ModeratedObject.objects.filter(claimed_by=self.user).release()
+
+        self.assertEqual(released, 2)
+        claimed = ModeratedObject.objects.claim(2, self.other_user)
+        self.assertEqual(self.get_pks(claimed), self.pks[:2])
+
+    def test_release_of_moderator(self):
+        ModeratedObject.objects.claim(2, self.user)
+        ModeratedObject.objects.claim(2, self.other_user)
+
+        released = ModeratedObject.objects.release(self.user)
+
+        self.assertEqual(released, 2)
+        self.assertEqual(
+            self.get_pks(ModeratedObject.objects.filter(claimed_by=self.other_user)),
+            self.pks[2:4],
+        )
+        with self.assertRaises(TypeError):
+            ModeratedObject.objects.release()
+
+    def test_moderation_ends_claim(self):
+        moderated_object = ModeratedObject.objects.claim(1, self.user)[0]
+        moderated_object.approve(by=self.user)
+        ModeratedObject.objects.claim(1, self.user)
+        ModeratedObject.objects.filter(claimed_by=self.user).approve(by=self.user)
+
+        self.assertFalse(
+            ModeratedObject.objects.filter(
+                Q(claimed_by__isnull=False) | Q(lease_until__isnull=False),
+                status=MODERATION_STATUS_APPROVED,
+            ).exists()
+        )
+        self.assertEqual(
+            self.get_pks(ModeratedObject.objects.claim(5, self.other_user)),
+            self.pks[2:],
+        )
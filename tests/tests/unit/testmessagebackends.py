@@ -0,0 +1,93 @@
+import threading
+
+from django.core import mail
+from django.test.testcases import SimpleTestCase
+
+from moderation.message_backends import (
+    AsyncEmailMessageBackend,
+    AsyncEmailMultipleMessageBackend,
+    AsyncMessageBackend,
+)
+
+
+class BlockingMessageBackend(AsyncMessageBackend):
+    max_workers = 1
+    max_pending = 2
+
+    release = threading.Event()
+    delivered = []
+
+    def deliver(self, **kwargs):
+        self.release.wait(5)
+        self.delivered.append(kwargs['message'])
+
+
+class FailingMessageBackend(AsyncMessageBackend):
+    def deliver(self, **kwargs):
+        raise ValueError(kwargs['message'])
+
+
+class AsyncMessageBackendTestCase(SimpleTestCase):
+    def tearDown(self):
+        AsyncMessageBackend.shutdown_all()
+
+    def test_messages_are_delivered_by_shutdown(self):
+        backend = AsyncEmailMessageBackend()
+        for i in range(50):
+            backend.send(
+                subject='Subject %d' % i,
+                message='Message',
+                recipient_list=['moderator@example.com'],
+            )
+
+        AsyncEmailMessageBackend.shutdown()
+
+        self.assertEqual(len(mail.outbox), 50)
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            sorted('Subject %d' % i for i in range(50)),
+        )
+        self.assertEqual(mail.outbox[0].to, ['moderator@example.com'])
+
+    def test_multiple_messages(self):
+        AsyncEmailMultipleMessageBackend().send(
+            [
+                {'subject': 'First', 'message': 'Message', 'recipient_list': ['a@b.c']},
+                {
+                    'subject': 'Second',
+                    'message': 'Message',
+                    'recipient_list': ['b@c.d'],
+                },
+            ]
+        )
+
+        AsyncEmailMultipleMessageBackend.shutdown()
+
+        self.assertEqual(
+            [message.subject for message in mail.outbox], ['First', 'Second']
+        )
+
+    def test_send_blocks_when_queue_is_full(self):
+        backend = BlockingMessageBackend()
+        BlockingMessageBackend.release.clear()
+        backend.send(message='first')
+        backend.send(message='second')
+
+        sender = threading.Thread(target=backend.send, kwargs={'message': 'third'})
+        sender.start()
+        sender.join(0.1)
+        self.assertTrue(sender.is_alive())
+
+        BlockingMessageBackend.release.set()
+        sender.join(5)
+        self.assertFalse(sender.is_alive())
+        BlockingMessageBackend.shutdown()
+
+        self.assertEqual(BlockingMessageBackend.delivered, ['first', 'second', 'third'])
+
+    def test_failures_are_logged(self):
+        with self.assertLogs('moderation.message_backends', 'ERROR') as logs:
+            FailingMessageBackend().send(message='Message')
+            FailingMessageBackend.shutdown()
+
+        self.assertIn('ValueError: Message', logs.output[0])
@@ -1,4 +1,9 @@
+import json
+from unittest import mock
+
 from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 from django.test.testcases import TestCase
 from django.test.utils import override_settings
@@ -16,6 +21,8 @@ from moderation.managers import ModerationObjectsManager
 from moderation.models import ModeratedObject
 from moderation.moderator import GenericModerator
 from moderation.register import ModerationManager, RegistrationError
+from moderation.rules import Approve, FieldMatches, InGroup, Reject, UserFlag
+from moderation.signals import pre_many_moderation
 from tests.models import (
     ModelWithSlugField2,
     ProxyProfile,
@@ -62,14 +69,68 @@ class SerializationTestCase(TestCase):
 
         self.assertIn('"pk": 2', serialized_str)
         self.assertIn('"model": "tests.superuserprofile"', serialized_str)
-        self.assertIn('"fields": {"super_power": "invisibility"}', serialized_str)
-        self.assertIn('"pk": 2', serialized_str)
-        self.assertIn('"model": "tests.userprofile"', serialized_str)
+        self.assertIn('"super_power": "invisibility"', serialized_str)
+        self.assertIn('"id": 2', serialized_str)
         self.assertIn('"url": "http://www.test.com"', serialized_str)
         self.assertIn('"user": 2', serialized_str)
         self.assertIn('"description": "Profile for new super user"', serialized_str)
         self.assertIn('"fields": {', serialized_str)
 
+    def test_deserialize_snapshot(self):
+        value = (
+            '{"model": "tests.userprofile", "pk": 1, "fields": '
+            '{"url": "http://www.google.com", "user": 1, '
+            '"description": "Profile description"}}'
+        )
+        json_field = SerializedObjectField()
+
+        with self.assertNumQueries(0):
+            object = json_field._deserialize(value)
+
+        self.assertTrue(isinstance(object, UserProfile))
+        self.assertEqual(object.pk, 1)
+        self.assertEqual(object.user_id, 1)
+        self.assertEqual(object.description, 'Profile description')
+
+    def test_deserialize_snapshot_with_inheritance(self):
+        profile = SuperUserProfile(
+            description='Profile for new super user',
+            url='http://www.test.com',
+            user=User.objects.get(username='user1'),
+            super_power='invisibility',
+        )
+        profile.save()
+        json_field = SerializedObjectField()
+
+        with self.assertNumQueries(0):
+            object = json_field._deserialize(json_field._serialize(profile))
+
+        self.assertTrue(isinstance(object, SuperUserProfile))
+        self.assertEqual(
+            repr(object),
+            '<SuperUserProfile: user1 - http://www.test.com - invisibility>',
+        )
+
+    def test_deserialize_snapshot_converts_values(self):
+        user = User.objects.get(username='user1')
+        json_field = SerializedObjectField()
+
+        object = json_field._deserialize(json_field._serialize(user))
+
+        self.assertEqual(object.date_joined, user.date_joined)
+        self.assertEqual(object.last_login, user.last_login)
+        self.assertEqual(object.is_staff, user.is_staff)
+
+    def test_deserialize_snapshot_missing_field_uses_default(self):
+        value = (
+            '{"model": "tests.userprofile", "pk": 1, "fields": '
+            '{"user": 1, "description": "Profile description"}}'
+        )
+        json_field = SerializedObjectField()
+        object = json_field._deserialize(value)
+
+        self.assertEqual(object.url, '')
+
     def test_deserialize(self):
         value = (
             '[{"pk": 1, "model": "tests.userprofile", "fields": '
@@ -165,6 +226,383 @@ class SerializationTestCase(TestCase):
         self.assertEqual(profile.description, "I\'m a proxy.")
         self.assertEqual(profile.user_id, 2)
 
+    def test_changed_object_is_deserialized_on_first_access(self):
+        ModeratedObject(content_object=self.profile).save()
+        field = ModeratedObject._meta.get_field('changed_object')
+
+        with mock.patch.object(
+            field, '_deserialize', wraps=field._deserialize
+        ) as deserialize:
+            moderated_object = ModeratedObject.objects.get()
+            self.assertEqual(deserialize.call_count, 0)
+
+            self.assertEqual(
+                moderated_object.changed_object.description, 'Old description'
+            )
+            moderated_object.changed_object
+            self.assertEqual(deserialize.call_count, 1)
+
+    def test_save_without_access_keeps_raw_value(self):
+        ModeratedObject(content_object=self.profile).save()
+        raw = ModeratedObject.objects.values_list('changed_object', flat=True).get()
+        field = ModeratedObject._meta.get_field('changed_object')
+
+        moderated_object = ModeratedObject.objects.get()
+        with mock.patch.object(field, '_serialize') as serialize:
+            moderated_object.save()
+            self.assertFalse(serialize.called)
+
+        self.assertEqual(
+            ModeratedObject.objects.values_list('changed_object', flat=True).get(),
+            raw,
+        )
+
+    def test_deferred_changed_object_is_loaded_on_access(self):
+        ModeratedObject(content_object=self.profile).save()
+
+        moderated_object = ModeratedObject.objects.defer('changed_object').get()
+
+        self.assertEqual(moderated_object.changed_object.description, 'Old description')
+
+    def test_eager_field_only_deserializes_its_own_model(self):
+        class EagerSnapshot(models.Model):
+            snapshot = SerializedObjectField()
+
+            class Meta:
+                app_label = 'tests'
+
+        field = EagerSnapshot._meta.get_field('snapshot')
+        with mock.patch.object(field, '_deserialize') as deserialize:
+            UserProfile(description='Unrelated', url='http://www.example.com')
+            self.assertFalse(deserialize.called)
+
+            EagerSnapshot(snapshot='[]')
+            self.assertTrue(deserialize.called)
+
+
+class JSONSnapshotStorageTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        patcher = mock.patch.object(self.field, 'storage', 'json')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_pending(self, description):
+        self.profile.description = description
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+        return moderated_object
+
+    def test_snapshot_is_stored_in_json_column(self):
+        self.create_pending('New description')
+
+        value, snapshot = ModeratedObject.objects.values_list(
+            'changed_object', 'changed_object_json'
+        ).get()
+
+        self.assertEqual(value, '')
+        self.assertEqual(snapshot['model'], 'tests.userprofile')
+        self.assertEqual(snapshot['fields']['description'], 'New description')
+
+    def test_changed_object_is_read_from_json_column(self):
+        self.create_pending('New description')
+
+        moderated_object = ModeratedObject.objects.get()
+
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+
+    def test_text_snapshots_stay_readable(self):
+        self.field.storage = 'text'
+        self.create_pending('Stored as text')
+        self.field.storage = 'json'
+
+        moderated_object = ModeratedObject.objects.get()
+
+        self.assertEqual(moderated_object.changed_object.description, 'Stored as text')
+
+    def test_pending_field_equals(self):
+        pending = self.create_pending('New description')
+        approved = self.create_pending('Other description')
+        ModeratedObject.objects.filter(pk=approved.pk).update(
+            status=MODERATION_STATUS_APPROVED
+        )
+
+        self.assertEqual(
+            list(
+                ModeratedObject.objects.pending_field_equals(
+                    'description', 'New description'
+                )
+            ),
+            [pending],
+        )
+        self.assertEqual(
+            list(
+                ModeratedObject.objects.pending_field_equals('user', self.profile.user)
+            ),
+            [pending],
+        )
+        self.assertFalse(
+            ModeratedObject.objects.pending_field_equals(
+                'description', 'Other description'
+            )
+        )
+
+    def test_filter_pending_fields(self):
+        pending = self.create_pending('New description')
+
+        self.assertEqual(
+            list(
+                ModeratedObject.objects.filter_pending_fields(
+                    description__startswith='New'
+                )
+            ),
+            [pending],
+        )
+        self.assertEqual(
+            list(
+                ModeratedObject.objects.filter_pending_fields(
+                    user__in=[self.profile.user_id, 99]
+                )
+            ),
+            [pending],
+        )
+
+    def test_filter_pending_fields_requires_json_storage(self):
+        self.field.storage = 'text'
+
+        with self.assertRaises(ImproperlyConfigured):
+            ModeratedObject.objects.pending_field_equals('description', 'New')
+
+
+class CompressedSnapshotStorageTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        patcher = mock.patch.object(self.field, 'compress', 'zlib')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_pending(self, description):
+        self.profile.description = description
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+        return moderated_object
+
+    def test_snapshot_is_stored_compressed(self):
+        self.create_pending('New description')
+
+        value, data = ModeratedObject.objects.values_list(
+            'changed_object', 'changed_object_data'
+        ).get()
+
+        self.assertEqual(value, '')
+        self.assertTrue(bytes(data).startswith(b'zlib:'))
+
+    def test_changed_object_is_decompressed_on_access(self):
+        self.create_pending('New description')
+
+        moderated_object = ModeratedObject.objects.get()
+
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+
+    def test_snapshots_stay_readable_after_changing_compressor(self):
+        self.create_pending('Stored with zlib')
+        self.field.compress = 'bz2'
+
+        moderated_object = ModeratedObject.objects.get()
+
+        self.assertEqual(
+            moderated_object.changed_object.description, 'Stored with zlib'
+        )
+
+    def test_text_snapshots_stay_readable(self):
+        self.field.compress = None
+        self.create_pending('Stored as text')
+        self.field.compress = 'zlib'
+
+        moderated_object = ModeratedObject.objects.get()
+
+        self.assertEqual(moderated_object.changed_object.description, 'Stored as text')
+
+    def test_unknown_compressor_is_not_imported(self):
+        moderated_object = self.create_pending('New description')
+        ModeratedObject.objects.filter(pk=moderated_object.pk).update(
+            changed_object_data=b'os:data'
+        )
+
+        with mock.patch('moderation.fields.import_module') as import_module:
+            with self.assertRaises(ValueError):
+                ModeratedObject.objects.get().changed_object
+
+        import_module.assert_not_called()
+
+    def test_compression_requires_binary_field(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SerializedObjectField(compress='zlib')
+
+    def test_compress_true_means_zlib(self):
+        field = SerializedObjectField(compress=True, binary_field='data')
+
+        self.assertEqual(field.compress, 'zlib')
+
+
+class DeltaSnapshotsTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        class DeltaModerator(GenericModerator):
+            keep_history = True
+            delta_snapshots = True
+            notify_moderator = False
+            notify_user = False
+
+        self.moderation = setup_moderation([(UserProfile, DeltaModerator)])
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.first = ModeratedObject(content_object=self.profile)
+        self.first.save()
+        self.first.approve()
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def edit(self, description):
+        self.profile.description = description
+        self.profile.save()
+        return ModeratedObject.objects.get_for_instance(self.profile)
+
+    def get_snapshot(self, moderated_object):
+        return json.loads(
+            ModeratedObject.objects.values_list('changed_object', flat=True).get(
+                pk=moderated_object.pk
+            )
+        )
+
+    def test_snapshot_stores_only_changed_fields(self):
+        moderated_object = self.edit('New description')
+
+        snapshot = self.get_snapshot(moderated_object)
+
+        self.assertEqual(snapshot['fields'], {'description': 'New description'})
+        self.assertEqual(snapshot['base'], self.first.pk)
+        self.assertEqual(moderated_object.changed_object_base, self.first)
+
+    def test_changed_object_is_rebuilt_from_base(self):
+        self.edit('New description')
+
+        moderated_object = ModeratedObject.objects.get_for_instance(self.profile)
+        changed_object = moderated_object.changed_object
+
+        self.assertEqual(changed_object.description, 'New description')
+        self.assertEqual(changed_object.url, 'http://www.google.com')
+        self.assertEqual(changed_object.user_id, self.profile.user_id)
+
+    def test_chain_is_read_at_once(self):
+        for description in ['Second', 'Third', 'Fourth', 'Fifth']:
+            self.edit(description).approve()
+        latest = ModeratedObject.objects.get_for_instance(self.profile)
+        self.assertEqual(self.get_snapshot(latest)['depth'], 4)
+
+        moderated_object = ModeratedObject.objects.get(pk=latest.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(moderated_object.changed_object.description, 'Fifth')
+            self.assertEqual(
+                moderated_object.changed_object.url, 'http://www.google.com'
+            )
+
+        moderated_objects = list(ModeratedObject.objects.all())
+        with self.assertNumQueries(4):
+            # One query per delta, the first row being a full snapshot
+            descriptions = {
+                moderated_object.changed_object.description
+                for moderated_object in moderated_objects
+            }
+        self.assertEqual(len(descriptions), 5)
+
+    def test_approve_delta(self):
+        moderated_object = self.edit('New description')
+
+        moderated_object.approve()
+
+        self.assertEqual(
+            UserProfile.unmoderated_objects.get(pk=self.profile.pk).description,
+            'New description',
+        )
+
+    def test_chain_is_cut_at_max_delta_depth(self):
+        with mock.patch.object(self.field, 'max_delta_depth', 1):
+            second = self.edit('Second')
+            second.approve()
+            third = self.edit('Third')
+
+        self.assertEqual(self.get_snapshot(second)['depth'], 1)
+        self.assertNotIn('base', self.get_snapshot(third))
+        self.assertEqual(
+            ModeratedObject.objects.get(pk=third.pk).changed_object.description,
+            'Third',
+        )
+
+    def test_deleting_base_materializes_dependents(self):
+        moderated_object = self.edit('New description')
+
+        self.first.delete()
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+        self.assertIsNone(moderated_object.changed_object_base)
+        self.assertNotIn('base', self.get_snapshot(moderated_object))
+        self.assertEqual(moderated_object.changed_object.url, 'http://www.google.com')
+
+    def test_saving_base_materializes_dependents(self):
+        moderated_object = self.edit('New description')
+
+        first = ModeratedObject.objects.get(pk=self.first.pk)
+        first.changed_object.url = 'http://www.example.com'
+        first.save()
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+        self.assertNotIn('base', self.get_snapshot(moderated_object))
+        self.assertEqual(moderated_object.changed_object.url, 'http://www.google.com')
+
+    def test_status_updates_keep_dependent_deltas(self):
+        moderated_object = self.edit('New description')
+
+        first = ModeratedObject.objects.get(pk=self.first.pk)
+        first.reason = 'Reason'
+        with self.assertNumQueries(1):
+            first.save()
+        first.changed_object
+        first.save()
+
+        self.assertEqual(self.get_snapshot(moderated_object)['base'], first.pk)
+
+    def test_deleting_bases_reads_dependents_at_once(self):
+        self.edit('Second').approve()
+        self.edit('Third').approve()
+        bases = ModeratedObject.objects.exclude(
+            pk=ModeratedObject.objects.get_for_instance(self.profile).pk
+        )
+
+        with self.assertNumQueries(7):
+            # The bases and their dependents are read at once, then each
+            # dependent is materialized, the second reading the base of its
+            # base, before the bases are deleted with a single query
+            bases.delete()
+
+        moderated_object = ModeratedObject.objects.get()
+        self.assertIsNone(moderated_object.changed_object_base)
+        self.assertEqual(moderated_object.changed_object.description, 'Third')
+
+    def test_json_storage_stores_full_snapshots(self):
+        with mock.patch.object(self.field, 'storage', 'json'):
+            moderated_object = self.edit('New description')
+
+        self.assertIsNone(moderated_object.changed_object_base)
+
 
 class ModerateTestCase(TestCase):
     fixtures = ['test_users.json', 'test_moderation.json']
@@ -215,7 +653,22 @@ class ModerateTestCase(TestCase):
         self.assertEqual(self.profile.moderated_object.by, self.user)
         self.assertEqual(self.profile.moderated_object.reason, "Reason")
 
-    def test_multiple_moderations_throws_exception_by_default(self):
+    def test_multiple_moderations_are_allowed_by_default(self):
+        self.profile.description = 'New description'
+        self.profile.save()
+
+        moderated_object = ModeratedObject.objects.create(content_object=self.profile)
+        moderated_object.approve(by=self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(self.profile.__class__.objects.filter(id=self.profile.id)),
+                [self.profile],
+            )
+
+    def test_multiple_moderations_throws_exception_when_checked(self):
+        moderator = self.moderation.get_moderator(self.profile.__class__)
+        moderator.check_multiple_moderations = True
         self.profile.description = 'New description'
         self.profile.save()
 
@@ -401,6 +854,128 @@ class ModerateTestCase(TestCase):
         self.assertEqual(value, False)
 
 
+class BulkModerateTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        class UserProfileModerator(GenericModerator):
+            notify_moderator = False
+            fields_exclude = ['url']
+
+        self.moderation = setup_moderation(
+            [(UserProfile, UserProfileModerator), ModelWithSlugField2]
+        )
+        self.user = User.objects.get(username='moderator')
+        self.profiles = []
+        for username in ['user1', 'admin']:
+            profile = UserProfile.unmoderated_objects.create(
+                description='Old description',
+                url='http://www.example.com',
+                user=User.objects.get(username=username),
+            )
+            ModeratedObject.objects.get_for_instance(profile).approve(by=self.user)
+            profile.description = 'New description of %s' % username
+            profile.save()
+            self.profiles.append(profile)
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def test_approve_applies_changed_objects(self):
+        ModeratedObject.objects.all().approve(UserProfile, self.user, batch_size=1)
+
+        self.assertEqual(
+            sorted(
+                UserProfile.objects.exclude(pk=1).values_list('description', flat=True)
+            ),
+            ['New description of admin', 'New description of user1'],
+        )
+        self.assertEqual(
+            set(ModeratedObject.objects.values_list('status', 'state', 'by')),
+            {(MODERATION_STATUS_APPROVED, MODERATION_READY_STATE, self.user.pk)},
+        )
+
+    def test_approve_applies_latest_of_several_changes(self):
+        class HistoryModerator(GenericModerator):
+            notify_moderator = False
+            keep_history = True
+
+        teardown_moderation()
+        self.moderation = setup_moderation([(UserProfile, HistoryModerator)])
+        profile = self.profiles[0]
+        for description in ['First edit', 'Second edit', 'Third edit']:
+            profile.description = description
+            profile.save()
+
+        ModeratedObject.objects.filter(object_pk=profile.pk).approve(
+            UserProfile, self.user
+        )
+
+        self.assertEqual(
+            UserProfile.objects.get(pk=profile.pk).description, 'Third edit'
+        )
+
+    def test_approve_updates_only_moderated_fields(self):
+        UserProfile.unmoderated_objects.filter(pk=self.profiles[0].pk).update(
+            url='http://www.example.org'
+        )
+
+        ModeratedObject.objects.all().approve(UserProfile, self.user)
+
+        self.assertEqual(
+            UserProfile.objects.get(pk=self.profiles[0].pk).url,
+            'http://www.example.org',
+        )
+
+    def test_reject_keeps_objects_unchanged(self):
+        ModeratedObject.objects.all().reject(UserProfile, self.user)
+
+        self.assertEqual(
+            set(
+                UserProfile.unmoderated_objects.exclude(pk=1).values_list(
+                    'description', flat=True
+                )
+            ),
+            {'Old description'},
+        )
+        self.assertEqual(
+            set(ModeratedObject.objects.values_list('status', flat=True)),
+            {MODERATION_STATUS_REJECTED},
+        )
+
+    def test_approve_groups_by_model_class(self):
+        obj = ModelWithSlugField2.unmoderated_objects.create(slug='test')
+
+        ModeratedObject.objects.filter(status=MODERATION_STATUS_PENDING).approve(
+            by=self.user
+        )
+
+        self.assertEqual(list(ModelWithSlugField2.objects.all()), [obj])
+        self.assertEqual(UserProfile.objects.exclude(pk=1).count(), 2)
+
+    def test_approve_sends_many_moderation_signals(self):
+        received = []
+
+        def handler(sender, queryset, status, **kwargs):
+            received.append((sender, status, queryset.count()))
+
+        pre_many_moderation.connect(handler)
+        try:
+            ModeratedObject.objects.all().approve(UserProfile, self.user)
+        finally:
+            pre_many_moderation.disconnect(handler)
+
+        self.assertEqual(received, [(UserProfile, MODERATION_STATUS_APPROVED, 2)])
+
+    def test_approve_informs_users(self):
+        ModeratedObject.objects.update(changed_by=self.user)
+
+        ModeratedObject.objects.all().approve(UserProfile, self.user)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+
 class AutoModerateTestCase(TestCase):
     fixtures = ['test_users.json', 'test_moderation.json']
 
@@ -480,3 +1055,93 @@ class ModerateCustomUserTestCase(ModerateTestCase):
         ModeratedObject.by = self.copy_m
 
     # The actual tests are inherited from ModerateTestCase
+
+
+class ApplyRulesTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        class Moderator(GenericModerator):
+            notify_moderator = False
+            notify_user = False
+            auto_moderation_rules = [
+                Reject(FieldMatches('slug', '^spam'), reason='Spam'),
+                Approve(InGroup('editors') | UserFlag('is_superuser')),
+            ]
+
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        self.moderation = setup_moderation([(ModelWithSlugField2, Moderator)])
+        editor = User.objects.get(username='user2')
+        editor.groups.add(Group.objects.create(name='editors'))
+        self.changes = [
+            ('spam1', 'user1'),
+            ('ok1', 'user2'),
+            ('ok2', 'admin'),
+            ('ok3', 'user1'),
+            ('spam2', 'user2'),
+        ]
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def create_objects(self):
+        for slug, username in self.changes:
+            obj = ModelWithSlugField2.objects.create(slug=slug)
+            ModeratedObject.objects.filter(object_pk=obj.pk).update(
+                changed_by=User.objects.get(username=username)
+            )
+
+    def get_statuses(self):
+        return {
+            moderated_object.changed_object.slug: (
+                moderated_object.status,
+                moderated_object.reason,
+            )
+            for moderated_object in ModeratedObject.objects.all()
+        }
+
+    def assert_moderated(self):
+        self.assertEqual(
+            self.get_statuses(),
+            {
+                'spam1': (MODERATION_STATUS_REJECTED, 'Spam'),
+                'ok1': (MODERATION_STATUS_APPROVED, 'Auto-approved: Rule'),
+                'ok2': (MODERATION_STATUS_APPROVED, 'Auto-approved: Rule'),
+                'ok3': (MODERATION_STATUS_PENDING, None),
+                'spam2': (MODERATION_STATUS_REJECTED, 'Spam'),
+            },
+        )
+
+    def test_apply_rules(self):
+        self.create_objects()
+
+        counts = ModeratedObject.objects.all().apply_rules(batch_size=2)
+
+        self.assertEqual(counts, (2, 2))
+        self.assert_moderated()
+        self.assertEqual(
+            sorted(ModelWithSlugField2.objects.values_list('slug', flat=True)),
+            ['ok1', 'ok2'],
+        )
+
+    def test_apply_rules_in_database(self):
+        with mock.patch.object(self.field, 'storage', 'json'):
+            self.create_objects()
+            moderator = self.moderation.get_moderator(ModelWithSlugField2)
+            for rule in moderator.rule_plan.rules:
+                self.assertIsNotNone(rule.condition.as_q(moderator, self.field))
+
+            # The matches, and the snapshots stored in other columns
+            with self.assertNumQueries(2):
+                pks = ModeratedObject.objects.all()._match_rule(
+                    moderator,
+                    moderator.rule_plan.reject_rules[0],
+                    ModeratedObject.objects.filter(status=MODERATION_STATUS_PENDING),
+                    self.field,
+                    100,
+                )
+            self.assertEqual(len(pks), 2)
+
+            ModeratedObject.objects.all().apply_rules()
+
+        self.assert_moderated()
@@ -1,17 +1,26 @@
 import unittest
 from unittest.mock import Mock
 
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import AnonymousUser, Group, User
 from django.core import mail
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models.manager import Manager
 from django.test.testcases import TestCase
 
-from moderation.constants import MODERATION_STATUS_APPROVED
+from moderation.checks import check_visibility_columns
+from moderation.constants import (
+    MODERATION_STATUS_APPROVED,
+    MODERATION_STATUS_REJECTED,
+)
 from moderation.managers import ModerationObjectsManager
 from moderation.message_backends import BaseMessageBackend
 from moderation.models import ModeratedObject
 from moderation.moderator import GenericModerator
+from moderation.rules import Approve, FieldEquals, FieldMatches, Reject, UserFlag
 from tests.models import (
+    ModelWithAutoVisibilityColumn,
+    ModelWithModeratedFields,
+    ModelWithSlugField,
     ModelWithVisibilityField,
     ModelWithWrongVisibilityField,
     UserProfile,
@@ -120,6 +129,13 @@ class GenericModeratorTestCase(TestCase):
     def test_moderator_should_have_field_exclude(self):
         self.assertTrue(hasattr(self.moderator, 'fields_exclude'))
 
+    def test_fields_exclude_of_moderated_fields_is_not_shared(self):
+        moderator = GenericModerator(ModelWithModeratedFields)
+
+        self.assertIn('unmoderated', moderator.fields_exclude)
+        self.assertEqual(GenericModerator.fields_exclude, [])
+        self.assertEqual(GenericModerator(UserProfile).fields_exclude, [])
+
 
 class AutoModerateModeratorTestCase(TestCase):
     fixtures = ['test_users.json']
@@ -347,3 +363,140 @@ class VisibilityColumnTestCase(TestCase):
         self.assertEqual(
             ModelWithVisibilityField.unmoderated_objects.get().is_public, True
         )
+
+
+class AutoVisibilityColumnTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        class AutoVisibilityModerator(GenericModerator):
+            auto_visibility_column = True
+            notify_moderator = False
+            notify_user = False
+
+        self.moderation = setup_moderation(
+            [(ModelWithAutoVisibilityColumn, AutoVisibilityModerator)]
+        )
+        self.user = User.objects.get(username='moderator')
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def test_column_is_used(self):
+        moderator = self.moderation.get_moderator(ModelWithAutoVisibilityColumn)
+        field = ModelWithAutoVisibilityColumn._meta.get_field('moderation_visible')
+
+        self.assertEqual(moderator.visibility_column, 'moderation_visible')
+        self.assertTrue(field.db_index)
+        self.assertFalse(field.editable)
+        self.assertIn('moderation_visible', moderator.field_plan.excludes)
+
+    def test_new_object_is_hidden_until_approved(self):
+        obj = ModelWithAutoVisibilityColumn.objects.create(test='New')
+
+        self.assertEqual(list(ModelWithAutoVisibilityColumn.objects.all()), [])
+
+        obj.moderated_object.approve(self.user)
+
+        self.assertEqual(list(ModelWithAutoVisibilityColumn.objects.all()), [obj])
+
+    def test_listing_does_not_query_moderated_objects(self):
+        ModelWithAutoVisibilityColumn.objects.create(test='New')
+
+        queryset = ModelWithAutoVisibilityColumn.objects.all()
+
+        self.assertNotIn('moderatedobject', str(queryset.query))
+
+    def test_queryset_moderation_keeps_column_in_sync(self):
+        obj = ModelWithAutoVisibilityColumn.objects.create(test='New')
+        moderated_objects = ModeratedObject.objects.filter(object_pk=obj.pk)
+
+        moderated_objects.approve(ModelWithAutoVisibilityColumn, self.user)
+        self.assertTrue(
+            ModelWithAutoVisibilityColumn.unmoderated_objects.get().moderation_visible
+        )
+
+        moderated_objects.reject(ModelWithAutoVisibilityColumn, self.user)
+        self.assertFalse(
+            ModelWithAutoVisibilityColumn.unmoderated_objects.get().moderation_visible
+        )
+        self.assertEqual(
+            ModeratedObject.objects.get(object_pk=obj.pk).status,
+            MODERATION_STATUS_REJECTED,
+        )
+
+    def test_missing_column_is_reported(self):
+        class Moderator(GenericModerator):
+            auto_visibility_column = True
+
+        self.moderation.register(ModelWithSlugField, Moderator)
+
+        errors = check_visibility_columns()
+
+        self.assertEqual([error.id for error in errors], ['moderation.E001'])
+        self.assertIs(errors[0].obj, ModelWithSlugField)
+        self.assertIsNone(
+            self.moderation.get_moderator(ModelWithSlugField).visibility_column
+        )
+
+    def test_can_not_be_used_with_visibility_column(self):
+        class Moderator(GenericModerator):
+            auto_visibility_column = True
+            visibility_column = 'is_public'
+
+        self.assertRaises(AttributeError, Moderator, ModelWithVisibilityField)
+
+
+class HistoryRetentionOptionsTestCase(unittest.TestCase):
+    def test_requires_keep_history(self):
+        class Moderator(GenericModerator):
+            history_keep_last = 5
+
+        self.assertRaises(AttributeError, Moderator, UserProfile)
+
+    def test_keep_last_must_be_positive(self):
+        class Moderator(GenericModerator):
+            keep_history = True
+            history_keep_last = 0
+
+        self.assertRaises(AttributeError, Moderator, UserProfile)
+
+
+class AutoModerationRulesTestCase(TestCase):
+    fixtures = ['test_users.json']
+
+    def setUp(self):
+        class Moderator(GenericModerator):
+            auto_approve_for_superusers = False
+            auto_approve_for_staff = False
+            auto_moderation_rules = [
+                Approve(UserFlag('is_superuser') & ~FieldEquals('description', '')),
+                Reject(FieldMatches('description', 'casino', ignore_case=True)),
+            ]
+
+        self.moderator = Moderator(UserProfile)
+        self.admin = User.objects.get(username='admin')
+        self.user = User.objects.get(username='user1')
+
+    def test_reject_rules_come_first(self):
+        obj = UserProfile(description='Cheap CASINO chips')
+
+        self.assertEqual(
+            self.moderator.is_auto_reject(obj, self.admin), 'Auto-rejected: Rule'
+        )
+
+    def test_approve_rule(self):
+        obj = UserProfile(description='Profile')
+
+        self.assertEqual(
+            self.moderator.is_auto_approve(obj, self.admin), 'Auto-approved: Rule'
+        )
+        self.assertFalse(self.moderator.is_auto_approve(obj, self.user))
+        self.assertFalse(self.moderator.is_auto_approve(obj, AnonymousUser()))
+        self.assertFalse(self.moderator.is_auto_reject(obj, self.user))
+
+    def test_unknown_field(self):
+        class Moderator(GenericModerator):
+            auto_moderation_rules = [Reject(FieldEquals('title', 'Spam'))]
+
+        self.assertRaises(FieldDoesNotExist, Moderator, UserProfile)
@@ -3,9 +3,10 @@ from importlib import reload
 from django.contrib.auth.models import User
 from django.core import management
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
 from django.db.models.manager import Manager
 from django.test.testcases import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from moderation.constants import (
     MODERATION_STATUS_APPROVED,
@@ -707,3 +708,231 @@ class ModerationSignalsTestCase(TestCase):
         )
 
         signals.pre_save.disconnect(self.moderation.pre_save_handler, UserProfile)
+
+
+class ModeratedObjectLookupTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        self.moderation = setup_moderation([UserProfile])
+        self.user = User.objects.get(username='moderator')
+        self.profile = UserProfile.unmoderated_objects.get(pk=1)
+        ModeratedObject(content_object=self.profile).save()
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def get_moderated_object_selects(self, queries):
+        table = ModeratedObject._meta.db_table
+        return [
+            query['sql']
+            for query in queries
+            if query['sql'].startswith('SELECT')
+            and table in query['sql'].split('WHERE')[0]
+        ]
+
+    def test_get_for_instance_is_single_query(self):
+        with self.assertNumQueries(1):
+            ModeratedObject.objects.get_for_instance(self.profile)
+
+    def test_save_looks_up_moderated_object_once(self):
+        self.profile.description = 'New description'
+
+        with CaptureQueriesContext(connection) as context:
+            self.profile.save()
+
+        self.assertEqual(
+            len(self.get_moderated_object_selects(context.captured_queries)), 1
+        )
+        moderated_object = ModeratedObject.objects.get_for_instance(self.profile)
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+
+    def test_save_of_approved_object_looks_up_moderated_object_once(self):
+        ModeratedObject.objects.get_for_instance(self.profile).approve(by=self.user)
+        self.profile.description = 'New description'
+
+        with CaptureQueriesContext(connection) as context:
+            self.profile.save()
+
+        self.assertEqual(
+            len(self.get_moderated_object_selects(context.captured_queries)), 1
+        )
+        moderated_object = ModeratedObject.objects.get_for_instance(self.profile)
+        self.assertEqual(moderated_object.status, MODERATION_STATUS_PENDING)
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+
+    def test_moderated_object_is_single_query(self):
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+
+        with self.assertNumQueries(1):
+            moderated_object = profile.moderated_object
+            profile.moderated_object
+
+        self.assertEqual(
+            moderated_object, ModeratedObject.objects.get_for_instance(profile)
+        )
+
+    def test_missing_moderated_object_is_cached(self):
+        ModeratedObject.objects.all().delete()
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+
+        with self.assertNumQueries(1):
+            with self.assertRaises(ModeratedObject.DoesNotExist):
+                profile.moderated_object
+            with self.assertRaises(ModeratedObject.DoesNotExist):
+                profile.moderated_object
+
+    def test_moderated_object_uses_prefetched_moderations(self):
+        self.profile.description = 'New description'
+        self.profile.save()
+        profile = UserProfile.unmoderated_objects.prefetch_related(
+            '_relation_object'
+        ).get(pk=1)
+
+        with self.assertNumQueries(0):
+            moderated_object = profile.moderated_object
+
+        self.assertEqual(
+            moderated_object, ModeratedObject.objects.get_for_instance(profile)
+        )
+
+    def test_moderated_object_is_cached_after_save(self):
+        self.profile.description = 'New description'
+        self.profile.save()
+
+        with self.assertNumQueries(0):
+            moderated_object = self.profile.moderated_object
+
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+
+
+class TrackChangesTestCase(TestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+
+    def setUp(self):
+        class TrackChangesModerator(GenericModerator):
+            track_changes = True
+            notify_moderator = False
+            notify_user = False
+
+        self.moderation = setup_moderation([(UserProfile, TrackChangesModerator)])
+        self.user = User.objects.get(username='moderator')
+
+    def tearDown(self):
+        teardown_moderation()
+
+    def get_profile_selects(self, queries):
+        table = UserProfile._meta.db_table
+        return [
+            query['sql']
+            for query in queries
+            if query['sql'].startswith('SELECT')
+            and table in query['sql'].split('WHERE')[0]
+        ]
+
+    def test_save_of_existing_object_does_not_refetch_it(self):
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+        profile.description = 'New description'
+
+        with CaptureQueriesContext(connection) as context:
+            profile.save()
+
+        self.assertEqual(self.get_profile_selects(context.captured_queries), [])
+        moderated_object = ModeratedObject.objects.get_for_instance(profile)
+        self.assertEqual(moderated_object.changed_object.description, 'New description')
+        self.assertEqual(
+            UserProfile.unmoderated_objects.get(pk=1).description, 'Old description'
+        )
+
+    def test_save_of_new_object_does_not_refetch_it(self):
+        profile = UserProfile(
+            description='Profile for new user',
+            url='http://www.yahoo.com',
+            user=User.objects.get(username='user1'),
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            profile.save()
+
+        self.assertEqual(self.get_profile_selects(context.captured_queries), [])
+        moderated_object = ModeratedObject.objects.get_for_instance(profile)
+        self.assertEqual(
+            moderated_object.changed_object.description, 'Profile for new user'
+        )
+
+    def test_recorded_state_follows_reverted_changes(self):
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+        profile.description = 'New description'
+        profile.save()
+        profile.url = 'http://www.example.com'
+        profile.save()
+
+        moderated_object = ModeratedObject.objects.get_for_instance(profile)
+        changed_object = moderated_object.changed_object
+        self.assertEqual(changed_object.description, 'New description')
+        self.assertEqual(changed_object.url, 'http://www.example.com')
+        db_profile = UserProfile.unmoderated_objects.get(pk=1)
+        self.assertEqual(db_profile.description, 'Old description')
+        self.assertEqual(db_profile.url, 'http://www.google.com')
+
+    def test_recorded_state_follows_refresh_from_db(self):
+        class HistoryModerator(GenericModerator):
+            track_changes = True
+            keep_history = True
+            notify_moderator = False
+            notify_user = False
+
+        teardown_moderation()
+        self.moderation = setup_moderation([(UserProfile, HistoryModerator)])
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+        profile.description = 'New description'
+        profile.save()
+        ModeratedObject.objects.get_for_instance(profile).approve(self.user)
+
+        profile.refresh_from_db()
+        profile.url = 'http://www.example.com'
+        profile.save()
+
+        # The approved description isn't reverted by the stale state
+        db_profile = UserProfile.unmoderated_objects.get(pk=1)
+        self.assertEqual(db_profile.description, 'New description')
+        self.assertEqual(db_profile.url, 'http://www.google.com')
+
+    def test_recorded_state_follows_partial_refresh_from_db(self):
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+        UserProfile.unmoderated_objects.filter(pk=1).update(
+            description='Changed elsewhere'
+        )
+        profile.url = 'http://www.example.com'
+
+        profile.refresh_from_db(fields=['description'])
+        profile.save()
+
+        db_profile = UserProfile.unmoderated_objects.get(pk=1)
+        self.assertEqual(db_profile.description, 'Changed elsewhere')
+        self.assertEqual(db_profile.url, 'http://www.google.com')
+        changed_object = ModeratedObject.objects.get_for_instance(
+            profile
+        ).changed_object
+        self.assertEqual(changed_object.url, 'http://www.example.com')
+
+    def test_refresh_from_db_is_restored_on_unregister(self):
+        teardown_moderation()
+
+        self.assertNotIn('refresh_from_db', UserProfile.__dict__)
+
+    def test_deferred_fields_fall_back_to_query(self):
+        profile = UserProfile.unmoderated_objects.only('pk', 'description').get(pk=1)
+        profile.description = 'New description'
+
+        with CaptureQueriesContext(connection) as context:
+            profile.save()
+
+        self.assertNotEqual(self.get_profile_selects(context.captured_queries), [])
+
+    def test_disabled_by_default(self):
+        teardown_moderation()
+        self.moderation = setup_moderation([UserProfile])
+        profile = UserProfile.unmoderated_objects.get(pk=1)
+
+        self.assertFalse(hasattr(profile, '_moderation_state'))
@@ -0,0 +1,65 @@
+"""
+Runs the moderate command with worker processes against a SQLite database
+file, which the workers can share unlike the in-memory test database.
+
+Creates the database, approves --objects pending moderated objects with
+--workers processes and prints the number of moderated objects still pending.
+
+usage:
+
+    python -m tests.utils.moderate_workers PATH [--objects 20] [--workers 2]
+
+"""
+
+import sys
+from optparse import OptionParser
+from os.path import abspath, dirname
+
+
+def main(path, objects, workers):
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = path
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core import management
+
+    from moderation.constants import MODERATION_STATUS_PENDING
+    from moderation.models import ModeratedObject
+    from moderation.moderator import GenericModerator
+    from tests.models import ModelWithSlugField
+    from tests.utils import setup_moderation
+
+    class Moderator(GenericModerator):
+        notify_moderator = False
+        notify_user = False
+
+    management.call_command('migrate', verbosity=0, interactive=False)
+    setup_moderation([(ModelWithSlugField, Moderator)])
+    User.objects.create_superuser('admin', 'admin@example.com', 'aaaa')
+    for i in range(objects):
+        ModelWithSlugField.objects.create(slug='slug%d' % i)
+
+    management.call_command(
+        'moderate', 'approve', by='admin', workers=workers, chunk_size=3
+    )
+    print(
+        'Pending: %d'
+        % ModeratedObject.objects.filter(status=MODERATION_STATUS_PENDING).count()
+    )
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--objects', type='int', default=20, dest='objects')
+    parser.add_option('--workers', type='int', default=2, dest='workers')
+    options, args = parser.parse_args()
+
+    sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+    import runtests  # noqa: configures settings
+
+    main(args[0], options.objects, options.workers)